@@ -0,0 +1,158 @@
+#!/bin/python3
+
+# Measures the time to crawl the full discographies of all followed artists, once with the worker
+# threads of the synchronous client and once with the asyncio client. Both talk HTTP to a local mock
+# of the Spotify API in its own process, which answers from a SyntheticLibrary after an injected
+# latency, so connection reuse and pooling are part of the measurement. Needs aiohttp.
+#
+# Usage: python benchmarks/crawl.py [--artists N] [--albums N] [--latency MS] [--jobs N ...]
+#            [--concurrency N ...]
+
+import argparse
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import random
+import socket
+import sys
+import time
+import urllib.request
+
+import aiohttp.web
+import spotipy
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from scriptify import aio, api, cache, model
+from scriptify.library import complete_artist_albums, get_followed_artists, map_artists
+
+import fake_spotify
+from fake_spotify import SyntheticLibrary
+
+
+class StaticToken:
+    # Auth manager of the async client, the mock accepts every token.
+    def get_access_token(self, as_dict=True):
+        return "benchmark"
+
+
+def serve(port, args, ready):
+    library = SyntheticLibrary(artists=args.artists, albums_per_artist=args.albums, saved_tracks=1000, playlists=0)
+    # Links to following pages point to the mock:
+    fake_spotify.PREFIX = f"http://127.0.0.1:{port}/v1/"
+    connections = set()
+    requestCount = 0
+
+    async def handle(request):
+        nonlocal requestCount
+        if request.path == "/stats":
+            stats = {"requests": requestCount, "connections": len(connections)}
+            connections.clear()
+            requestCount = 0
+            return aiohttp.web.json_response(stats)
+
+        connections.add(request.transport.get_extra_info("peername"))
+        requestCount += 1
+        await asyncio.sleep(args.latency / 1000 * random.uniform(0.5, 1.5))
+        path = request.path[len("/v1/"):].strip("/")
+        payload = await request.json() if request.can_read_body else None
+        try:
+            return aiohttp.web.json_response(fake_spotify.answer(library, request.method, path, dict(request.query), payload))
+        except spotipy.exceptions.SpotifyException as err:
+            return aiohttp.web.json_response({"error": {"status": err.http_status, "message": err.msg}},
+                    status=err.http_status)
+
+    app = aiohttp.web.Application()
+    app.router.add_route("*", "/{path:.*}", handle)
+    ready.set()
+    aiohttp.web.run_app(app, host="127.0.0.1", port=port, print=None, access_log=None)
+
+
+def get_free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def get_server_stats(prefix):
+    with urllib.request.urlopen(prefix.replace("/v1/", "/stats")) as response:
+        return json.loads(response.read())
+
+
+def reset():
+    cache.metadata_cache = cache.MetadataCache(None)
+    model.registry = model.Registry()
+
+
+def crawl_threads(prefix, limiter, jobs):
+    spotify = api.SpotifyClient(auth="benchmark", limiter=limiter, jobs=jobs)
+    spotify.prefix = prefix
+    artists = get_followed_artists(spotify)
+    get_server_stats(prefix)
+
+    start = time.perf_counter()
+    trackCount = 0
+    get_albums = lambda artist: artist.get_albums(spotify)
+    for (artist, albums) in complete_artist_albums(spotify, map_artists(get_albums, artists, jobs=jobs), jobs=jobs):
+        trackCount += sum(len(album.tracks) for album in albums)
+        artist.albums = None
+    return (time.perf_counter() - start, trackCount)
+
+
+def crawl_async(prefix, limiter, concurrency):
+    spotify = api.SpotifyClient(auth="benchmark", limiter=limiter)
+    spotify.prefix = prefix
+    artists = get_followed_artists(spotify)
+    asyncSpotify = aio.AsyncSpotifyClient(StaticToken(), limiter=limiter, concurrency=concurrency)
+    asyncSpotify.prefix = prefix
+    get_server_stats(prefix)
+
+    start = time.perf_counter()
+    trackCount = 0
+    for (artist, albums) in aio.crawl_artists(asyncSpotify, artists):
+        trackCount += sum(len(album.tracks) for album in albums)
+        artist.albums = None
+    return (time.perf_counter() - start, trackCount)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark crawling discographies with threads and asyncio.")
+    parser.add_argument("--artists", type=int, default=1000, help="number of followed artists")
+    parser.add_argument("--albums", type=int, default=20, help="average number of albums per artist")
+    parser.add_argument("--latency", type=float, default=100, help="latency of every request in milliseconds")
+    parser.add_argument("--jobs", type=int, nargs="+", default=[8, 32], help="numbers of worker threads")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[32, 100],
+            help="numbers of concurrent requests of the asyncio client")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING, format="%(levelname)s: %(message)s")
+
+    port = get_free_port()
+    prefix = f"http://127.0.0.1:{port}/v1/"
+    ready = multiprocessing.Event()
+    server = multiprocessing.Process(target=serve, args=(port, args, ready), daemon=True)
+    server.start()
+    ready.wait()
+    while True:
+        try:
+            get_server_stats(prefix)
+            break
+        except OSError:
+            time.sleep(0.1)
+
+    limiter = api.RateLimiter(100000, burst=100000)
+    runs = [("threads", jobs, crawl_threads) for jobs in args.jobs]
+    runs += [("asyncio", concurrency, crawl_async) for concurrency in args.concurrency]
+    try:
+        for (name, concurrency, crawl) in runs:
+            reset()
+            (duration, trackCount) = crawl(prefix, limiter, concurrency)
+            stats = get_server_stats(prefix)
+            print(f"{name} ({concurrency}): {duration:.2f}s, {trackCount} tracks, {stats['requests']} requests"
+                    + f" on {stats['connections']} connections")
+    finally:
+        server.terminate()
+
+
+if __name__ == "__main__":
+    main()
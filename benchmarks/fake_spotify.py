@@ -0,0 +1,292 @@
+# A local stand-in for the Spotify Web API. FakeSpotify answers the requests of spotipy from a
+# synthetic library instead of sending them, but still goes through the rate limiting and retries of
+# SpotifyClient. FakeAsyncSpotify does the same for AsyncSpotifyClient. Latency and "429 Too Many
+# Requests" responses can be injected.
+
+import asyncio
+import collections
+import datetime
+import random
+import re
+import threading
+import time
+import urllib.parse
+
+import spotipy
+
+from scriptify import aio, api, sets
+
+
+PREFIX = "https://api.spotify.com/v1/"
+ALBUM_GROUPS = ["album", "single", "appears_on", "compilation"]
+
+
+class SyntheticLibrary:
+    # Generates followed artists with their discographies, saved tracks and playlists of a user.
+    # The same seed always generates the same library.
+    def __init__(self, artists=1000, albums_per_artist=20, saved_tracks=50000, playlists=500,
+            playlist_size=100, category_playlists=25, seed=0):
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.user_id = "benchmarkuser"
+
+        self.artists = []
+        self.albums = {}
+        self.artist_albums = {}
+        self.tracks = []
+        for i in range(artists):
+            artist = {"id": self.new_id(), "name": f"Artist {i}", "popularity": self.random.randint(0, 100)}
+            self.artists.append(artist)
+        for artist in self.artists:
+            self.artist_albums[artist["id"]] = {group: [] for group in ALBUM_GROUPS}
+            for i in range(max(1, int(self.random.expovariate(1 / albums_per_artist)))):
+                self.add_album(artist, i)
+        for albums in self.artist_albums.values():
+            for group in ALBUM_GROUPS:
+                albums[group].sort(key=lambda album: album["release_date"], reverse=True)
+
+        # Saved tracks are newest first, every one of them is part of the catalogue:
+        while len(self.tracks) < saved_tracks:
+            self.add_album(self.random.choice(self.artists), len(self.albums))
+        now = datetime.datetime(2024, 1, 1)
+        self.saved_tracks = []
+        for (i, track) in enumerate(self.random.sample(self.tracks, saved_tracks)):
+            added_at = (now - datetime.timedelta(hours=i)).strftime("%Y-%m-%dT%H:%M:%SZ")
+            self.saved_tracks.append({"added_at": added_at, "track": track})
+
+        self.playlists = []
+        saved_track_ids = [item["track"]["id"] for item in self.saved_tracks]
+        for i in range(playlists):
+            if i < category_playlists:
+                name = f"{'ABCDE'[i % 5]} - Category {i}"
+            else:
+                name = f"Playlist {i}"
+            size = min(len(saved_track_ids), max(1, int(self.random.gauss(playlist_size, playlist_size / 4))))
+            self.add_playlist(name, self.random.sample(saved_track_ids, size))
+
+    def new_id(self):
+        return sets.encode_track_id(self.random.getrandbits(128))
+
+    def add_album(self, artist, number):
+        group = self.random.choices(ALBUM_GROUPS, weights=[4, 6, 2, 1])[0]
+        artists = [{"id": artist["id"], "name": artist["name"]}]
+        if group in ["appears_on", "compilation"]:
+            artists = [{"id": other["id"], "name": other["name"]} for other in self.random.sample(self.artists, 1)]
+        days = int(self.random.expovariate(1 / 1500))
+        release_date = (datetime.date(2024, 1, 1) - datetime.timedelta(days=days)).isoformat()
+        album = {
+            "id": self.new_id(),
+            "name": f"{artist['name']} {group} {number}",
+            "album_type": "compilation" if group == "compilation" else ("single" if group == "single" else "album"),
+            "album_group": group,
+            "release_date": release_date,
+            "release_date_precision": "day",
+            "artists": artists,
+            "tracks": [],
+        }
+        for j in range(self.random.randint(1, 3) if group == "single" else self.random.randint(6, 16)):
+            trackArtists = list(artists)
+            if group == "appears_on" or self.random.random() < 0.2:
+                featured = self.random.choice(self.artists)
+                trackArtists.append({"id": featured["id"], "name": featured["name"]})
+            track = {"id": self.new_id(), "name": f"Track {number}.{j}", "artists": trackArtists}
+            album["tracks"].append(track)
+            self.tracks.append(track)
+        self.albums[album["id"]] = album
+        self.artist_albums.setdefault(artist["id"], {g: [] for g in ALBUM_GROUPS})[group].append(album)
+        return album
+
+    def add_playlist(self, name, track_ids):
+        playlist = {"id": self.new_id(), "name": name, "snapshot_id": self.new_id(), "track_ids": list(track_ids)}
+        self.playlists.insert(0, playlist)
+        return playlist
+
+    def get_playlist(self, playlist_id):
+        for playlist in self.playlists:
+            if playlist["id"] == playlist_id:
+                return playlist
+        raise spotipy.exceptions.SpotifyException(404, -1, "Playlist not found.")
+
+
+class FakeBackend(spotipy.Spotify):
+    # Replaces the HTTP layer of spotipy. Every request is answered from the library.
+    def __init__(self, *args, library=None, latency=0, throttle_rate=0, retry_after=1, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.library = library
+        self.latency = latency
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self.stats = RequestStats()
+
+    def _auth_headers(self):
+        return {}
+
+    def _internal_call(self, method, url, payload, params):
+        (endpoint, path, query) = parse_request(self.library, method, url, params)
+        if self.latency > 0:
+            time.sleep(self.latency * random.uniform(0.5, 1.5))
+        if self.throttle_rate > 0 and random.random() < self.throttle_rate:
+            self.stats.record(endpoint, throttled=True)
+            raise spotipy.exceptions.SpotifyException(429, -1, "API rate limit exceeded",
+                    headers={"Retry-After": str(self.retry_after)})
+        self.stats.record(endpoint)
+
+        with self.library.lock:
+            return answer(self.library, method, path, query, payload)
+
+
+class FakeSpotify(api.SpotifyClient, FakeBackend):
+    pass
+
+
+class FakeAsyncSpotify(aio.AsyncSpotifyClient):
+    # Replaces the HTTP layer of AsyncSpotifyClient. Latency is awaited, so concurrent requests
+    # overlap like on a real connection pool. Doesn't need aiohttp.
+    def __init__(self, *args, library=None, latency=0, throttle_rate=0, retry_after=1, **kwargs):
+        super().__init__(None, *args, **kwargs)
+        self.library = library
+        self.latency = latency
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self.stats = RequestStats()
+
+    def create_session(self):
+        return None
+
+    async def send_request(self, method, url, params, payload, latencies):
+        (endpoint, path, query) = parse_request(self.library, method, url, params or {})
+        start = time.perf_counter()
+        try:
+            if self.latency > 0:
+                await asyncio.sleep(self.latency * random.uniform(0.5, 1.5))
+            if self.throttle_rate > 0 and random.random() < self.throttle_rate:
+                self.stats.record(endpoint, throttled=True)
+                raise spotipy.exceptions.SpotifyException(429, -1, "API rate limit exceeded",
+                        headers={"Retry-After": str(self.retry_after)})
+            self.stats.record(endpoint)
+            with self.library.lock:
+                return answer(self.library, method, path, query, payload)
+        finally:
+            latencies.append(time.perf_counter() - start)
+
+
+class RequestStats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = collections.Counter()
+        self.throttled = collections.Counter()
+
+    def record(self, endpoint, throttled=False):
+        with self.lock:
+            if throttled:
+                self.throttled[endpoint] += 1
+            else:
+                self.requests[endpoint] += 1
+
+    def merge(self, other):
+        self.requests.update(other.requests)
+        self.throttled.update(other.throttled)
+
+
+def parse_request(library, method, url, params):
+    # Returns the endpoint for the statistics, the path relative to the API and the query parameters.
+    if url.startswith(PREFIX):
+        url = url[len(PREFIX):]
+    parsed = urllib.parse.urlsplit(url)
+    query = dict(urllib.parse.parse_qsl(parsed.query))
+    query.update({key: value for (key, value) in params.items() if value != None})
+    path = parsed.path.strip("/")
+    endpoint = method + " " + re.sub(r"[0-9A-Za-z]{22}|" + library.user_id, "{id}", path)
+    return (endpoint, path, query)
+
+
+def answer(library, method, path, query, payload):
+    parts = path.split("/")
+    limit = int(query.get("limit", 20))
+    offset = int(query.get("offset", 0))
+
+    if path == "me":
+        return {"id": library.user_id}
+    if path == "me/following":
+        ids = [artist["id"] for artist in library.artists]
+        start = ids.index(query["after"]) + 1 if "after" in query else 0
+        items = library.artists[start:(start + limit)]
+        after = items[-1]["id"] if len(items) == limit else None
+        return {"artists": {"items": items, "cursors": {"after": after}, "limit": limit, "total": len(ids)}}
+    if path == "me/tracks":
+        return page(library.saved_tracks, limit, offset, path)
+    if path == "me/playlists":
+        return page([playlist_item(pl) for pl in library.playlists], limit, offset, path)
+    if path == "albums":
+        return {"albums": [full_album(library.albums.get(id)) for id in query["ids"].split(",")]}
+    if parts[0] == "albums" and parts[2] == "tracks":
+        return page(library.albums[parts[1]]["tracks"], limit, offset, path)
+    if parts[0] == "artists" and parts[2] == "albums":
+        groups = query.get("include_groups", ",".join(ALBUM_GROUPS)).split(",")
+        albums = []
+        for group in ALBUM_GROUPS:
+            if group in groups:
+                albums.extend(library.artist_albums[parts[1]][group])
+        return page([simple_album(album) for album in albums], limit, offset, path)
+    if parts[0] == "users" and parts[2] == "playlists":
+        return playlist_item(library.add_playlist(payload["name"], []))
+    if parts[0] == "playlists" and len(parts) == 2:
+        return playlist_item(library.get_playlist(parts[1]))
+    if parts[0] == "playlists" and parts[2] in ["tracks", "items"]:
+        playlist = library.get_playlist(parts[1])
+        if method == "GET":
+            return page([{"track": {"id": id}} for id in playlist["track_ids"]], limit, offset, path)
+        update_playlist(playlist, method, query, payload)
+        playlist["snapshot_id"] = library.new_id()
+        return {"snapshot_id": playlist["snapshot_id"]}
+    raise spotipy.exceptions.SpotifyException(404, -1, "Unknown endpoint " + method + " " + path)
+
+
+def page(items, limit, offset, path):
+    next_url = None
+    if offset + limit < len(items):
+        next_url = PREFIX + path + "?" + urllib.parse.urlencode({"limit": limit, "offset": offset + limit})
+    return {"items": items[offset:(offset + limit)], "limit": limit, "offset": offset,
+            "total": len(items), "next": next_url}
+
+
+def simple_album(album):
+    return {key: value for (key, value) in album.items() if key != "tracks"}
+
+
+def full_album(album):
+    if album == None:
+        return None
+    res = simple_album(album)
+    res["tracks"] = page(album["tracks"], 50, 0, "albums/" + album["id"] + "/tracks")
+    return res
+
+
+def playlist_item(playlist):
+    return {"id": playlist["id"], "name": playlist["name"], "snapshot_id": playlist["snapshot_id"],
+            "tracks": {"total": len(playlist["track_ids"])}}
+
+
+def get_track_id(uri):
+    return uri.split(":")[-1]
+
+
+def update_playlist(playlist, method, query, payload):
+    track_ids = playlist["track_ids"]
+    if method == "POST":
+        position = int(query["position"]) if "position" in query else len(track_ids)
+        track_ids[position:position] = [get_track_id(uri) for uri in payload]
+    elif method == "PUT" and "uris" in payload:
+        playlist["track_ids"] = [get_track_id(uri) for uri in payload["uris"]]
+    elif method == "PUT":
+        start = payload["range_start"]
+        length = payload.get("range_length", 1)
+        moved = track_ids[start:(start + length)]
+        insert_before = payload["insert_before"]
+        del track_ids[start:(start + length)]
+        if insert_before > start:
+            insert_before -= length
+        track_ids[insert_before:insert_before] = moved
+    elif method == "DELETE":
+        removed = set(get_track_id(item["uri"]) for item in payload.get("items", payload.get("tracks", [])))
+        playlist["track_ids"] = [id for id in track_ids if not id in removed]
@@ -0,0 +1,91 @@
+#!/bin/python3
+
+# Measures the memory used by the model objects of a full "update" on a large follow list. The
+# albums are generated locally and parsed like downloaded ones, so no Spotify account is needed.
+#
+# Usage: python benchmarks/memory.py [--artists N] [--albums N] [--tracks N] [--no-registry]
+
+import argparse
+import os
+import random
+import resource
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from scriptify import model
+
+
+class NoRegistry(model.Registry):
+    # Creates new objects for every occurrence of an ID, like the models did before interning.
+    def get_artist(self, id, name, popularity=None):
+        return model.Artist(id, name, popularity)
+
+    def get_album(self, item, artists=None):
+        if "artists" in item:
+            artists = [self.get_artist(art["id"], art["name"]) for art in item["artists"]]
+        album = model.Album(item["id"], item["name"], artists, item["release_date"], item["release_date_precision"])
+        album.type = item.get("album_type")
+        if "tracks" in item:
+            album.tracks = [model.track_from_item(tr, album) for tr in item["tracks"]]
+        return album
+
+
+def generate_album_items(artistId, albumCount, trackCount, featuredArtists):
+    res = []
+    for i in range(albumCount):
+        artists = [{"id": artistId, "name": "Artist " + artistId}]
+        tracks = []
+        for j in range(trackCount):
+            trackArtists = list(artists)
+            if random.random() < 0.3:
+                trackArtists.append(random.choice(featuredArtists))
+            tracks.append({"id": f"{artistId}t{i}.{j}", "name": f"Track {j}", "artists": trackArtists})
+        res.append({
+            "id": f"{artistId}a{i}",
+            "name": f"Album {i}",
+            "album_type": "album",
+            "release_date": f"{2000 + i % 24}-01-01",
+            "release_date_precision": "day",
+            "artists": artists,
+            "tracks": tracks,
+        })
+    return res
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure memory of the model objects.")
+    parser.add_argument("--artists", type=int, default=800, help="number of followed artists")
+    parser.add_argument("--albums", type=int, default=40, help="albums per artist")
+    parser.add_argument("--tracks", type=int, default=12, help="tracks per album")
+    parser.add_argument("--no-registry", action="store_true", help="create new objects for every ID")
+    args = parser.parse_args()
+
+    if args.no_registry:
+        model.registry = NoRegistry()
+
+    random.seed(0)
+    featuredArtists = [{"id": f"f{i}", "name": f"Featured {i}"} for i in range(200)]
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    followed = []
+    for i in range(args.artists):
+        artist = model.registry.get_artist(f"r{i}", f"Artist r{i}", 50)
+        items = generate_album_items(artist.id, args.albums, args.tracks, featuredArtists)
+        artist.albums = [model.album_from_item(item) for item in items]
+        del items
+        followed.append(artist)
+    duration = time.perf_counter() - start
+    (current, peak) = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    print(f"artists: {args.artists}, albums: {args.artists * args.albums}, tracks: {args.artists * args.albums * args.tracks}")
+    print(f"time: {duration:.2f}s")
+    print(f"retained: {current / 2**20:.1f} MiB, peak: {peak / 2**20:.1f} MiB")
+    print(f"max RSS: {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 2**10:.1f} MiB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+#!/bin/python3
+
+# Runs commands of scriptify against a synthetic library served by FakeSpotify and reports wall time,
+# requests per endpoint and peak memory for every command.
+#
+# Usage: python benchmarks/run.py [--artists N] [--saved-tracks N] [--playlists N] [--latency MS]
+#            [--throttle-rate P] [--jobs N] [--async-requests N] [command ...]
+#
+# "crawl" downloads all discographies with worker threads, "crawl-async" with the asyncio client.
+# "snapshot" takes or updates a library snapshot, which the other commands use with --offline.
+
+import argparse
+import contextlib
+import datetime
+import io
+import logging
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from scriptify import aio, api, cache, commands, model, sets, snapshot
+from scriptify.library import complete_artist_albums, get_followed_artists, map_artists
+
+from fake_spotify import FakeAsyncSpotify, FakeSpotify, RequestStats, SyntheticLibrary
+
+
+COMMANDS = ["update", "union", "intersection", "verify", "crawl", "crawl-async", "snapshot"]
+OFFLINE_COMMANDS = ["union", "intersection", "verify", "snapshot"]
+
+
+def run_update(connect, connect_async, args):
+    asyncClient = connect_async() if args.async_requests > 0 else None
+    commands.refresh_release_radar(connect(), connect(), datetime.timedelta(days=args.days),
+            jobs=args.jobs, incremental=args.incremental, async_client=asyncClient)
+
+
+def run_set_operation(operation):
+    def run(connect, connect_async, args):
+        spotifyAccess = connect()
+        names = [item["name"] for item in model.PlaylistDirectory.of(spotifyAccess).get_items()]
+        commands.apply_set_operation(spotifyAccess, names[-args.inputs:], "Benchmark Result", operation)
+    return run
+
+
+def run_verify(connect, connect_async, args):
+    commands.check_categorization(connect(), jobs=args.jobs)
+
+
+def run_crawl(connect, connect_async, args):
+    spotifyAccess = connect()
+    artists = get_followed_artists(spotifyAccess)
+    get_albums = lambda artist: artist.get_albums(spotifyAccess)
+    for (artist, albums) in complete_artist_albums(spotifyAccess,
+            map_artists(get_albums, artists, jobs=args.jobs), jobs=args.jobs):
+        artist.albums = None
+
+
+def run_crawl_async(connect, connect_async, args):
+    artists = get_followed_artists(connect())
+    for (artist, albums) in aio.crawl_artists(connect_async(), artists):
+        artist.albums = None
+
+
+def run_snapshot(connect, connect_async, args):
+    library = snapshot.LibrarySnapshot(args.snapshot)
+    try:
+        library.update(connect(), connect(), jobs=args.jobs)
+    finally:
+        library.close()
+
+
+RUNNERS = {
+    "update": run_update,
+    "union": run_set_operation(sets.union),
+    "intersection": run_set_operation(sets.intersection),
+    "verify": run_verify,
+    "crawl": run_crawl,
+    "crawl-async": run_crawl_async,
+    "snapshot": run_snapshot,
+}
+
+
+def run_command(command, library, args):
+    stats = RequestStats()
+    clients = []
+    limiter = api.RateLimiter(args.rate, burst=args.rate)
+    offlineLibrary = None
+    if args.offline and command != "snapshot":
+        offlineLibrary = snapshot.LibrarySnapshot(args.snapshot)
+    def connect():
+        if offlineLibrary != None:
+            return offlineLibrary.connect(jobs=args.jobs)
+        client = FakeSpotify(library=library, latency=args.latency / 1000, throttle_rate=args.throttle_rate,
+                retry_after=args.retry_after, limiter=limiter, jobs=args.jobs)
+        clients.append(client)
+        return client
+    def connect_async():
+        client = FakeAsyncSpotify(library=library, latency=args.latency / 1000, throttle_rate=args.throttle_rate,
+                retry_after=args.retry_after, limiter=limiter, concurrency=args.async_requests or 100)
+        clients.append(client)
+        return client
+
+    # Every command starts cold:
+    cache.metadata_cache = cache.MetadataCache(args.cache)
+    model.registry = model.Registry()
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        RUNNERS[command](connect, connect_async, args)
+    duration = time.perf_counter() - start
+    (current, peak) = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    cache.metadata_cache.close()
+    if offlineLibrary != None:
+        offlineLibrary.close()
+
+    for client in clients:
+        stats.merge(client.stats)
+    return (duration, peak, stats)
+
+
+def print_report(command, duration, peak, stats):
+    print(f"{command}: {duration:.2f}s, {sum(stats.requests.values())} requests,"
+            + f" {sum(stats.throttled.values())} throttled, peak memory {peak / 2**20:.1f} MiB")
+    for (endpoint, count) in sorted(stats.requests.items(), key=lambda item: -item[1]):
+        print(f"    {count:7d}  {endpoint}" + (f" ({stats.throttled[endpoint]} throttled)" if stats.throttled[endpoint] else ""))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark scriptify against a fake Spotify API.")
+    parser.add_argument("commands", nargs="*", default=COMMANDS,
+            help="the commands to run, any of " + ", ".join(COMMANDS))
+    parser.add_argument("--artists", type=int, default=1000, help="number of followed artists")
+    parser.add_argument("--albums", type=int, default=20, help="average number of albums per artist")
+    parser.add_argument("--saved-tracks", type=int, default=50000, help="number of saved tracks")
+    parser.add_argument("--playlists", type=int, default=500, help="number of playlists")
+    parser.add_argument("--playlist-size", type=int, default=100, help="average number of tracks per playlist")
+    parser.add_argument("--inputs", type=int, default=20, help="number of input playlists of set operations")
+    parser.add_argument("--latency", type=float, default=0, help="latency of every request in milliseconds")
+    parser.add_argument("--throttle-rate", type=float, default=0, help="fraction of requests answered with 429")
+    parser.add_argument("--retry-after", type=float, default=0.1, help="Retry-After of 429 responses in seconds")
+    parser.add_argument("--rate", type=int, default=10000, help="allowed requests per second")
+    parser.add_argument("--jobs", type=int, default=1, help="number of concurrent requests")
+    parser.add_argument("--async-requests", type=int, default=0,
+            help="concurrent requests of the asyncio client (default 100), update uses it if given")
+    parser.add_argument("--days", type=int, default=8, help="period of the Release Radar in days")
+    parser.add_argument("--incremental", action="store_true", help="update the Release Radar incrementally")
+    parser.add_argument("--cache", default=None, help="path of a metadata cache to use")
+    parser.add_argument("--offline", action="store_true", help="run the commands against the library snapshot")
+    parser.add_argument("--snapshot", default=None, help="path of the library snapshot, a temporary file by default")
+    args = parser.parse_args()
+    for command in args.commands:
+        if not command in COMMANDS:
+            parser.error("unknown command " + command)
+        if args.offline and not command in OFFLINE_COMMANDS:
+            parser.error(command + " can't run with --offline")
+    if args.snapshot == None:
+        args.snapshot = os.path.join(tempfile.mkdtemp(), "library.sqlite3")
+
+    logging.basicConfig(level=logging.WARNING, format="%(levelname)s: %(message)s")
+    api.BACKOFF_BASE = min(api.BACKOFF_BASE, args.retry_after)
+
+    start = time.perf_counter()
+    library = SyntheticLibrary(artists=args.artists, albums_per_artist=args.albums,
+            saved_tracks=args.saved_tracks, playlists=args.playlists, playlist_size=args.playlist_size)
+    print(f"Generated library with {len(library.artists)} artists, {len(library.albums)} albums,"
+            + f" {len(library.tracks)} tracks and {len(library.playlists)} playlists"
+            + f" in {time.perf_counter() - start:.1f}s.")
+
+    for command in args.commands:
+        (duration, peak, stats) = run_command(command, library, args)
+        print_report(command, duration, peak, stats)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+#!/bin/python3
+
+# Measures the cold start time of scriptify: every command is run in a new interpreter several times
+# and the minimum and median wall times are reported. Modules, that the command line interface
+# imports in addition to the bare interpreter before running a subcommand, are listed with -v.
+#
+# Usage: python benchmarks/startup.py [--runs N] [-v]
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+CASES = [
+    ("interpreter", ["-c", "pass"]),
+    ("--help", ["-m", "scriptify", "--help"]),
+    ("update --help", ["-m", "scriptify", "update", "--help"]),
+    ("import scriptify.cli", ["-c", "import scriptify.cli"]),
+    ("import scriptify.commands", ["-c", "import scriptify.commands"]),
+]
+
+
+def measure(args, runs):
+    durations = []
+    for i in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable] + args, cwd=ROOT, stdout=subprocess.DEVNULL, check=True)
+        durations.append(time.perf_counter() - start)
+    return durations
+
+
+def get_imported_modules(args):
+    # Top level packages imported by the given command, taken from -X importtime:
+    result = subprocess.run([sys.executable, "-X", "importtime"] + args, cwd=ROOT,
+            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True, check=True)
+    modules = set()
+    for line in result.stderr.splitlines()[1:]:
+        modules.add(line.split("|")[-1].strip().split(".")[0])
+    return sorted(modules)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure the cold start time of scriptify.")
+    parser.add_argument("--runs", type=int, default=20, help="runs of every command")
+    parser.add_argument("-v", "--verbose", action="store_true", help="list the modules imported by --help")
+    args = parser.parse_args()
+
+    for (name, caseArgs) in CASES:
+        durations = measure(caseArgs, args.runs)
+        print(f"{name:<28} min {1000 * min(durations):7.1f} ms   median {1000 * statistics.median(durations):7.1f} ms")
+
+    if args.verbose:
+        modules = set(get_imported_modules(["-m", "scriptify", "--help"]))
+        modules.difference_update(get_imported_modules(["-c", "pass"]))
+        print("Modules imported by --help: " + ", ".join(sorted(modules)))
+
+
+if __name__ == "__main__":
+    main()
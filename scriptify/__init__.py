@@ -0,0 +1,2 @@
+# Scripts for advanced Spotify libary handling. The modules are imported on demand, so that the
+# command line interface starts without loading spotipy.
@@ -0,0 +1,4 @@
+from scriptify.cli import main
+
+
+main()
@@ -0,0 +1,221 @@
+# An asyncio client of the Spotify Web API and the async crawl of artist discographies built on it.
+# aiohttp is an optional dependency, it is only needed once an AsyncSpotifyClient is opened.
+
+import asyncio
+import collections
+import queue
+import threading
+import time
+import spotipy
+
+from scriptify import api, model
+
+try:
+    import aiohttp
+    CONNECTION_ERRORS = (aiohttp.ClientConnectionError, asyncio.TimeoutError)
+except ImportError:
+    aiohttp = None
+    CONNECTION_ERRORS = (asyncio.TimeoutError,)
+
+
+API_PREFIX = "https://api.spotify.com/v1/"
+# Seconds after which an access token is requested from the auth manager again. The auth manager
+# returns its cached token until shortly before it expires:
+TOKEN_REFRESH_INTERVAL = 60
+# Seconds after which a connection of the pool is closed, if no request uses it:
+KEEPALIVE_TIMEOUT = 30
+REQUEST_TIMEOUT = 30
+# Artists crawled ahead of the consumer per concurrent request. Artists wait for the responses of
+# several requests and for batches of albums to fill up, so more artists than requests are needed:
+LOOKAHEAD_FACTOR = 4
+
+
+def is_available():
+    return aiohttp != None
+
+
+class AsyncSpotifyClient:
+    # Sends requests from one event loop over a pool of kept-alive connections, up to concurrency of
+    # them at once. Rate limiting, retries and profiling work like in SpotifyClient, the limiter may
+    # be shared with synchronous clients. Only the endpoints needed to crawl discographies exist.
+    def __init__(self, auth_manager, limiter=None, concurrency=100):
+        if limiter == None:
+            limiter = api.rate_limiter
+        self.auth_manager = auth_manager
+        self.limiter = limiter
+        self.concurrency = concurrency
+        self.prefix = API_PREFIX
+        self.session = None
+        self.token = None
+        self.token_time = 0
+        self.token_lock = None
+        self.slots = None
+
+    async def __aenter__(self):
+        self.token_lock = asyncio.Lock()
+        # Requests waiting for a connection would otherwise count towards their timeout:
+        self.slots = asyncio.Semaphore(self.concurrency)
+        self.session = self.create_session()
+        return self
+
+    async def __aexit__(self, *excInfo):
+        if self.session != None:
+            await self.session.close()
+        self.session = None
+
+    def create_session(self):
+        if aiohttp == None:
+            raise RuntimeError("The async client requires aiohttp, install it with \"pip install aiohttp\".")
+        connector = aiohttp.TCPConnector(limit=self.concurrency, keepalive_timeout=KEEPALIVE_TIMEOUT)
+        return aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=REQUEST_TIMEOUT))
+
+    async def get_auth_headers(self):
+        async with self.token_lock:
+            if self.token == None or time.monotonic() - self.token_time > TOKEN_REFRESH_INTERVAL:
+                # The auth manager may block on a request or the token cache file:
+                loop = asyncio.get_event_loop()
+                self.token = await loop.run_in_executor(None, self.get_access_token)
+                self.token_time = time.monotonic()
+        return {"Authorization": "Bearer " + self.token}
+
+    def get_access_token(self):
+        try:
+            return self.auth_manager.get_access_token(as_dict=False)
+        except TypeError:
+            # SpotifyPKCE and SpotifyImplicitGrant don't take as_dict:
+            return self.auth_manager.get_access_token()
+
+    async def request(self, method, url, params=None, payload=None):
+        if not url.startswith("http"):
+            url = self.prefix + url
+        if params != None:
+            params = {key: str(value) for (key, value) in params.items() if value != None}
+        retries = api.RequestRetries(method, url, self.limiter, CONNECTION_ERRORS)
+        try:
+            while True:
+                wait = self.limiter.reserve()
+                if wait > 0:
+                    await asyncio.sleep(wait)
+                retries.waited += wait
+                try:
+                    async with self.slots:
+                        res = await self.send_request(method, url, params, payload, retries.latencies)
+                    retries.failed = False
+                    return res
+                except retries.errors as err:
+                    delay = retries.get_delay(err)
+                    if delay == None:
+                        raise
+                await asyncio.sleep(delay)
+        finally:
+            retries.record()
+
+    async def send_request(self, method, url, params, payload, latencies):
+        headers = await self.get_auth_headers()
+        start = time.perf_counter()
+        try:
+            async with self.session.request(method, url, params=params, json=payload, headers=headers) as response:
+                if response.status >= 400:
+                    message = await response.text()
+                    raise spotipy.exceptions.SpotifyException(response.status, -1, f"{url}:\n {message}",
+                            headers=dict(response.headers))
+                return await response.json()
+        finally:
+            latencies.append(time.perf_counter() - start)
+
+    async def artist_albums(self, artist_id, include_groups=None, limit=20, offset=0):
+        return await self.request("GET", f"artists/{artist_id}/albums",
+                {"include_groups": include_groups, "limit": limit, "offset": offset})
+
+    async def albums(self, albums):
+        return await self.request("GET", "albums", {"ids": ",".join(albums)})
+
+    async def album_tracks(self, album_id, limit=50, offset=0):
+        return await self.request("GET", f"albums/{album_id}/tracks", {"limit": limit, "offset": offset})
+
+
+api.CLIENT_CODES.update(function.__code__ for function in vars(AsyncSpotifyClient).values() if callable(function))
+
+
+async def crawl_artists_async(spotify, artists, lookahead=None):
+    # Yields the given artists in order with all of their albums completed with tracks. Up to
+    # lookahead artists are crawled ahead of the consumer, the client limits the concurrent requests.
+    if lookahead == None:
+        lookahead = LOOKAHEAD_FACTOR * spotify.concurrency
+    albumQueue = model.AsyncAlbumQueue(spotify)
+
+    async def crawl(artist):
+        try:
+            albums = await artist.get_albums_async(spotify)
+        except BaseException:
+            albumQueue.finish_listing([])
+            raise
+        albumQueue.finish_listing(albums)
+        return await albumQueue.complete_async(albums)
+
+    pending = collections.deque()
+    try:
+        for artist in artists:
+            albumQueue.start_listing()
+            pending.append((artist, asyncio.ensure_future(crawl(artist))))
+            if len(pending) >= lookahead:
+                (nextArtist, task) = pending.popleft()
+                yield (nextArtist, await task)
+        while len(pending) > 0:
+            (nextArtist, task) = pending.popleft()
+            yield (nextArtist, await task)
+    finally:
+        tasks = [task for (_, task) in pending] + list(set(albumQueue.batches.values()))
+        for task in tasks:
+            task.cancel()
+        # Collects the exceptions of the remaining tasks after an error or if the consumer stopped:
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+def crawl_artists(spotify, artists, lookahead=None):
+    # Synchronous wrapper of crawl_artists_async for the generator stages of library. The event loop
+    # runs in its own thread and hands over the artists through a bounded queue. The artists are
+    # listed before the loop starts, so it never blocks on a synchronous client.
+    artists = list(artists)
+    results = queue.Queue(maxsize=spotify.concurrency if lookahead == None else lookahead)
+    stopped = threading.Event()
+    done = object()
+
+    async def run():
+        loop = asyncio.get_event_loop()
+        async with spotify:
+            crawl = crawl_artists_async(spotify, artists, lookahead)
+            try:
+                async for result in crawl:
+                    # Waits in a thread, so the requests of the following artists keep running:
+                    await loop.run_in_executor(None, results.put, result)
+                    if stopped.is_set():
+                        break
+            finally:
+                await crawl.aclose()
+
+    def main():
+        try:
+            asyncio.run(run())
+            results.put((done, None))
+        except BaseException as err:
+            results.put((done, err))
+
+    thread = threading.Thread(target=main, name="scriptify-aio", daemon=True)
+    thread.start()
+    try:
+        while True:
+            (artist, albums) = results.get()
+            if artist is done:
+                if albums != None:
+                    raise albums
+                return
+            yield (artist, albums)
+    finally:
+        stopped.set()
+        # Unblocks a pending put of the event loop:
+        while thread.is_alive():
+            try:
+                results.get(timeout=0.1)
+            except queue.Empty:
+                pass
@@ -0,0 +1,440 @@
+# Clients of the Spotify Web API with rate limiting, retries and optional profiling of requests.
+
+import bisect
+import collections
+import logging
+import os
+import random
+import re
+import requests
+import requests.adapters
+import sys
+import threading
+import time
+import urllib.parse
+import spotipy
+
+from concurrent.futures import ThreadPoolExecutor
+
+from spotipy.cache_handler import CacheFileHandler
+from spotipy.oauth2 import SpotifyClientCredentials, SpotifyOAuth
+
+
+# Requests per second shared by all clients and worker threads of one run:
+MAX_REQUESTS_PER_SECOND = 10
+# Redirect URI of the authorization of users, it has to be registered for the client ID:
+REDIRECT_URI = "http://127.0.0.1:9090"
+MAX_RETRIES = 6
+RETRY_STATUS_CODES = [429, 500, 502, 503, 504]
+# Bounds of the exponential backoff between retries in seconds:
+BACKOFF_BASE = 0.5
+MAX_BACKOFF = 30
+# Errors of the connection, after which a request is retried:
+CONNECTION_ERRORS = (requests.exceptions.ConnectionError, requests.exceptions.Timeout)
+# Upper bounds of the buckets of request latency histograms in seconds:
+LATENCY_BUCKETS = [0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10]
+# IDs in the paths of API endpoints, which are replaced by a placeholder in profiles:
+ENDPOINT_ID_PATTERN = re.compile(r"(?<=^users/)[^/]+|(?<=/)[0-9A-Za-z]{22}(?=/|$)")
+# Requests are attributed to the functions in this directory, that sent them:
+PACKAGE_DIRECTORY = os.path.dirname(os.path.abspath(__file__)) + os.sep
+
+
+##
+# Access to the Spotify API:
+##
+
+
+class RateLimiter:
+    # Token bucket: up to burst requests may be sent at once, afterwards one per 1 / rate seconds.
+    # A missing token is reserved and waited for outside of the lock, so callers are served in order.
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.capacity = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.blocked_until = 0
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        wait = self.reserve()
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    def reserve(self):
+        # Takes a token and returns the time to wait for it, so async callers can wait without blocking.
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            return max(-self.tokens / self.rate, self.blocked_until - now, 0)
+
+    def try_reserve(self):
+        # Takes a token and returns 0, if one is available right now. Otherwise returns the time until
+        # one is available without taking it.
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            wait = max((1 - self.tokens) / self.rate, self.blocked_until - now, 0)
+            if wait == 0:
+                self.tokens -= 1
+            return wait
+
+    def block(self, seconds):
+        # Stops all users of the limiter, e.g. after Spotify answered with "429 Too Many Requests".
+        with self.lock:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+
+class FairScheduler:
+    # Shares a limiter between the accounts of a batch. Requests waiting for a token are served round
+    # robin by account, so an account with many pending requests can't starve the others.
+    def __init__(self, limiter):
+        self.limiter = limiter
+        self.condition = threading.Condition()
+        # Queues of waiting requests per account, the account at the front is served next:
+        self.queues = collections.OrderedDict()
+
+    def get_limiter(self, account):
+        return AccountLimiter(self, account)
+
+    def acquire(self, account):
+        start = time.monotonic()
+        ticket = object()
+        with self.condition:
+            self.queues.setdefault(account, collections.deque()).append(ticket)
+            while True:
+                queue = next(iter(self.queues.values()))
+                if queue[0] is ticket:
+                    wait = self.limiter.try_reserve()
+                    if wait == 0:
+                        # The account goes to the back of the line:
+                        queue.popleft()
+                        del self.queues[account]
+                        if len(queue) > 0:
+                            self.queues[account] = queue
+                        self.condition.notify_all()
+                        return time.monotonic() - start
+                    self.condition.wait(wait)
+                else:
+                    self.condition.wait()
+
+
+class AccountLimiter:
+    # Limiter of the clients of one account, that takes its turns at a FairScheduler.
+    def __init__(self, scheduler, account):
+        self.scheduler = scheduler
+        self.account = account
+
+    def acquire(self):
+        return self.scheduler.acquire(self.account)
+
+    def reserve(self):
+        # Async clients can't wait for their turn, they reserve tokens of the shared limiter directly:
+        return self.scheduler.limiter.reserve()
+
+    def block(self, seconds):
+        self.scheduler.limiter.block(seconds)
+
+
+class SpotifyClient(spotipy.Spotify):
+    # Every request of spotipy goes through _internal_call. Requests are throttled by a limiter
+    # shared by all clients and retried with jittered exponential backoff on throttling, server
+    # errors and connection problems. Spotipy's own retries are disabled by passing a session.
+    def __init__(self, *args, limiter=None, jobs=1, account="me", **kwargs):
+        session = requests.Session()
+        # Artists are listed and their albums completed by one pool of jobs worker threads each:
+        adapter = requests.adapters.HTTPAdapter(pool_connections=2, pool_maxsize=max(2 * jobs, 10), max_retries=0)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        super().__init__(*args, requests_session=session, **kwargs)
+
+        if limiter == None:
+            limiter = rate_limiter
+        self.limiter = limiter
+        self.jobs = jobs
+        # Data of the user, e.g. the playlist directory, is cached under this key:
+        self.account = account
+
+    def _internal_call(self, method, url, payload, params):
+        retries = RequestRetries(method, url, self.limiter, CONNECTION_ERRORS)
+        try:
+            while True:
+                retries.waited += self.limiter.acquire()
+                try:
+                    res = self.send_request(method, url, payload, params, retries.latencies)
+                    retries.failed = False
+                    return res
+                except retries.errors as err:
+                    delay = retries.get_delay(err)
+                    if delay == None:
+                        raise
+                time.sleep(delay)
+        finally:
+            retries.record()
+
+    def send_request(self, method, url, payload, params, latencies):
+        start = time.perf_counter()
+        try:
+            return super()._internal_call(method, url, payload, params)
+        finally:
+            latencies.append(time.perf_counter() - start)
+
+
+class RequestRetries:
+    # The attempts of one request, shared by the synchronous and the async client: decides whether and
+    # when a failed attempt is retried and records the request in the profile once it is done.
+    def __init__(self, method, url, limiter, connection_errors):
+        self.method = method
+        self.url = url
+        self.limiter = limiter
+        self.errors = (spotipy.exceptions.SpotifyException,) + connection_errors
+        self.latencies = []
+        self.throttled = 0
+        self.waited = 0
+        self.failed = True
+        self.attempt = 0
+
+    def get_delay(self, err):
+        # Returns the seconds to wait before the next attempt after the given error or None, if it
+        # is not retried.
+        if isinstance(err, spotipy.exceptions.SpotifyException):
+            if err.http_status == 429:
+                self.throttled += 1
+            if self.attempt >= MAX_RETRIES or not err.http_status in RETRY_STATUS_CODES:
+                return None
+            delay = get_backoff_delay(self.attempt)
+            if err.http_status == 429:
+                retryAfter = (err.headers or {}).get("Retry-After")
+                if retryAfter != None:
+                    delay = float(retryAfter) + random.uniform(0, 1)
+                # All users of the limiter wait:
+                self.limiter.block(delay)
+            logging.warning(f"Request failed with status {err.http_status}, retrying in {delay:.1f}s...")
+        else:
+            if self.attempt >= MAX_RETRIES:
+                return None
+            delay = get_backoff_delay(self.attempt)
+            logging.warning(f"Request failed ({err!r}), retrying in {delay:.1f}s...")
+        self.waited += delay
+        self.attempt += 1
+        return delay
+
+    def record(self):
+        if request_profiler != None:
+            request_profiler.record(get_calling_operation(), self.method, get_endpoint(self.url),
+                    self.latencies, self.attempt, self.throttled, self.waited, self.failed)
+
+
+def get_backoff_delay(attempt):
+    return random.uniform(0, min(MAX_BACKOFF, BACKOFF_BASE * 2 ** attempt))
+
+
+class RequestProfiler:
+    # Collects statistics of all requests of one run per calling function and endpoint: calls,
+    # failed calls, retries, "429 Too Many Requests" responses, time spent waiting for the rate
+    # limiter or between retries and a histogram of the latencies of the single HTTP requests.
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started = time.monotonic()
+        self.stats = {}
+
+    def record(self, operation, method, endpoint, latencies, retries, throttled, waited, failed):
+        with self.lock:
+            stats = self.stats.get((operation, method, endpoint))
+            if stats == None:
+                stats = {"calls": 0, "errors": 0, "retries": 0, "throttled": 0, "waited": 0,
+                        "latency": 0, "buckets": [0] * (len(LATENCY_BUCKETS) + 1)}
+                self.stats[(operation, method, endpoint)] = stats
+            stats["calls"] += 1
+            stats["errors"] += int(failed)
+            stats["retries"] += retries
+            stats["throttled"] += throttled
+            stats["waited"] += waited
+            for latency in latencies:
+                stats["latency"] += latency
+                stats["buckets"][bisect.bisect_left(LATENCY_BUCKETS, latency)] += 1
+
+    def get_items(self):
+        # Returns the statistics ordered by the time spent in requests:
+        with self.lock:
+            items = [(key, dict(stats, buckets=list(stats["buckets"]))) for (key, stats) in self.stats.items()]
+        return sorted(items, key=lambda item: -item[1]["latency"] - item[1]["waited"])
+
+    def format_table(self):
+        lines = [f"{'Operation':<32} {'Endpoint':<36} {'Calls':>6} {'Reqs':>6} {'Retry':>5} {'429':>4}"
+                + f" {'Wait/s':>7} {'Time/s':>7} {'Mean/ms':>8} {'P95/ms':>7}"]
+        totals = collections.Counter()
+        for ((operation, method, endpoint), stats) in self.get_items():
+            requestCount = sum(stats["buckets"])
+            lines.append(f"{operation[:32]:<32} {(method + ' ' + endpoint)[:36]:<36} {stats['calls']:>6} {requestCount:>6}"
+                    + f" {stats['retries']:>5} {stats['throttled']:>4} {stats['waited']:>7.2f} {stats['latency']:>7.2f}"
+                    + f" {1000 * stats['latency'] / max(requestCount, 1):>8.1f} {format_percentile(stats['buckets'], 0.95):>7}")
+            totals.update({"calls": stats["calls"], "requests": requestCount, "retries": stats["retries"],
+                    "throttled": stats["throttled"], "waited": stats["waited"], "latency": stats["latency"]})
+        lines.append(f"{'Total':<69} {totals['calls']:>6} {totals['requests']:>6} {totals['retries']:>5}"
+                + f" {totals['throttled']:>4} {totals['waited']:>7.2f} {totals['latency']:>7.2f}")
+        lines.append(f"Wall time: {time.monotonic() - self.started:.2f}s")
+        return "\n".join(lines)
+
+    def to_json(self):
+        operations = []
+        for ((operation, method, endpoint), stats) in self.get_items():
+            buckets = {str(bound): count for (bound, count) in zip(LATENCY_BUCKETS + ["+Inf"], stats["buckets"])}
+            operations.append({"operation": operation, "method": method, "endpoint": endpoint,
+                    "calls": stats["calls"], "errors": stats["errors"], "retries": stats["retries"],
+                    "throttled": stats["throttled"], "waited": stats["waited"], "latency": stats["latency"],
+                    "buckets": buckets})
+        return {"duration": time.monotonic() - self.started, "operations": operations}
+
+    def to_prometheus(self):
+        # Text exposition format, e.g. for the textfile collector of the node exporter:
+        metrics = [
+            ("calls_total", "counter", "Calls of the Spotify API.", "calls"),
+            ("errors_total", "counter", "Calls of the Spotify API, that failed after all retries.", "errors"),
+            ("retries_total", "counter", "Retried requests to the Spotify API.", "retries"),
+            ("throttled_total", "counter", "Requests answered with 429 Too Many Requests.", "throttled"),
+            ("wait_seconds_total", "counter", "Time spent waiting for the rate limiter and between retries.", "waited"),
+        ]
+        items = self.get_items()
+        lines = []
+        for (name, kind, help, field) in metrics:
+            lines.append(f"# HELP scriptify_api_{name} {help}")
+            lines.append(f"# TYPE scriptify_api_{name} {kind}")
+            for (key, stats) in items:
+                lines.append(f"scriptify_api_{name}{{{format_labels(*key)}}} {stats[field]}")
+
+        lines.append("# HELP scriptify_api_request_duration_seconds Latency of single requests to the Spotify API.")
+        lines.append("# TYPE scriptify_api_request_duration_seconds histogram")
+        for (key, stats) in items:
+            labels = format_labels(*key)
+            count = 0
+            for (bound, bucketCount) in zip(LATENCY_BUCKETS + ["+Inf"], stats["buckets"]):
+                count += bucketCount
+                lines.append(f"scriptify_api_request_duration_seconds_bucket{{{labels},le=\"{bound}\"}} {count}")
+            lines.append(f"scriptify_api_request_duration_seconds_sum{{{labels}}} {stats['latency']}")
+            lines.append(f"scriptify_api_request_duration_seconds_count{{{labels}}} {count}")
+
+        lines.append("# HELP scriptify_run_duration_seconds Wall time of the last run.")
+        lines.append("# TYPE scriptify_run_duration_seconds gauge")
+        lines.append(f"scriptify_run_duration_seconds {time.monotonic() - self.started}")
+        lines.append("# HELP scriptify_last_run_timestamp_seconds End of the last run.")
+        lines.append("# TYPE scriptify_last_run_timestamp_seconds gauge")
+        lines.append(f"scriptify_last_run_timestamp_seconds {time.time()}")
+        return "\n".join(lines) + "\n"
+
+
+def get_calling_operation():
+    # The innermost function of this package, that is not part of a client, is the operation a
+    # request is attributed to. Requests of nested functions and lambdas count for their enclosing
+    # function.
+    frame = sys._getframe(1)
+    while frame != None:
+        code = frame.f_code
+        if code.co_filename.startswith(PACKAGE_DIRECTORY) and not code in CLIENT_CODES:
+            return getattr(code, "co_qualname", code.co_name).split(".<locals>")[0]
+        frame = frame.f_back
+    return "unknown"
+
+
+def get_endpoint(url):
+    path = urllib.parse.urlsplit(url).path.strip("/")
+    if path.startswith("v1/"):
+        path = path[len("v1/"):]
+    return ENDPOINT_ID_PATTERN.sub("{id}", path)
+
+
+def format_percentile(buckets, fraction):
+    # Upper bound of the histogram bucket containing the given percentile in milliseconds:
+    count = 0
+    for (bound, bucketCount) in zip(LATENCY_BUCKETS, buckets):
+        count += bucketCount
+        if count >= fraction * sum(buckets):
+            return str(int(1000 * bound))
+    return ">" + str(int(1000 * LATENCY_BUCKETS[-1]))
+
+
+def format_labels(operation, method, endpoint):
+    def escape(value):
+        return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+    return f"operation=\"{escape(operation)}\",method=\"{method}\",endpoint=\"{escape(endpoint)}\""
+
+
+rate_limiter = RateLimiter(MAX_REQUESTS_PER_SECOND, burst=MAX_REQUESTS_PER_SECOND)
+# Only set, if requests are profiled:
+request_profiler = None
+# Only set, if commands run offline against a LibrarySnapshot:
+offline_library = None
+# Functions of the clients, which are skipped when attributing requests to operations:
+CLIENT_CODES = {SpotifyClient._internal_call.__code__, SpotifyClient.send_request.__code__,
+        RequestRetries.record.__code__}
+
+
+def get_complete_list(get_page, jobs=1):
+    return list(iter_complete_list(get_page, jobs=jobs))
+
+
+def iter_complete_list(get_page, jobs=1, first_page=None):
+    # Yields the items of all pages in order, as soon as they arrive. The first page tells the total,
+    # so the offsets of all remaining pages are known and up to jobs pages are requested concurrently.
+    # If the first page was already requested, only the items of the remaining pages are yielded.
+    if first_page == None:
+        page = get_page(0)
+        yield from page["items"]
+    else:
+        page = first_page
+    offset = len(page["items"])
+    page_size = page.get("limit") or offset
+    list_length = page["total"]
+
+    if jobs <= 1 or page_size == 0:
+        while offset < list_length and len(page["items"]) > 0:
+            page = get_page(offset)
+            yield from page["items"]
+            offset += len(page["items"])
+        return
+
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        # Only a bounded number of pages is requested ahead of the consumer:
+        pending = collections.deque()
+        for page_offset in range(offset, list_length, page_size):
+            pending.append(executor.submit(get_page, page_offset))
+            if len(pending) >= 2 * jobs:
+                yield from pending.popleft().result()["items"]
+        while len(pending) > 0:
+            yield from pending.popleft().result()["items"]
+
+
+def connect_user(clientId, clientSecret, accessScopes, jobs=1, limiter=None, account="me", token_path=None,
+        redirect_uri=None):
+    # The token of an account is stored at token_path, by default spotipy stores it in ".cache".
+    if offline_library != None:
+        return offline_library.connect(jobs=jobs)
+    return SpotifyClient(
+            auth_manager=SpotifyOAuth(
+                client_id=clientId,
+                client_secret=clientSecret,
+                redirect_uri=redirect_uri or REDIRECT_URI,
+                scope=accessScopes,
+                cache_handler=CacheFileHandler(cache_path=token_path) if token_path != None else None),
+            jobs=jobs,
+            limiter=limiter,
+            account=account)
+
+
+def connect_public(clientId, clientSecret, jobs=1, limiter=None):
+    if offline_library != None:
+        return offline_library.connect(jobs=jobs)
+    return SpotifyClient(
+            auth_manager=SpotifyClientCredentials(
+                client_id=clientId,
+                client_secret=clientSecret),
+            jobs=jobs,
+            limiter=limiter)
+
+
+def get_token_path(account):
+    cacheHome = os.environ.get("XDG_CACHE_HOME", os.path.join(os.path.expanduser("~"), ".cache"))
+    return os.path.join(cacheHome, "scriptify", "tokens", account + ".json")
@@ -0,0 +1,142 @@
+# Persistent cache of downloaded metadata in SQLite.
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import zlib
+
+
+# Time to live of cached metadata in seconds:
+CACHE_TTLS = {
+    "album": 180 * 24 * 3600,
+    "album_tracks": 180 * 24 * 3600,
+    "artist_albums": 20 * 3600,
+    "artist_recent_albums": 20 * 3600,
+    "playlist_snapshot": 30 * 24 * 3600,
+    "playlist_directory": 3600,
+    # Saved tracks are only synced incrementally, until they expire and are downloaded completely:
+    "saved_tracks": 30 * 24 * 3600,
+}
+MAX_CACHE_SIZE = 64 * 1024 * 1024
+
+
+##
+# Persistent cache of metadata:
+##
+
+
+class MetadataCache:
+    # Stores compact JSON documents keyed by kind and Spotify ID. With path == None the cache is
+    # disabled and every lookup misses. With refresh == True lookups miss, but downloaded data is
+    # still stored.
+    def __init__(self, path, max_size=MAX_CACHE_SIZE, refresh=False):
+        self.path = path
+        self.max_size = max_size
+        self.refresh = refresh
+        self.lock = threading.Lock()
+        self.pending_writes = 0
+        self.connection = None
+
+        if path == None:
+            return
+
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("""CREATE TABLE IF NOT EXISTS entries (
+                kind TEXT NOT NULL,
+                id TEXT NOT NULL,
+                data BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                stored REAL NOT NULL,
+                accessed REAL NOT NULL,
+                PRIMARY KEY (kind, id))""")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed)")
+        # Caches of older versions kept the albums of every artist seen by incremental updates:
+        self.connection.execute("DROP TABLE IF EXISTS artist_state")
+
+    def get(self, kind, id):
+        return self.get_many(kind, [id]).get(id)
+
+    def get_many(self, kind, ids):
+        if self.connection == None or self.refresh:
+            return {}
+
+        res = {}
+        now = time.time()
+        with self.lock:
+            for offset in range(0, len(ids), 500):
+                idSlice = ids[offset:(offset + 500)]
+                rows = self.connection.execute(
+                        "SELECT id, data FROM entries WHERE kind = ? AND stored > ? AND id IN ("
+                            + ",".join("?" * len(idSlice)) + ")",
+                        [kind, now - CACHE_TTLS[kind]] + idSlice)
+                for (id, data) in rows:
+                    res[id] = json.loads(zlib.decompress(data))
+            if len(res) > 0:
+                self.connection.executemany("UPDATE entries SET accessed = ? WHERE kind = ? AND id = ?",
+                        [(now, kind, id) for id in res])
+                self.pending_writes += 1
+        return res
+
+    def put(self, kind, id, value):
+        if self.connection == None:
+            return
+
+        data = zlib.compress(json.dumps(value, separators=(",", ":")).encode())
+        now = time.time()
+        with self.lock:
+            self.connection.execute("INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?)",
+                    (kind, id, data, len(data), now, now))
+            self.pending_writes += 1
+            if self.pending_writes >= 100:
+                self.connection.commit()
+                self.pending_writes = 0
+
+    def evict(self):
+        # Removes expired entries and then the least recently used ones until the cache fits into
+        # max_size again.
+        now = time.time()
+        for (kind, ttl) in CACHE_TTLS.items():
+            self.connection.execute("DELETE FROM entries WHERE kind = ? AND stored <= ?", (kind, now - ttl))
+
+        totalSize = self.connection.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if totalSize <= self.max_size:
+            return
+
+        logging.debug("Evicting entries from metadata cache...")
+        rows = self.connection.execute("SELECT kind, id, size FROM entries ORDER BY accessed").fetchall()
+        for (kind, id, size) in rows:
+            if totalSize <= self.max_size * 0.9:
+                break
+            self.connection.execute("DELETE FROM entries WHERE kind = ? AND id = ?", (kind, id))
+            totalSize -= size
+
+    def flush(self):
+        if self.connection == None:
+            return
+
+        with self.lock:
+            self.evict()
+            self.connection.commit()
+            self.pending_writes = 0
+
+    def close(self):
+        if self.connection == None:
+            return
+
+        self.flush()
+        with self.lock:
+            self.connection.close()
+            self.connection = None
+
+
+def get_cache_path():
+    cacheHome = os.environ.get("XDG_CACHE_HOME", os.path.join(os.path.expanduser("~"), ".cache"))
+    return os.path.join(cacheHome, "scriptify", "metadata.sqlite3")
+
+
+metadata_cache = MetadataCache(None)
@@ -0,0 +1,347 @@
+# Command line interface. Only the parser is set up at import time, the implementations of the
+# subcommands and their dependencies, e.g. spotipy, are imported when a subcommand runs.
+
+import argparse
+import getpass
+import json
+import logging
+import os
+import sys
+import time
+
+
+##
+# Functions to handle user input:
+##
+
+
+def parse_args(args):
+    parser = argparse.ArgumentParser(prog="scriptify",
+            description="Advanced libary handling for spotify.")
+
+    parser.add_argument("-d", "--debug",
+            action="store_true",
+            help="enable debugging output")
+    parser.add_argument("--no-cache",
+            action="store_true",
+            help="neither read nor write the local metadata cache")
+    parser.add_argument("--refresh",
+            action="store_true",
+            help="ignore cached metadata, but store freshly downloaded data")
+    parser.add_argument("--profile",
+            action="store_true",
+            help="print statistics of the requests to Spotify at exit")
+    parser.add_argument("--profile-json",
+            action="store",
+            metavar="PATH",
+            help="write statistics of the requests to Spotify as JSON to the given file")
+    parser.add_argument("--profile-prometheus",
+            action="store",
+            metavar="PATH",
+            help="write statistics of the requests to Spotify in the Prometheus text format to the given file")
+    parser.add_argument("--offline",
+            action="store_true",
+            help="answer verify, show and set operations from the library snapshot instead of Spotify, playlists are not changed")
+    parser.add_argument("--snapshot",
+            action="store",
+            metavar="PATH",
+            help="path of the library snapshot, written by the snapshot subcommand")
+    parser.add_argument("--plan", "--dry-run",
+            action="store_true",
+            dest="plan",
+            help="print the requests update and the set operations would send and the changes they would make, estimated from the metadata cache, without changing any playlist")
+    subcmd_parsers = parser.add_subparsers(help="Commands", dest="command")
+
+    update_parser = subcmd_parsers.add_parser("update",
+            help="update playlists automatically")
+    update_parser.add_argument("target",
+            action="store",
+            choices=["Release Radar"],
+            help="the playlist to update")
+    update_parser.add_argument("-d", "--days",
+            action="store",
+            required=False,
+            type=int,
+            default=8,
+            help="max age of added titles in days")
+    update_parser.add_argument("-j", "--jobs",
+            action="store",
+            required=False,
+            type=int,
+            default=1,
+            help="number of artists to download concurrently")
+    update_parser.add_argument("-i", "--incremental",
+            action="store_true",
+            help="only download tracks of albums released within the given days")
+    update_parser.add_argument("-a", "--async",
+            action="store",
+            dest="async_requests",
+            metavar="REQUESTS",
+            required=False,
+            type=int,
+            default=0,
+            help="download discographies with up to this many concurrent requests of an asyncio client (requires aiohttp)")
+
+    show_parser = subcmd_parsers.add_parser("show",
+            help="display possible updates for playlists")
+    show_parser.add_argument("target",
+            action="store",
+            choices=["Release Radar"],
+            help="the playlist to update")
+    show_parser.add_argument("-d", "--days",
+            action="store",
+            required=False,
+            type=int,
+            default=8,
+            help="max age of shown albums in days")
+    show_parser.add_argument("-j", "--jobs",
+            action="store",
+            required=False,
+            type=int,
+            default=1,
+            help="number of artists to download concurrently")
+
+    union_parser = subcmd_parsers.add_parser("union",
+            help="create the union of playlists")
+    union_parser.add_argument("-p", "--in_playlist",
+            action="append",
+            required=True,
+            help="a playlists to take as input")
+    union_parser.add_argument("result",
+            action="store",
+            help="the playlist to save the union to")
+    union_parser.add_argument("-j", "--jobs",
+            action="store",
+            required=False,
+            type=int,
+            default=1,
+            help="number of pages to download concurrently")
+
+    intersection_parser = subcmd_parsers.add_parser("intersection",
+            help="create the intersection of playlists")
+    intersection_parser.add_argument("-p", "--in_playlist",
+            action="append",
+            required=True,
+            help="a playlists to take as input")
+    intersection_parser.add_argument("result",
+            action="store",
+            help="the playlist to save the intersection to")
+    intersection_parser.add_argument("-j", "--jobs",
+            action="store",
+            required=False,
+            type=int,
+            default=1,
+            help="number of pages to download concurrently")
+
+    exclusion_parser = subcmd_parsers.add_parser("exclusion",
+            help="exclude tracks from playlists from another")
+    exclusion_parser.add_argument("-p", "--in_playlist",
+            action="append",
+            required=True,
+            help="a playlists to take as input")
+    exclusion_parser.add_argument("result",
+            action="store",
+            help="the playlist to save the resulting list of tracks to")
+    exclusion_parser.add_argument("-j", "--jobs",
+            action="store",
+            required=False,
+            type=int,
+            default=1,
+            help="number of pages to download concurrently")
+
+    eval_parser = subcmd_parsers.add_parser("eval",
+            help="evaluate an expression of set operations on playlists")
+    eval_parser.add_argument("expression",
+            action="store",
+            help="the expression, e.g. '(\"A\" | \"B\") - (\"C\" & \"D\")'")
+    eval_parser.add_argument("result",
+            action="store",
+            help="the playlist to save the result to")
+    eval_parser.add_argument("-j", "--jobs",
+            action="store",
+            required=False,
+            type=int,
+            default=1,
+            help="number of playlists to download concurrently")
+
+    verify_parser = subcmd_parsers.add_parser("verify",
+            help="verifies a given property of the libary")
+    verify_parser.add_argument("property",
+            action="store",
+            choices=["categorization"],
+            help="the property to check")
+    verify_parser.add_argument("-j", "--jobs",
+            action="store",
+            required=False,
+            type=int,
+            default=1,
+            help="number of pages to download concurrently")
+    verify_parser.add_argument("-c", "--config",
+            action="store",
+            required=False,
+            help="a JSON file with category rules like {\"categories\": {\"prefixes\": [...], \"patterns\": [...], \"playlists\": [...]}}")
+    verify_parser.add_argument("--prefix",
+            action="append",
+            help="categories are playlists with this prefix, may be given multiple times (default: \"A - \" to \"E - \")")
+    verify_parser.add_argument("--pattern",
+            action="append",
+            help="categories are playlists with a name matching this regular expression, may be given multiple times")
+    verify_parser.add_argument("--playlist",
+            action="append",
+            help="a playlist, that is a category, may be given multiple times")
+
+    watch_parser = subcmd_parsers.add_parser("watch",
+            help="keep the Release Radar and other playlists up to date periodically")
+    watch_parser.add_argument("-d", "--days",
+            action="store",
+            required=False,
+            type=int,
+            default=8,
+            help="max age of added titles in days")
+    watch_parser.add_argument("-n", "--interval",
+            action="store",
+            required=False,
+            type=int,
+            default=60,
+            help="minutes between two updates")
+    watch_parser.add_argument("-c", "--config",
+            action="store",
+            required=False,
+            help="a JSON file with set operations to evaluate on every update")
+    watch_parser.add_argument("-j", "--jobs",
+            action="store",
+            required=False,
+            type=int,
+            default=1,
+            help="number of artists to download concurrently")
+
+    snapshot_parser = subcmd_parsers.add_parser("snapshot",
+            help="store the libary in a local snapshot for --offline, only changes since the last snapshot are downloaded")
+    snapshot_parser.add_argument("-j", "--jobs",
+            action="store",
+            required=False,
+            type=int,
+            default=1,
+            help="number of pages and artists to download concurrently")
+
+    batch_parser = subcmd_parsers.add_parser("batch",
+            help="run the jobs of several accounts in one process, that share the metadata cache, the rate limit and the download of followed artists")
+    batch_parser.add_argument("config",
+            action="store",
+            help="a JSON file with the accounts and their jobs like {\"accounts\": [{\"name\": \"alice\", \"release_radar\": {\"days\": 8}, \"set_operations\": [...]}]}")
+    batch_parser.add_argument("-j", "--jobs",
+            action="store",
+            required=False,
+            type=int,
+            default=1,
+            help="number of artists and pages to download concurrently")
+    batch_parser.add_argument("-p", "--parallel",
+            action="store",
+            required=False,
+            type=int,
+            default=None,
+            help="number of accounts to run concurrently (default: all)")
+
+    parsed = parser.parse_args(args)
+    if parsed.offline and parsed.command in ["update", "watch", "snapshot", "batch"]:
+        parser.error(f"{parsed.command} can't run with --offline")
+    if parsed.plan and not parsed.command in ["update", "union", "intersection", "exclusion", "eval"]:
+        parser.error("--plan only works with update and the set operations")
+    return parsed
+
+
+def get_client_creds():
+    clientId=""
+    if "SPOTIFY_CLIENT_ID" in os.environ:
+        clientId = os.environ["SPOTIFY_CLIENT_ID"]
+    else:
+        clientId = getpass.getpass(prompt="Client ID: ", stream=None)
+    clientSecret = ""
+    if "SPOTIFY_CLIENT_SECRET" in os.environ:
+        clientSecret = os.environ["SPOTIFY_CLIENT_SECRET"]
+    else:
+        clientSecret = getpass.getpass(prompt="Client secret: ", stream=None)
+
+    return (clientId, clientSecret)
+
+
+
+def write_profile(profiler, parsed_args):
+    if parsed_args.profile:
+        print(profiler.format_table(), file=sys.stderr)
+    if parsed_args.profile_json != None:
+        with open(parsed_args.profile_json, "w") as f:
+            json.dump(profiler.to_json(), f, indent=2)
+    if parsed_args.profile_prometheus != None:
+        # The textfile collector must never read a partially written file:
+        with open(parsed_args.profile_prometheus + ".tmp", "w") as f:
+            f.write(profiler.to_prometheus())
+        os.replace(parsed_args.profile_prometheus + ".tmp", parsed_args.profile_prometheus)
+
+
+
+def open_snapshot(parsed_args):
+    from scriptify import api, snapshot
+    path = parsed_args.snapshot or snapshot.get_snapshot_path()
+    if not os.path.exists(path):
+        logging.error(f"There is no library snapshot at {path}, take one with \"scriptify snapshot\" first.")
+        return None
+    library = api.offline_library = snapshot.LibrarySnapshot(path)
+    taken = library.get_info("taken")
+    if taken == None:
+        logging.error(f"The library snapshot at {path} is incomplete, take it again with \"scriptify snapshot\".")
+        library.close()
+        return None
+    logging.info(f"Using library snapshot taken at {time.strftime('%Y-%m-%d %H:%M', time.localtime(taken))}.")
+    return library
+
+
+
+def main(args=None):
+    if args == None:
+        args = sys.argv[1:]
+    parsed = parse_args(args)
+
+    from scriptify import cache
+    # Offline, nothing is downloaded and older data of the snapshot must not replace cached metadata:
+    if not parsed.no_cache and not parsed.offline:
+        cache.metadata_cache = cache.MetadataCache(cache.get_cache_path(), refresh=parsed.refresh)
+    elif parsed.command in ["watch", "batch"]:
+        # Downloaded data is still kept in memory between updates and shared by the accounts of a batch:
+        cache.metadata_cache = cache.MetadataCache(":memory:")
+    profiler = None
+    if parsed.profile or parsed.profile_json != None or parsed.profile_prometheus != None:
+        from scriptify import api
+        profiler = api.request_profiler = api.RequestProfiler()
+
+    library = None
+    try:
+        if parsed.debug:
+            logging.basicConfig(level=logging.DEBUG, format="%(levelname)s: %(message)s")
+        else:
+            logging.basicConfig(level=logging.INFO, format="%(levelname)s: %(message)s")
+
+        if parsed.offline:
+            library = open_snapshot(parsed)
+            if library == None:
+                return
+            (clientId, clientSecret) = (None, None)
+        else:
+            (clientId, clientSecret) = get_client_creds()
+
+        if parsed.command != None:
+            from scriptify import commands
+            commands.run_command(parsed, clientId, clientSecret)
+
+    except KeyboardInterrupt:
+        logging.warning("Keyboard interrupt: Ending query early.")
+        exit()
+
+    finally:
+        cache.metadata_cache.close()
+        if library != None:
+            library.close()
+        if profiler != None:
+            write_profile(profiler, parsed)
+
+    logging.info("Done.")
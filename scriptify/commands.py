@@ -0,0 +1,626 @@
+# Implementations of the subcommands.
+
+import datetime
+import json
+import logging
+import os
+import re
+import requests
+import time
+import spotipy
+
+from concurrent.futures import ThreadPoolExecutor
+
+from scriptify import api, cache
+from scriptify.api import FairScheduler, connect_public, connect_user, get_token_path
+from scriptify.expressions import (ExpressionError, evaluate_set_expression, format_expression,
+        get_expression_playlists, parse_expression, simplify_expression)
+from scriptify.library import (CategoryRules, get_followed_artists, get_new_tracks, get_release_radar_tracks,
+        get_saved_tracks, iter_new_tracks, map_artists)
+from scriptify.model import RELEASE_RADAR_GROUPS, Playlist, PlaylistDirectory
+from scriptify.sets import (decode_track_id, encode_track_id, intersection, set_exclusion, track_id_set,
+        tracks_from_id_set, union)
+
+
+##
+# Implementations of the main commands:
+##
+
+
+def run_command(parsed_args, clientId, clientSecret):
+    if parsed_args.plan:
+        plan_command(parsed_args, clientId, clientSecret)
+
+    elif parsed_args.command == "update":
+        period = datetime.timedelta(days=parsed_args.days)
+        update_release_radar(clientId, clientSecret, period=period, jobs=parsed_args.jobs,
+                incremental=parsed_args.incremental, async_requests=parsed_args.async_requests)
+
+    elif parsed_args.command == "show":
+        period = datetime.timedelta(days=parsed_args.days)
+        print_new_albums(clientId, clientSecret, period=period, jobs=parsed_args.jobs)
+
+    elif parsed_args.command == "union":
+        set_operation(parsed_args, clientId, clientSecret, union)
+
+    elif parsed_args.command == "intersection":
+        set_operation(parsed_args, clientId, clientSecret, intersection)
+
+    elif parsed_args.command == "exclusion":
+        set_operation(parsed_args, clientId, clientSecret, set_exclusion)
+
+    elif parsed_args.command == "eval":
+        evaluate_expression(parsed_args, clientId, clientSecret)
+
+    elif parsed_args.command == "verify":
+        if parsed_args.property == "categorization":
+            rules = get_category_rules(parsed_args)
+            if rules != None:
+                verify_categorization(clientId, clientSecret, jobs=parsed_args.jobs, rules=rules)
+
+    elif parsed_args.command == "watch":
+        period = datetime.timedelta(days=parsed_args.days)
+        watch(clientId, clientSecret, period, parsed_args.interval * 60, jobs=parsed_args.jobs,
+                config_path=parsed_args.config)
+
+    elif parsed_args.command == "snapshot":
+        take_snapshot(clientId, clientSecret, parsed_args.snapshot, jobs=parsed_args.jobs)
+
+    elif parsed_args.command == "batch":
+        run_batch(clientId, clientSecret, parsed_args.config, jobs=parsed_args.jobs, parallel=parsed_args.parallel)
+
+
+def update_release_radar(clientId, clientSecret, period, jobs=1, incremental=False, async_requests=0):
+    asyncClient = None
+    if async_requests > 0:
+        from scriptify import aio
+        if not aio.is_available():
+            logging.error("Downloading with --async requires aiohttp, install it with \"pip install aiohttp\".")
+            return
+        if incremental:
+            logging.error("--async can't be combined with --incremental.")
+            return
+
+    logging.info("Updating playlist Release Radar...")
+
+    logging.debug("Connecting to Spotify...")
+    accessScopes = ["user-follow-read", "playlist-modify-private", "playlist-read-private"]
+    spotifyAccessPrivate = connect_user(clientId, clientSecret, accessScopes, jobs=jobs)
+    spotifyAccessPublic = connect_public(clientId, clientSecret, jobs=jobs)
+    logging.info("Connected to Spotify.")
+    if async_requests > 0:
+        asyncClient = aio.AsyncSpotifyClient(spotifyAccessPublic.auth_manager, limiter=spotifyAccessPublic.limiter,
+                concurrency=async_requests)
+
+    refresh_release_radar(spotifyAccessPublic, spotifyAccessPrivate, period, jobs=jobs, incremental=incremental,
+            async_client=asyncClient)
+
+
+def refresh_release_radar(spotifyAccessPublic, spotifyAccessPrivate, period, jobs=1, incremental=False, async_client=None):
+    rrplaylist = get_release_radar_playlist(spotifyAccessPrivate)
+    newTracks = get_new_tracks(spotifyAccessPublic, spotifyAccessPrivate, period, jobs=jobs, incremental=incremental,
+            async_client=async_client)
+    write_release_radar(spotifyAccessPrivate, rrplaylist, (track for (artist, track) in newTracks))
+
+
+def get_release_radar_playlist(spotifyAccessPrivate):
+    # Make sure the playlist "Release Radar" exists:
+    rrplaylist = Playlist.by_name(spotifyAccessPrivate, "Release Radar")
+    if rrplaylist == None:
+        logging.debug("Creating new playlists...")
+        rrplaylist = Playlist.create_playlist(spotifyAccessPrivate, "Release Radar",
+                description="Automatically generated list of new releases of followed artists.")
+        logging.debug("Created new playlists.")
+    return rrplaylist
+
+
+def write_release_radar(spotifyAccessPrivate, rrplaylist, tracks):
+    newUniqueTracks = get_release_radar_tracks(tracks)
+
+    logging.debug("Replace tracks of playlist...")
+    if not rrplaylist.update_tracks(spotifyAccess=spotifyAccessPrivate, tracks=newUniqueTracks):
+        print("Could not update playlist.")
+
+
+def print_new_albums(clientId, clientSecret, period, jobs=1):
+    logging.info("Printing new albums:")
+
+    periodStart = datetime.datetime.utcnow() - period
+    def is_current(album):
+        return album.release_date > periodStart
+    def get_albums(artist):
+        return artist.get_albums_since(spotifyAccessPublic, periodStart, include_groups=["album", "single"])
+
+    logging.debug("Connecting to Spotify...")
+    accessScopes = ["user-follow-read", "playlist-modify-private", "playlist-read-private"]
+    spotifyAccessPrivate = connect_user(clientId, clientSecret, accessScopes, jobs=jobs)
+    spotifyAccessPublic = connect_public(clientId, clientSecret, jobs=jobs)
+    logging.debug("Connected to Spotify.")
+
+    artists = get_followed_artists(spotifyAccessPrivate)
+    for (artist, albums) in map_artists(get_albums, artists, jobs=jobs):
+        print(artist.name + ":")
+        for album in albums:
+            if is_current(album) and not album.is_collection() and album.is_done_by_artist(artist.id):
+                print(album.release_date.strftime("%Y-%m-%d") + " " + album.name)
+        print()
+
+
+def set_operation(parsed_args, client_id, client_secret, operation):
+    logging.debug("Connecting to Spotify...")
+    accessScopes = ["playlist-modify-private", "playlist-read-private"]
+    spotifyAccess = connect_user(client_id, client_secret, accessScopes, jobs=parsed_args.jobs)
+    logging.debug("Connected to Spotify.")
+
+    apply_set_operation(spotifyAccess, parsed_args.in_playlist, parsed_args.result, operation)
+
+
+def apply_set_operation(spotifyAccess, in_playlist_names, result_name, operation):
+    input_sets = []
+    for playlist_name in in_playlist_names:
+        playlist = Playlist.by_name(spotifyAccess, playlist_name)
+        if playlist == None:
+            logging.error("There is no playlist with name " + playlist_name)
+            return
+        else:
+            input_sets.append(track_id_set(playlist.get_track_ids(spotifyAccess)))
+
+    target_playlist = Playlist.by_name(spotifyAccess, result_name)
+    if target_playlist == None:
+        target_playlist = Playlist.create_playlist(spotifyAccess, result_name)
+
+    resulting_set = operation(spotifyAccess, input_sets)
+    target_playlist.update_tracks(spotifyAccess, tracks_from_id_set(resulting_set), ordered=False)
+
+
+def evaluate_expression(parsed_args, client_id, client_secret):
+    try:
+        expression = simplify_expression(parse_expression(parsed_args.expression))
+    except ExpressionError as err:
+        logging.error("Could not parse expression: " + str(err))
+        return
+    logging.debug("Evaluating " + format_expression(expression))
+
+    logging.debug("Connecting to Spotify...")
+    accessScopes = ["playlist-modify-private", "playlist-read-private"]
+    spotifyAccess = connect_user(client_id, client_secret, accessScopes, jobs=parsed_args.jobs)
+    logging.debug("Connected to Spotify.")
+
+    apply_expression(spotifyAccess, expression, parsed_args.result, jobs=parsed_args.jobs)
+
+
+def apply_expression(spotifyAccess, expression, result_name, jobs=1):
+    # Every playlist is fetched exactly once, even if it occurs multiple times in the expression:
+    playlists = []
+    for playlist_name in get_expression_playlists(expression):
+        playlist = Playlist.by_name(spotifyAccess, playlist_name)
+        if playlist == None:
+            logging.error("There is no playlist with name " + playlist_name)
+            return
+        playlists.append(playlist)
+
+    def get_id_set(playlist):
+        return track_id_set(playlist.get_track_ids(spotifyAccess))
+    input_sets = {}
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as executor:
+        for (playlist, id_set) in zip(playlists, executor.map(get_id_set, playlists)):
+            input_sets[playlist.name] = id_set
+
+    target_playlist = Playlist.by_name(spotifyAccess, result_name)
+    if target_playlist == None:
+        target_playlist = Playlist.create_playlist(spotifyAccess, result_name)
+
+    resulting_set = evaluate_set_expression(spotifyAccess, expression, input_sets)
+    target_playlist.update_tracks(spotifyAccess, tracks_from_id_set(resulting_set), ordered=False)
+
+
+def get_category_rules(parsed_args):
+    # Rules are read from the "categories" object of a JSON file and extended by the command line:
+    path = parsed_args.config
+    try:
+        config = load_config(path).get("categories", {}) if path != None else {}
+        if not isinstance(config, dict):
+            raise ConfigError(f"\"categories\" in config file {path} has to be an object.")
+        for key in ["prefixes", "patterns", "playlists"]:
+            values = config.get(key, [])
+            if not isinstance(values, list) or not all(isinstance(value, str) for value in values):
+                raise ConfigError(f"\"{key}\" of \"categories\" in config file {path} has to be a list of strings.")
+    except ConfigError as err:
+        logging.error(str(err))
+        return None
+    try:
+        return CategoryRules.from_config(config, parsed_args.prefix or [], parsed_args.pattern or [],
+                parsed_args.playlist or [])
+    except re.error as err:
+        logging.error("Could not parse pattern of category playlists: " + str(err))
+        return None
+
+
+def verify_categorization(client_id, client_secret, jobs=1, rules=None):
+    logging.info("Verifying categorization...")
+
+    logging.debug("Connecting to Spotify...")
+    accessScopes = ["user-library-read", "playlist-read-private"]
+    spotifyAccess = connect_user(client_id, client_secret, accessScopes, jobs=jobs)
+    logging.info("Connected to Spotify.")
+
+    check_categorization(spotifyAccess, jobs=jobs, rules=rules)
+
+
+def check_categorization(spotifyAccess, jobs=1, rules=None):
+    if rules == None:
+        rules = CategoryRules()
+
+    # Get all playlist, that form the categories:
+    directory = PlaylistDirectory.of(spotifyAccess)
+    categories = [item for item in directory.get_items() if rules.matches(item["name"])]
+    for name in sorted(rules.playlists.difference(item["name"] for item in categories)):
+        logging.warning("There is no playlist with name " + name)
+    def get_id_set(item):
+        return track_id_set(Playlist.from_directory_item(directory, item).get_track_ids(spotifyAccess))
+
+    # The categories are downloaded by workers, while the saved tracks are downloaded:
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as executor:
+        category_sets = [(item["name"], executor.submit(get_id_set, item)) for item in categories]
+
+        # Map IDs of saved tracks to their names, only tracks saved since the last run are downloaded:
+        libary_tracks = {}
+        for item in get_saved_tracks(spotifyAccess, jobs=jobs):
+            if item["track"]["id"] != None:
+                libary_tracks[decode_track_id(item["track"]["id"])] = item["track"]["name"]
+
+        # One pass over all categories finds the categorized tracks and those in several categories:
+        categorized_tracks = {}
+        duplicated_tracks = {}
+        for (name, future) in category_sets:
+            for track_number in future.result():
+                first_category = categorized_tracks.setdefault(track_number, name)
+                if first_category != name:
+                    duplicated_tracks.setdefault(track_number, [first_category]).append(name)
+
+    # Print uncategorized tracks:
+    print("Uncategorized tracks:")
+    for track_number in set(libary_tracks).difference(categorized_tracks):
+        print(libary_tracks[track_number])
+    # Print categorized but unsaved tracks, their names are unknown:
+    print("\nCategorized but not saved tracks:")
+    for track_number in set(categorized_tracks).difference(libary_tracks):
+        print(encode_track_id(track_number))
+    # Print tracks in more than one category with their categories:
+    print("\nTracks in several categories:")
+    for (track_number, names) in duplicated_tracks.items():
+        print(libary_tracks.get(track_number, encode_track_id(track_number)) + ": " + ", ".join(names))
+
+
+def take_snapshot(client_id, client_secret, path=None, jobs=1):
+    from scriptify import snapshot
+    if path == None:
+        path = snapshot.get_snapshot_path()
+    logging.info("Taking snapshot of the libary...")
+
+    logging.debug("Connecting to Spotify...")
+    accessScopes = ["user-library-read", "user-follow-read", "playlist-read-private"]
+    spotifyAccessPrivate = connect_user(client_id, client_secret, accessScopes, jobs=jobs)
+    spotifyAccessPublic = connect_public(client_id, client_secret, jobs=jobs)
+    logging.info("Connected to Spotify.")
+
+    library = snapshot.LibrarySnapshot(path)
+    try:
+        library.update(spotifyAccessPrivate, spotifyAccessPublic, jobs=jobs)
+    finally:
+        library.close()
+    logging.info("Stored snapshot of the libary at " + path + ".")
+
+
+def plan_command(parsed_args, client_id, client_secret):
+    # Prints the requests a command would send and the changes it would make, without making them.
+    from scriptify import plan
+    if parsed_args.command == "eval":
+        try:
+            expression = simplify_expression(parse_expression(parsed_args.expression))
+        except ExpressionError as err:
+            logging.error("Could not parse expression: " + str(err))
+            return
+    elif parsed_args.command != "update":
+        expression = (parsed_args.command, [("playlist", name) for name in parsed_args.in_playlist])
+    logging.info("Planning requests...")
+
+    logging.debug("Connecting to Spotify...")
+    accessScopes = ["user-follow-read", "playlist-read-private"]
+    spotifyAccessPrivate = connect_user(client_id, client_secret, accessScopes, jobs=parsed_args.jobs)
+    logging.debug("Connected to Spotify.")
+
+    requestPlan = plan.RequestPlan()
+    if parsed_args.command == "update":
+        spotifyAccessPublic = connect_public(client_id, client_secret, jobs=parsed_args.jobs)
+        plan.plan_release_radar(requestPlan, spotifyAccessPublic, spotifyAccessPrivate,
+                datetime.timedelta(days=parsed_args.days), jobs=parsed_args.jobs, incremental=parsed_args.incremental)
+    else:
+        plan.plan_expression(requestPlan, spotifyAccessPrivate, expression, parsed_args.result)
+    print(requestPlan.format_table())
+
+
+##
+# Long running mode, that keeps clients and downloaded data between periodic updates:
+##
+
+
+class ReleaseRadarWatcher:
+    # Keeps the new tracks of every followed artist between the ticks of watch. On every tick only
+    # the number of albums of each artist is requested. The albums of an artist are downloaded again
+    # only, if that number changed.
+    def __init__(self, spotifyAccessPublic, spotifyAccessPrivate, period, jobs=1):
+        self.spotifyAccessPublic = spotifyAccessPublic
+        self.spotifyAccessPrivate = spotifyAccessPrivate
+        self.period = period
+        self.jobs = jobs
+        self.album_counts = {}
+        self.artist_tracks = {}
+        self.playlist = None
+
+    def tick(self):
+        def get_album_count(artist):
+            return artist.get_album_count(self.spotifyAccessPublic, include_groups=RELEASE_RADAR_GROUPS)
+
+        artists = get_followed_artists(self.spotifyAccessPrivate)
+        followedIds = set(artist.id for artist in artists)
+        for artistId in list(self.album_counts):
+            if not artistId in followedIds:
+                del self.album_counts[artistId]
+                del self.artist_tracks[artistId]
+
+        changedArtists = []
+        newCounts = {}
+        for (artist, count) in map_artists(get_album_count, artists, jobs=self.jobs):
+            if self.album_counts.get(artist.id) != count:
+                changedArtists.append(artist)
+                newCounts[artist.id] = count
+        logging.info(f"{len(changedArtists)} of {len(artists)} followed artists have changed albums.")
+
+        # Cached albums of changed artists are outdated:
+        changedTracks = {artist.id: [] for artist in changedArtists}
+        for (artist, track) in iter_new_tracks(self.spotifyAccessPublic, changedArtists, self.period,
+                jobs=self.jobs, incremental=True, use_cache=False):
+            changedTracks[artist.id].append(track)
+        self.artist_tracks.update(changedTracks)
+        self.album_counts.update(newCounts)
+
+        # Tracks of unchanged artists may have left the period since the last tick:
+        periodStart = datetime.datetime.utcnow() - self.period
+        tracks = []
+        for artist in artists:
+            for track in self.artist_tracks[artist.id]:
+                if track.album.release_date > periodStart:
+                    tracks.append(track)
+
+        if self.playlist == None:
+            self.playlist = get_release_radar_playlist(self.spotifyAccessPrivate)
+        elif self.playlist.tracks != None:
+            # The playlist is only downloaded again, if it was changed by someone else:
+            snapshotId = self.spotifyAccessPrivate.playlist(self.playlist.id, fields="snapshot_id")["snapshot_id"]
+            if snapshotId != self.playlist.snapshot_id:
+                self.playlist.tracks = None
+        write_release_radar(self.spotifyAccessPrivate, self.playlist, tracks)
+
+
+def watch(client_id, client_secret, period, interval, jobs=1, config_path=None):
+    # Expressions of set operations, that are evaluated on every tick, are read from a JSON file like
+    # {"set_operations": [{"expression": "\"A\" | \"B\"", "result": "A or B"}]}.
+    try:
+        setOperations = get_set_operations(load_config(config_path) if config_path != None else {})
+    except ConfigError as err:
+        logging.error(str(err))
+        return
+
+    logging.debug("Connecting to Spotify...")
+    accessScopes = ["user-follow-read", "playlist-modify-private", "playlist-read-private"]
+    spotifyAccessPrivate = connect_user(client_id, client_secret, accessScopes, jobs=jobs)
+    spotifyAccessPublic = connect_public(client_id, client_secret, jobs=jobs)
+    logging.info("Connected to Spotify.")
+
+    watcher = ReleaseRadarWatcher(spotifyAccessPublic, spotifyAccessPrivate, period, jobs=jobs)
+    while True:
+        tickStart = time.monotonic()
+        logging.info("Updating playlists...")
+        try:
+            PlaylistDirectory.of(spotifyAccessPrivate).refresh()
+            watcher.tick()
+            for (expression, result_name) in setOperations:
+                logging.info(f"Updating playlist \"{result_name}\"...")
+                apply_expression(spotifyAccessPrivate, expression, result_name, jobs=jobs)
+        except (spotipy.exceptions.SpotifyException, requests.exceptions.RequestException) as err:
+            # The next tick starts from the state of the last successful one:
+            logging.error("Could not update playlists: " + str(err))
+        cache.metadata_cache.flush()
+
+        remaining = interval - (time.monotonic() - tickStart)
+        logging.info(f"Next update in {max(remaining, 0) / 60:.0f} minutes.")
+        time.sleep(max(remaining, 0))
+
+
+##
+# JSON config files of the commands:
+##
+
+
+class ConfigError(Exception):
+    pass
+
+
+def load_config(path):
+    # Returns the JSON object in the file at path.
+    try:
+        with open(path) as f:
+            config = json.load(f)
+    except OSError as err:
+        raise ConfigError(f"Could not read config file {path}: {err.strerror}")
+    except json.JSONDecodeError as err:
+        raise ConfigError(f"Could not parse config file {path}: {err}")
+    if not isinstance(config, dict):
+        raise ConfigError(f"Config file {path} doesn't contain a JSON object.")
+    return config
+
+
+def get_set_operations(config, context=""):
+    # Returns the parsed expressions and result names of the "set_operations" of a config, e.g.
+    # [{"expression": "\"A\" | \"B\"", "result": "A or B"}]. The context is added to errors.
+    jobs = config.get("set_operations", [])
+    if not isinstance(jobs, list):
+        raise ConfigError(f"\"set_operations\"{context} is not a list.")
+    setOperations = []
+    for job in jobs:
+        if not isinstance(job, dict) or not isinstance(job.get("expression"), str) \
+                or not isinstance(job.get("result"), str):
+            raise ConfigError(f"Set operations{context} need an \"expression\" and a \"result\": {json.dumps(job)}")
+        try:
+            setOperations.append((simplify_expression(parse_expression(job["expression"])), job["result"]))
+        except ExpressionError as err:
+            raise ConfigError(f"Could not parse expression of \"{job['result']}\"{context}: {err}")
+    return setOperations
+
+
+##
+# Batches of jobs of several accounts in one process:
+##
+
+
+# Data of the accounts of a batch is cached apart from the data of single runs, which use "me":
+BATCH_ACCOUNT_PREFIX = "batch:"
+ACCOUNT_NAME_PATTERN = re.compile(r"[A-Za-z0-9_.-]+")
+
+
+class AccountJobs:
+    # The jobs of one account of a batch and its client.
+    def __init__(self, name, release_radar=None, set_operations=(), token_path=None):
+        self.name = name
+        self.release_radar = release_radar
+        self.set_operations = list(set_operations)
+        self.token_path = token_path
+        self.client = None
+        self.artists = None
+
+    def from_config(config):
+        # Takes a JSON object like {"name": "alice", "release_radar": {"days": 8, "incremental": false},
+        # "set_operations": [{"expression": "\"A\" | \"B\"", "result": "A or B"}]}.
+        if not isinstance(config, dict):
+            raise ConfigError(f"Accounts have to be JSON objects: {json.dumps(config)}")
+        name = config.get("name")
+        if not isinstance(name, str) or ACCOUNT_NAME_PATTERN.fullmatch(name) == None:
+            raise ConfigError(f"Accounts need a \"name\" of letters, digits, \".\", \"_\" and \"-\": {json.dumps(config)}")
+        context = f" of account \"{name}\""
+        releaseRadar = config.get("release_radar")
+        if releaseRadar == True:
+            releaseRadar = {}
+        if isinstance(releaseRadar, dict):
+            days = releaseRadar.get("days", 8)
+            incremental = releaseRadar.get("incremental", False)
+            if not isinstance(days, int) or isinstance(days, bool) or days <= 0 or not isinstance(incremental, bool):
+                raise ConfigError(f"\"release_radar\"{context} needs a positive number of \"days\" and a boolean \"incremental\".")
+            releaseRadar = (datetime.timedelta(days=days), incremental)
+        elif releaseRadar != None and releaseRadar != False:
+            raise ConfigError(f"\"release_radar\"{context} has to be true or an object.")
+        else:
+            releaseRadar = None
+        tokenPath = config.get("token_path")
+        if tokenPath != None and not isinstance(tokenPath, str):
+            raise ConfigError(f"\"token_path\"{context} has to be a string.")
+        return AccountJobs(name, releaseRadar, get_set_operations(config, context), tokenPath)
+
+
+def run_batch(client_id, client_secret, config_path, jobs=1, parallel=None):
+    # Runs the jobs of the accounts in a JSON file like {"redirect_uri": "http://127.0.0.1:9090",
+    # "accounts": [...]}, see AccountJobs.from_config. All accounts share the metadata cache, the rate
+    # limiter and one client for the public catalogue. The discography of an artist followed by
+    # several accounts is downloaded once.
+    try:
+        (config, accounts) = load_batch_config(config_path)
+    except ConfigError as err:
+        logging.error(str(err))
+        return
+    if parallel == None:
+        parallel = max(1, len(accounts))
+
+    # Requests of the accounts take turns at the rate limiter, the catalogue counts as an account:
+    scheduler = FairScheduler(api.rate_limiter)
+    spotifyAccessPublic = connect_public(client_id, client_secret, jobs=jobs, limiter=scheduler.get_limiter(""))
+    # Authorization may need the browser, so the accounts are connected one after another:
+    accessScopes = ["user-follow-read", "playlist-modify-private", "playlist-read-private"]
+    for account in accounts:
+        logging.info(f"Connecting account \"{account.name}\"...")
+        tokenPath = account.token_path or get_token_path(account.name)
+        os.makedirs(os.path.dirname(os.path.abspath(tokenPath)), exist_ok=True)
+        account.client = connect_user(client_id, client_secret, accessScopes, jobs=jobs,
+                limiter=scheduler.get_limiter(account.name), account=BATCH_ACCOUNT_PREFIX + account.name,
+                token_path=tokenPath, redirect_uri=config.get("redirect_uri"))
+        try:
+            logging.info(f"Connected account \"{account.name}\" as user {account.client.current_user()['id']}.")
+        except (spotipy.exceptions.SpotifyException, spotipy.oauth2.SpotifyOauthError,
+                requests.exceptions.RequestException) as err:
+            logging.error(f"Could not connect account \"{account.name}\": " + str(err))
+            account.client = None
+    accounts = [account for account in accounts if account.client != None]
+
+    def list_artists(account):
+        account.artists = get_followed_artists(account.client)
+
+    def write_playlists(account):
+        if account.release_radar != None:
+            logging.info(f"Updating playlist Release Radar of account \"{account.name}\"...")
+            tracks = [track for artist in account.artists for track in newTracks[account.release_radar][artist.id]]
+            write_release_radar(account.client, get_release_radar_playlist(account.client), tracks)
+        for (expression, result_name) in account.set_operations:
+            logging.info(f"Updating playlist \"{result_name}\" of account \"{account.name}\"...")
+            apply_expression(account.client, expression, result_name, jobs=jobs)
+
+    releaseRadarAccounts = [account for account in accounts if account.release_radar != None]
+    accounts = run_account_jobs(list_artists, releaseRadarAccounts, parallel) \
+            + [account for account in accounts if account.release_radar == None]
+
+    # New tracks are found once per artist and period for all accounts, that follow the artist:
+    followedArtists = {}
+    for account in accounts:
+        if account.release_radar != None:
+            followedArtists.setdefault(account.release_radar, {}).update((artist.id, artist) for artist in account.artists)
+    newTracks = {}
+    for ((period, incremental), artists) in followedArtists.items():
+        followCount = sum(len(account.artists) for account in accounts if account.release_radar == (period, incremental))
+        logging.info(f"Downloading new tracks of {len(artists)} distinct artists of {followCount} followed ones...")
+        artistTracks = {id: [] for id in artists}
+        for (artist, track) in iter_new_tracks(spotifyAccessPublic, list(artists.values()), period, jobs=jobs,
+                incremental=incremental):
+            artistTracks[artist.id].append(track)
+        newTracks[(period, incremental)] = artistTracks
+
+    run_account_jobs(write_playlists, accounts, parallel)
+    cache.metadata_cache.flush()
+
+
+def load_batch_config(path):
+    config = load_config(path)
+    if not isinstance(config.get("accounts", []), list):
+        raise ConfigError("\"accounts\" has to be a list.")
+    if not isinstance(config.get("redirect_uri", ""), str):
+        raise ConfigError("\"redirect_uri\" has to be a string.")
+    accounts = [AccountJobs.from_config(account) for account in config.get("accounts", [])]
+    if len(accounts) == 0:
+        raise ConfigError(f"Config file {path} contains no accounts.")
+    names = [account.name for account in accounts]
+    for name in names:
+        if names.count(name) > 1:
+            raise ConfigError(f"Account \"{name}\" is listed more than once.")
+    return (config, accounts)
+
+
+def run_account_jobs(function, accounts, parallel):
+    # Runs the function for up to parallel accounts at once and returns the accounts, for which it
+    # succeeded. A failing account doesn't stop the others.
+    def run(account):
+        try:
+            function(account)
+            return True
+        except (spotipy.exceptions.SpotifyException, requests.exceptions.RequestException) as err:
+            logging.error(f"Could not run jobs of account \"{account.name}\": " + str(err))
+            return False
+
+    with ThreadPoolExecutor(max_workers=max(1, parallel)) as executor:
+        return [account for (account, ok) in zip(accounts, executor.map(run, accounts)) if ok]
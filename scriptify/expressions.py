@@ -0,0 +1,147 @@
+# A small language for expressions of set operations on playlists.
+
+import json
+
+from scriptify.sets import intersection, set_exclusion, union
+
+
+##
+# Expressions of set operations on playlists, e.g. ("A" | "B") - ("C" & "D"). Union (|, +, ∪) and
+# exclusion (-, \) bind weaker than intersection (&, ∩). Names containing spaces or operators have to
+# be quoted. Expressions are trees of tuples ("playlist", name) or (operator, [operands]).
+##
+
+
+class ExpressionError(Exception):
+    pass
+
+
+EXPRESSION_OPERATORS = {
+    "|": "union", "+": "union", "∪": "union",
+    "-": "exclusion", "\\": "exclusion",
+    "&": "intersection", "∩": "intersection",
+}
+EXPRESSION_FUNCTIONS = {
+    "union": union,
+    "intersection": intersection,
+    "exclusion": set_exclusion,
+}
+
+
+def tokenize_expression(text):
+    tokens = []
+    i = 0
+    while i < len(text):
+        char = text[i]
+        if char.isspace():
+            i += 1
+        elif char in EXPRESSION_OPERATORS or char in "()":
+            tokens.append(char)
+            i += 1
+        elif char in "\"'":
+            end = text.find(char, i + 1)
+            if end < 0:
+                raise ExpressionError(f"unterminated quote at position {i}")
+            tokens.append(("name", text[(i + 1):end]))
+            i = end + 1
+        else:
+            start = i
+            while i < len(text) and not (text[i].isspace() or text[i] in EXPRESSION_OPERATORS
+                    or text[i] in "()\"'"):
+                i += 1
+            tokens.append(("name", text[start:i]))
+    return tokens
+
+
+def parse_expression(text):
+    tokens = tokenize_expression(text)
+    position = 0
+
+    def peek():
+        return tokens[position] if position < len(tokens) else None
+
+    def parse_binary(parse_operand, operators):
+        nonlocal position
+        res = parse_operand()
+        while peek() in operators:
+            operator = EXPRESSION_OPERATORS[peek()]
+            position += 1
+            res = (operator, [res, parse_operand()])
+        return res
+
+    def parse_sum():
+        return parse_binary(parse_product, ["|", "+", "∪", "-", "\\"])
+
+    def parse_product():
+        return parse_binary(parse_primary, ["&", "∩"])
+
+    def parse_primary():
+        nonlocal position
+        token = peek()
+        position += 1
+        if token == "(":
+            res = parse_sum()
+            if peek() != ")":
+                raise ExpressionError("missing closing parenthesis")
+            position += 1
+            return res
+        if isinstance(token, tuple):
+            return ("playlist", token[1])
+        raise ExpressionError("expected playlist name or \"(\", found " + repr(token))
+
+    res = parse_sum()
+    if position < len(tokens):
+        raise ExpressionError("unexpected " + repr(tokens[position]))
+    return res
+
+
+def simplify_expression(expression):
+    # Nested unions and intersections are flattened, duplicate operands are dropped and chains of
+    # exclusions are merged into one.
+    (operator, operands) = expression
+    if operator == "playlist":
+        return expression
+
+    res = []
+    for (i, operand) in enumerate(operands):
+        operand = simplify_expression(operand)
+        if operand[0] == operator and (operator != "exclusion" or i == 0):
+            nested = operand[1]
+        else:
+            nested = [operand]
+        for operand in nested:
+            if operator == "exclusion" or not operand in res:
+                res.append(operand)
+    if len(res) == 1:
+        return res[0]
+    return (operator, res)
+
+
+def get_expression_playlists(expression):
+    (operator, operands) = expression
+    if operator == "playlist":
+        return [operands]
+
+    res = []
+    for operand in operands:
+        for name in get_expression_playlists(operand):
+            if not name in res:
+                res.append(name)
+    return res
+
+
+def evaluate_set_expression(spotifyAccess, expression, input_sets):
+    (operator, operands) = expression
+    if operator == "playlist":
+        return input_sets[operands]
+
+    operand_sets = [evaluate_set_expression(spotifyAccess, operand, input_sets) for operand in operands]
+    return EXPRESSION_FUNCTIONS[operator](spotifyAccess, operand_sets)
+
+
+def format_expression(expression):
+    (operator, operands) = expression
+    if operator == "playlist":
+        return json.dumps(operands, ensure_ascii=False)
+    symbol = {"union": " | ", "intersection": " & ", "exclusion": " - "}[operator]
+    return "(" + symbol.join(format_expression(operand) for operand in operands) + ")"
@@ -0,0 +1,298 @@
+# Functions to query the libary of the current user, e.g. the new tracks of followed artists.
+
+import collections
+import datetime
+import gc
+import logging
+import re
+
+from concurrent.futures import ThreadPoolExecutor
+
+from scriptify import cache
+from scriptify import model
+from scriptify.api import iter_complete_list
+from scriptify.model import MAX_ITEMS, RELEASE_RADAR_GROUPS, AlbumQueue, compact_track_item
+
+
+# Parts of track titles, that are ignored when comparing titles. Only annotations, that consist of
+# nothing but a version, are dropped, so e.g. "Song - With Love" stays a different title:
+TITLE_VERSION = r"(?:(?:\d{4}\s+)?remaster(?:ed)?(?:\s+\d{4})?(?:\s+version)?|(?:mono|stereo)(?:\s+version)?|radio\s+edit)"
+TITLE_ANNOTATION_PATTERN = re.compile(
+        r"\s*[(\[](?:feat\.?|ft\.?|featuring|with|prod\.?)\s[^)\]]*[)\]]"
+        r"|\s*[(\[]" + TITLE_VERSION + r"[)\]]",
+        re.IGNORECASE)
+TITLE_SUFFIX_PATTERN = re.compile(r"\s+-\s+(?:" + TITLE_VERSION + r"|(?:feat\.?|ft\.?)\s.*)$", re.IGNORECASE)
+# Number of artists processed between collections of their albums, which contain reference cycles:
+GC_INTERVAL = 100
+# Prefixes of the names of category playlists, unless other category rules are given:
+DEFAULT_CATEGORY_PREFIXES = ["A - ", "B - ", "C - ", "D - ", "E - "]
+
+
+##
+# Functions to handle functions on the libary:
+##
+
+
+def get_followed_artists(spotifyAccess):
+    return list(iter_followed_artists(spotifyAccess))
+
+
+def iter_followed_artists(spotifyAccess):
+    # Yields the followed artists page by page, the next page is only requested when needed.
+    logging.debug("Downloading list of followed artists...")
+
+    totalFollowed = -1
+    lastId = None
+    i = 0
+
+    while i < totalFollowed or totalFollowed < 0:
+        logging.debug("Requesting page of followed artists...")
+        results = spotifyAccess.current_user_followed_artists(limit = MAX_ITEMS, after=lastId)
+        logging.debug("Received page of followed artists.")
+
+        lastId = results["artists"]["cursors"]["after"]
+        assert lastId == results["artists"]["items"][-1]["id"] or (len(results["artists"]["items"]) < MAX_ITEMS and lastId == None)
+        assert results["artists"]["limit"] == MAX_ITEMS
+
+        if totalFollowed == -1:
+            totalFollowed = results["artists"]["total"]
+        else:
+            assert totalFollowed == results["artists"]["total"]
+
+        for item in results["artists"]["items"]:
+            yield model.registry.get_artist(item["id"], item["name"], item["popularity"])
+            i += 1
+
+    logging.debug("Downloaded list of followed artists.")
+
+
+class TrackDeduplicator:
+    # Remembers tracks by ID and optionally by normalized title in hash sets, so every check takes
+    # constant time.
+    def __init__(self, by_title=False):
+        self.by_title = by_title
+        self.ids = set()
+        self.titles = set()
+
+    def add(self, track):
+        # Returns whether the track was not seen before and remembers it.
+        if track.id in self.ids:
+            return False
+        if self.by_title:
+            title = normalize_track_title(track.name)
+            if title in self.titles:
+                return False
+            self.titles.add(title)
+        self.ids.add(track.id)
+        return True
+
+
+def get_release_radar_tracks(tracks):
+    def get_track_release_date(track):
+        return track.album.release_date
+
+    # Determine new tracks and make sure all ids are unique:
+    logging.debug("Determining unique new track IDs:")
+    newUniqueTracks = []
+    foundTracks = TrackDeduplicator()
+    for track in tracks:
+        if foundTracks.add(track):
+            newUniqueTracks.append(track)
+
+    # Sort tracks by release date:
+    newUniqueTracks.sort(key=get_track_release_date, reverse=False)
+    return newUniqueTracks
+
+
+def normalize_track_title(title):
+    # Versions of the same song, e.g. "Song - Remastered 2011" or "Song (feat. Someone)", get the same
+    # title:
+    title = TITLE_SUFFIX_PATTERN.sub("", title)
+    title = TITLE_ANNOTATION_PATTERN.sub("", title)
+    return " ".join(title.casefold().split())
+
+
+class CategoryRules:
+    # Decides, which playlists categorize the saved tracks: playlists whose names start with one of
+    # the prefixes, contain a match of one of the regular expressions or are listed by name.
+    def __init__(self, prefixes=(), patterns=(), playlists=()):
+        self.prefixes = tuple(prefixes)
+        self.patterns = [re.compile(pattern) for pattern in patterns]
+        self.playlists = set(playlists)
+        if len(self.prefixes) == 0 and len(self.patterns) == 0 and len(self.playlists) == 0:
+            self.prefixes = tuple(DEFAULT_CATEGORY_PREFIXES)
+
+    def from_config(config, prefixes=(), patterns=(), playlists=()):
+        # Takes a JSON object like {"prefixes": ["A - "], "patterns": ["^Genre: "], "playlists": ["Favourites"]}
+        # and adds the given rules, e.g. from the command line.
+        return CategoryRules(config.get("prefixes", []) + list(prefixes), config.get("patterns", []) + list(patterns),
+                config.get("playlists", []) + list(playlists))
+
+    def matches(self, name):
+        return name in self.playlists or name.startswith(self.prefixes) \
+                or any(pattern.search(name) for pattern in self.patterns)
+
+
+class SavedTracksSync:
+    # Keeps a copy of the saved tracks of the current user up to date. Spotify returns saved tracks
+    # newest first by added_at, so only pages are requested until the first track, that is known with
+    # the same added_at. Removed tracks are noticed by the total, that comes with every page. Then all
+    # saved tracks are downloaded again.
+    def __init__(self, spotifyAccess, jobs=1):
+        self.spotifyAccess = spotifyAccess
+        self.jobs = jobs
+        self.first_page = None
+
+    def get_page(self, offset):
+        logging.debug("Requesting page of saved tracks...")
+        page = self.spotifyAccess.current_user_saved_tracks(offset=offset, limit=MAX_ITEMS)
+        logging.debug("Received page of saved tracks.")
+        return page
+
+    def get_all(self):
+        logging.info("Downloading all saved tracks...")
+        firstPage = self.first_page or self.get_page(0)
+        self.first_page = None
+        return firstPage["items"] + list(iter_complete_list(self.get_page, jobs=self.jobs, first_page=firstPage))
+
+    def get_new(self, known):
+        # Takes a map of the IDs of the known saved tracks to their added_at and returns the tracks
+        # saved since, newest first, or None, if saved tracks were removed. Known tracks, that were
+        # saved again, are returned as well.
+        newItems = []
+        offset = 0
+        while True:
+            page = self.get_page(offset)
+            if offset == 0:
+                self.first_page = page
+            for item in page["items"]:
+                if known.get(item["track"]["id"]) != item["added_at"]:
+                    newItems.append(item)
+                    continue
+
+                resaved = sum(1 for item in newItems if item["track"]["id"] in known)
+                if len(known) - resaved + len(newItems) != page["total"]:
+                    logging.info("Saved tracks were removed since the last sync.")
+                    return None
+                logging.info(f"Found {len(newItems)} new saved tracks since the last sync.")
+                self.first_page = None
+                return newItems
+
+            offset += len(page["items"])
+            if len(page["items"]) == 0 or not page["next"]:
+                return None
+
+    def update(self, items):
+        # Takes the saved tracks of the last sync, newest first, and returns the current ones in the
+        # same compact form.
+        if len(items) > 0:
+            newItems = self.get_new({item["track"]["id"]: item["added_at"] for item in items})
+            if newItems != None:
+                newIds = set(item["track"]["id"] for item in newItems)
+                return [compact_saved_track_item(item) for item in newItems] \
+                        + [item for item in items if not item["track"]["id"] in newIds]
+        return [compact_saved_track_item(item) for item in self.get_all() if item["track"]["id"] != None]
+
+
+def get_saved_tracks(spotifyAccess, jobs=1):
+    # Returns the saved tracks newest first. They are kept in the metadata cache, so only the tracks
+    # saved since the last call are downloaded.
+    account = getattr(spotifyAccess, "account", "me")
+    items = cache.metadata_cache.get("saved_tracks", account) or []
+    newItems = SavedTracksSync(spotifyAccess, jobs=jobs).update(items)
+    if newItems != items:
+        cache.metadata_cache.put("saved_tracks", account, newItems)
+    return newItems
+
+
+def compact_saved_track_item(item):
+    return {"added_at": item["added_at"], "track": compact_track_item(item["track"])}
+
+
+def complete_artist_albums(spotify, artistAlbums, jobs=1):
+    # Takes pairs of artists and their albums and yields them in the same order with complete albums.
+    # An artist is yielded as soon as all of its albums are complete.
+    with ThreadPoolExecutor(max_workers=max(jobs, 1)) as executor:
+        albumQueue = AlbumQueue(spotify, executor if jobs > 1 else None, max_pending=2 * jobs)
+        waiting = collections.deque()
+        for (artist, albums) in artistAlbums:
+            albumQueue.add(albums)
+            waiting.append((artist, albums))
+            while len(waiting) > 0 and albumQueue.is_complete(waiting[0][1]):
+                (readyArtist, readyAlbums) = waiting.popleft()
+                yield (readyArtist, albumQueue.complete(readyAlbums))
+
+        albumQueue.flush()
+        for (artist, albums) in waiting:
+            yield (artist, albumQueue.complete(albums))
+
+
+def map_artists(function, artists, jobs=1):
+    # Results are yielded in the order of the given artists, regardless of the number of jobs. Only a
+    # bounded number of artists is processed ahead of the consumer, so artists may be a generator.
+    if jobs <= 1:
+        for artist in artists:
+            yield (artist, function(artist))
+        return
+
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        pending = collections.deque()
+        for artist in artists:
+            pending.append((artist, executor.submit(function, artist)))
+            if len(pending) >= 2 * jobs:
+                (nextArtist, future) = pending.popleft()
+                yield (nextArtist, future.result())
+        while len(pending) > 0:
+            (nextArtist, future) = pending.popleft()
+            yield (nextArtist, future.result())
+
+
+def get_new_tracks(spotifyAccessPublic, spotifyAccessPrivate, period, jobs=1, incremental=False, async_client=None):
+    yield from iter_new_tracks(spotifyAccessPublic, iter_followed_artists(spotifyAccessPrivate), period,
+            jobs=jobs, incremental=incremental, async_client=async_client)
+
+
+def iter_new_tracks(spotifyAccessPublic, artists, period, jobs=1, incremental=False, use_cache=True, async_client=None):
+    periodStart = datetime.datetime.utcnow() - period
+    def is_current(album):
+        return album.release_date > periodStart
+    def get_album_release_date(album):
+        return album.release_date
+    def get_albums(artist):
+        # In incremental mode only albums inside the period are downloaded completely. Tracks are then
+        # only deduplicated by name against other albums inside the period. Compilations are dropped
+        # by is_collection anyway, so they are not requested at all.
+        if incremental:
+            return artist.get_albums_since(spotifyAccessPublic, periodStart,
+                    include_groups=RELEASE_RADAR_GROUPS, use_cache=use_cache)
+        return artist.get_albums(spotifyAccessPublic)
+
+    # The stages are chained generators: followed artists are listed page by page, their albums are
+    # listed and completed with tracks by worker threads, while the tracks of finished artists are
+    # already filtered and yielded. Every stage only runs a bounded number of artists ahead, so
+    # memory doesn't grow with the number of followed artists.
+    processedArtists = 0
+    # Albums of all artists are completed together, so albums shared by artists are requested once:
+    if async_client != None and not incremental:
+        from scriptify import aio
+        completedArtists = aio.crawl_artists(async_client, artists)
+    else:
+        completedArtists = complete_artist_albums(spotifyAccessPublic, map_artists(get_albums, artists, jobs=jobs), jobs=jobs)
+    for (artist, artistAlbums) in completedArtists:
+        # Sort albums by release date to get tracks from their first released album:
+        albums = sorted(artistAlbums, key=get_album_release_date)
+        foundTracks = TrackDeduplicator(by_title=True)
+        # Iterate over albums of artist:
+        for album in albums:
+            # Iterate over tracks in album and filter tracks from artist:
+            for track in album.tracks:
+                if foundTracks.add(track):
+                    if is_current(album) and not track.album.is_collection() and track.is_done_by_artist(artist.id):
+                        yield (artist, track)
+
+        # Yielded tracks still reference the artist through their album, but not its discography.
+        # Albums and their tracks reference each other, so the garbage collector has to free them:
+        artist.albums = None
+        processedArtists += 1
+        if processedArtists % GC_INTERVAL == 0:
+            gc.collect()
@@ -0,0 +1,894 @@
+# Artists, albums, tracks and playlists of the Spotify libary.
+
+import asyncio
+import bisect
+import datetime
+import logging
+import math
+import threading
+import weakref
+
+from scriptify import cache
+from scriptify.api import get_complete_list, iter_complete_list
+
+
+MAX_ITEMS = 50
+MAX_SET_ITEMS = 20
+# Maximum number of tracks added to or removed from a playlist per request:
+MAX_PLAYLIST_ITEMS = 100
+# Groups of artist albums in the order, in which Spotify returns them:
+ALBUM_GROUPS = ["album", "single", "appears_on", "compilation"]
+# Groups of albums, which may contain tracks for the Release Radar. Compilations are dropped anyway:
+RELEASE_RADAR_GROUPS = ["album", "single", "appears_on"]
+
+
+##
+# Classes to model the Spotify libary:
+##
+
+
+class Artist:
+    __slots__ = ("id", "name", "popularity", "albums", "__weakref__")
+
+    def __init__(self, id, name, popularity=None):
+        self.id = id
+        self.name = name
+        self.popularity = popularity
+        self.albums = None
+
+    def get_albums(self, spotify):
+        if self.albums != None or self.load_cached_albums():
+            return self.albums
+
+        resItems = []
+
+        totalAlbums = -1
+        offset = 0
+        i = 0
+
+        while i < totalAlbums or totalAlbums < 0:
+            logging.debug("Requesting page of albums of artist \"" + self.name + "\"...")
+            results = spotify.artist_albums(artist_id=self.id, limit = MAX_ITEMS, offset=offset)
+            logging.debug("Received page of albums.")
+
+            offset = offset + len(results["items"])
+            assert results["limit"] == MAX_ITEMS
+
+            totalAlbums = results["total"]
+
+            for item in results["items"]:
+                resItems.append(compact_album_item(item))
+                i += 1
+
+        self.store_album_items(resItems)
+        return self.albums
+
+    async def get_albums_async(self, spotify):
+        # Like get_albums with an AsyncSpotifyClient. All pages after the first one are requested at once.
+        if self.albums != None or self.load_cached_albums():
+            return self.albums
+
+        async def get_page(offset):
+            logging.debug("Requesting page of albums of artist \"" + self.name + "\"...")
+            results = await spotify.artist_albums(artist_id=self.id, limit=MAX_ITEMS, offset=offset)
+            logging.debug("Received page of albums.")
+            return results
+
+        self.store_album_items([compact_album_item(item) for item in await get_complete_list_async(get_page)])
+        return self.albums
+
+    def load_cached_albums(self):
+        # Returns whether the albums were taken from the metadata cache.
+        cachedItems = cache.metadata_cache.get("artist_albums", self.id)
+        if cachedItems == None:
+            return False
+        self.albums = [album_from_item(item, [self]) for item in cachedItems]
+        return True
+
+    def store_album_items(self, items):
+        cache.metadata_cache.put("artist_albums", self.id, items)
+        self.albums = [album_from_item(item, [self]) for item in items]
+
+    def get_album_count(self, spotify, include_groups=ALBUM_GROUPS):
+        logging.debug("Requesting number of albums of artist \"" + self.name + "\"...")
+        results = spotify.artist_albums(artist_id=self.id, include_groups=",".join(include_groups), limit=1)
+        logging.debug("Received number of albums.")
+        return results["total"]
+
+    def get_albums_since(self, spotify, since, include_groups=ALBUM_GROUPS, use_cache=True):
+        # Returns the albums of the given groups released after since. Spotify sorts the albums of
+        # each group by release date, newest first, so paging stops as soon as a page reaches the
+        # cutoff.
+        sinceTimestamp = since.replace(tzinfo=datetime.timezone.utc).timestamp()
+        cacheKey = self.id + ":" + ",".join(include_groups)
+        cached = cache.metadata_cache.get("artist_recent_albums", cacheKey) if use_cache else None
+        if cached != None and cached["since"] <= sinceTimestamp:
+            resItems = cached["items"]
+        else:
+            def reaches_cutoff(page):
+                return len(page) == 0 or parse_release_date(
+                        page[-1]["release_date"], page[-1]["release_date_precision"]) <= since
+
+            # Small discographies fit into one page of all groups:
+            results = self.request_albums_page(spotify, include_groups, 0)
+            resItems = [compact_album_item(item) for item in results["items"]]
+
+            pendingGroups = []
+            if results["next"]:
+                # Groups before the last one on the page are complete. The last one is continued
+                # unless it already reached the cutoff, the following ones are requested separately:
+                lastGroup = resItems[-1]["album_group"]
+                lastGroupItems = [item for item in resItems if item["album_group"] == lastGroup]
+                if not reaches_cutoff(lastGroupItems):
+                    pendingGroups.append((lastGroup, len(lastGroupItems)))
+                for group in include_groups[(include_groups.index(lastGroup) + 1):]:
+                    pendingGroups.append((group, 0))
+
+            for (group, offset) in pendingGroups:
+                while True:
+                    results = self.request_albums_page(spotify, [group], offset)
+                    page = [compact_album_item(item) for item in results["items"]]
+                    resItems.extend(page)
+                    offset += len(page)
+                    if not results["next"] or reaches_cutoff(page):
+                        break
+
+            cache.metadata_cache.put("artist_recent_albums", cacheKey, {"since": sinceTimestamp, "items": resItems})
+
+        res = []
+        for item in resItems:
+            album = album_from_item(item, [self])
+            if album.release_date > since:
+                res.append(album)
+        return res
+
+    def request_albums_page(self, spotify, include_groups, offset):
+        logging.debug("Requesting page of albums of artist \"" + self.name + "\"...")
+        results = spotify.artist_albums(artist_id=self.id, include_groups=",".join(include_groups),
+                limit=MAX_ITEMS, offset=offset)
+        logging.debug("Received page of albums.")
+        return results
+
+    def get_albums_with_tracks(self, spotify, since=None, include_groups=ALBUM_GROUPS):
+        # Only albums of the given groups released after since (if given) are completed and returned,
+        # so the tracks of older albums are never downloaded.
+        if since == None:
+            albums = self.get_albums(spotify)
+        else:
+            albums = self.get_albums_since(spotify, since, include_groups=include_groups)
+
+        if all(alb.tracks != None for alb in albums):
+            return albums
+
+        logging.info(f"Downloading albums with tracks for artist \"{self.name}\"...")
+        albumQueue = AlbumQueue(spotify)
+        albumQueue.add(albums)
+        albumQueue.flush()
+
+        # Albums, that could not be downloaded, are dropped:
+        if self.albums != None:
+            self.albums = albumQueue.complete(self.albums)
+
+        logging.info(f"Downloaded albums with tracks for artist \"{self.name}\".")
+        return albumQueue.complete(albums)
+
+
+class Album:
+    __slots__ = ("id", "name", "artists", "tracks", "type", "release_date", "__weakref__")
+
+    def __init__(self, id, name, artists, release_date, release_date_precision):
+        self.id = id
+        self.name = name
+        self.artists = artists
+        self.tracks = None
+        self.type = None
+        self.release_date = parse_release_date(release_date, release_date_precision)
+
+    def is_collection(self):
+        return self.type == "compilation" or (len(self.artists) == 1 and self.artists[0].id == "0LyfQWJT6nXafLPZqxe9Of")
+
+    def is_done_by_artist(self, artistId):
+        for artist in self.artists:
+            if artist.id == artistId:
+                return True
+        return False
+
+    def get_tracks(self, spotifyAccess):
+        if self.tracks != None or self.load_cached_tracks():
+            return self.tracks
+
+        trackItems = []
+        logging.debug("Requesting first page of tracks of album \"" + self.name + "\"...")
+        resultPart = spotifyAccess.album_tracks(self.id, limit=MAX_ITEMS, offset=0)
+        logging.debug("Received first page of tracks.")
+        while resultPart:
+            for tr in resultPart["items"]:
+                trackItems.append(compact_track_item(tr))
+            if resultPart["next"]:
+                logging.debug("Requesting next page of tracks.")
+                resultPart = spotifyAccess.next(resultPart)
+                logging.debug("Received next page of tracks.")
+            else:
+                resultPart = None
+
+        self.store_track_items(trackItems)
+        return self.tracks
+
+    async def get_tracks_async(self, spotify):
+        # Like get_tracks with an AsyncSpotifyClient. All pages after the first one are requested at once.
+        if self.tracks != None or self.load_cached_tracks():
+            return self.tracks
+
+        async def get_page(offset):
+            logging.debug("Requesting page of tracks of album \"" + self.name + "\"...")
+            results = await spotify.album_tracks(self.id, limit=MAX_ITEMS, offset=offset)
+            logging.debug("Received page of tracks.")
+            return results
+
+        self.store_track_items([compact_track_item(tr) for tr in await get_complete_list_async(get_page)])
+        return self.tracks
+
+    def load_cached_tracks(self):
+        # Returns whether the tracks were taken from the metadata cache.
+        trackItems = cache.metadata_cache.get("album_tracks", self.id)
+        if trackItems == None:
+            return False
+        self.tracks = [track_from_item(item, self) for item in trackItems]
+        return True
+
+    def store_track_items(self, items):
+        cache.metadata_cache.put("album_tracks", self.id, items)
+        self.tracks = [track_from_item(item, self) for item in items]
+
+
+class Track:
+    __slots__ = ("id", "name", "album", "artists")
+
+    def __init__(self, id, name=None, album=None, artists=None):
+        self.id = id
+        self.name = name
+        self.album = album
+        self.artists = artists
+
+    def is_done_by_artist(self, artistId):
+        # TODO: self.artist or self.album may be None
+        for artist in self.artists:
+            if artist.id == artistId:
+                return True
+        return False
+
+
+    def __eq__(self, other):
+        return isinstance(other, Track) and self.id == other.id
+
+    def __hash__(self):
+        return hash(self.id)
+
+    def __str__(self):
+        return "Track {\n\tid: %s,\n\tname: %s\n}" % (self.id, self.name)
+    def __repr__(self):
+        return str(self)
+
+
+class Playlist:
+    __slots__ = ("id", "name", "tracks", "snapshot_id")
+
+    def __init__(self, id, name=None, tracks=None, snapshot_id=None):
+        self.id = id
+        self.name = name
+        self.tracks = tracks
+        self.snapshot_id = snapshot_id
+
+
+    def by_name(spotifyAccess, name):
+        directory = PlaylistDirectory.of(spotifyAccess)
+        items = directory.get_by_name(name)
+        if len(items) > 0 and directory.from_cache:
+            # Playlists beyond the first page may have been renamed since the directory was cached. The
+            # name is checked with the request for the snapshot ID, that is needed anyway:
+            logging.debug("Requesting name and snapshot ID of playlist...")
+            current = spotifyAccess.playlist(items[0]["id"], fields="snapshot_id,name")
+            logging.debug("Received name and snapshot ID of playlist.")
+            if current["name"] == name:
+                return Playlist(items[0]["id"], name=name, snapshot_id=current["snapshot_id"])
+            logging.info(f"Playlist \"{name}\" was renamed to \"{current['name']}\", reloading playlists...")
+            directory.reload()
+            items = directory.get_by_name(name)
+        if len(items) == 0:
+            return None
+        if len(items) > 1:
+            logging.warning(f"There are {len(items)} playlists with name \"{name}\", using the first one ("
+                    + ", ".join(item["id"] for item in items) + ").")
+
+        return Playlist.from_directory_item(directory, items[0])
+
+
+    def from_directory_item(directory, item):
+        # Snapshot IDs of a directory taken from the cache may be outdated, so they are requested again.
+        if directory.from_cache:
+            return Playlist(item["id"], name=item["name"])
+        return Playlist(item["id"], name=item["name"], snapshot_id=item["snapshot_id"])
+
+
+    def create_playlist(spotifyAccess, name, user_id=None, description=""):
+        if user_id == None:
+            # Get current user:
+            logging.debug("Requesting current user...")
+            user_id = spotifyAccess.current_user()["id"]
+            logging.debug("Received current user.")
+
+        response = spotifyAccess.user_playlist_create(user_id, name, public=False, description=description)
+        PlaylistDirectory.of(spotifyAccess).add(response)
+        return Playlist(response["id"], name, [], snapshot_id=response["snapshot_id"])
+
+
+    def get_tracks(self, spotifyAccess):
+        if self.tracks == None:
+            self.tracks = [Track(track_id) for track_id in self.get_track_ids(spotifyAccess)]
+
+        return self.tracks
+
+
+    def get_track_ids(self, spotifyAccess):
+        # The contents of a playlist are cached for each of its snapshots. So an unchanged playlist
+        # costs at most one request for its snapshot ID.
+        if self.tracks != None:
+            return [tr.id for tr in self.tracks]
+
+        if self.snapshot_id == None:
+            logging.debug("Requesting snapshot ID of playlist...")
+            self.snapshot_id = spotifyAccess.playlist(self.id, fields="snapshot_id")["snapshot_id"]
+            logging.debug("Received snapshot ID of playlist.")
+
+        track_ids = cache.metadata_cache.get("playlist_snapshot", self.id + ":" + self.snapshot_id)
+        if track_ids == None:
+            track_items = get_complete_list(
+                    lambda offset: spotifyAccess.playlist_items(self.id,
+                        limit=MAX_ITEMS,
+                        offset=offset,
+                        fields="total,items(track.id)"),
+                    jobs=spotifyAccess.jobs)
+            track_ids = [item["track"]["id"] for item in track_items]
+            cache.metadata_cache.put("playlist_snapshot", self.id + ":" + self.snapshot_id, track_ids)
+
+        return track_ids
+
+
+    def update_tracks(self, spotifyAccess, tracks, ordered=True):
+        # Only the differences to the current content of the playlist are written. Without ordered,
+        # the order of the tracks in the playlist is irrelevant and never changed.
+        tracks = list(tracks)
+        new_ids = [tr.id for tr in tracks]
+        if self.tracks == None:
+            # Make sure to diff against the current snapshot:
+            self.snapshot_id = None
+        current_ids = [tr.id for tr in self.get_tracks(spotifyAccess)]
+
+        (changes, writeCount) = get_playlist_update(current_ids, new_ids, ordered)
+        if writeCount == 0:
+            logging.info("Tracks of playlist are already up to date.")
+            return True
+
+        if changes == None:
+            result = self.replace_tracks(spotifyAccess, new_ids)
+            result_ids = new_ids
+        else:
+            (removals, moves, additions) = changes
+            logging.info(f"Updating playlist with {len(removals)} removals, {len(moves)} moves and"
+                    + f" {sum(len(ids) for (position, ids) in additions)} additions...")
+            for offset in range(0, len(removals), MAX_PLAYLIST_ITEMS):
+                result = spotifyAccess.playlist_remove_all_occurrences_of_items(self.id,
+                        removals[offset:(offset + MAX_PLAYLIST_ITEMS)])
+            for (range_start, insert_before) in moves:
+                result = spotifyAccess.playlist_reorder_items(self.id, range_start=range_start,
+                        insert_before=insert_before)
+            for (position, ids) in additions:
+                if ordered:
+                    result = spotifyAccess.playlist_add_items(self.id, ids, position=position)
+                else:
+                    result = spotifyAccess.playlist_add_items(self.id, ids)
+            result_ids = get_playlist_result(current_ids, changes, ordered)
+
+        if not "snapshot_id" in result:
+            logging.error("Could not update tracks of playlist.")
+            return False
+
+        # Without ordered, Spotify appends the added tracks, so the playlist has a different order
+        # than the given tracks:
+        if result_ids != new_ids:
+            tracks_by_id = {tr.id: tr for tr in tracks}
+            tracks = [tracks_by_id[track_id] for track_id in result_ids]
+        self.tracks = tracks
+        self.snapshot_id = result["snapshot_id"]
+        cache.metadata_cache.put("playlist_snapshot", self.id + ":" + self.snapshot_id, result_ids)
+        PlaylistDirectory.of(spotifyAccess).set_snapshot_id(self.id, self.snapshot_id, total=len(result_ids))
+        logging.info("Successfully updated tracks of playlist.")
+        return True
+
+
+    def replace_tracks(self, spotifyAccess, track_ids):
+        logging.info("Replacing all tracks of playlist...")
+        result = spotifyAccess.playlist_replace_items(self.id, track_ids[:MAX_PLAYLIST_ITEMS])
+        for offset in range(MAX_PLAYLIST_ITEMS, len(track_ids), MAX_PLAYLIST_ITEMS):
+            result = spotifyAccess.playlist_add_items(self.id, track_ids[offset:(offset + MAX_PLAYLIST_ITEMS)])
+        return result
+
+
+    def __str__(self):
+        return "Playlist {\n\tid: %s,\n\tname: %s\n}" % (self.id, self.name)
+    def __repr__(self):
+        return str(self)
+
+
+class PlaylistDirectory:
+    # The playlists of the current user, downloaded once per client and indexed by name and ID.
+    # With persist, the directory is kept in the metadata cache and reused, as long as the number of
+    # playlists and the IDs and names on the first page are unchanged. Our own writes change only
+    # snapshot IDs and track counts, so they don't invalidate it.
+    def __init__(self, spotifyAccess, persist=True):
+        self.spotifyAccess = spotifyAccess
+        self.persist = persist
+        # Clients of several accounts in one batch keep their directories apart:
+        self.account = getattr(spotifyAccess, "account", "me")
+        self.items = None
+        self.from_cache = False
+        self.by_name = {}
+        self.by_id = {}
+        self.lock = threading.Lock()
+
+    def of(spotifyAccess):
+        if getattr(spotifyAccess, "playlist_directory", None) == None:
+            spotifyAccess.playlist_directory = PlaylistDirectory(spotifyAccess)
+        return spotifyAccess.playlist_directory
+
+    def get_items(self):
+        with self.lock:
+            if self.items == None:
+                self.load()
+            return self.items
+
+    def get_by_name(self, name):
+        self.get_items()
+        if not name in self.by_name and self.from_cache:
+            # A cached directory may miss playlists renamed beyond the first page:
+            self.reload()
+        return self.by_name.get(name, [])
+
+    def get_by_id(self, id):
+        self.get_items()
+        if not id in self.by_id and self.from_cache:
+            self.reload()
+        return self.by_id.get(id)
+
+    def add(self, item):
+        with self.lock:
+            if self.items == None:
+                return
+            self.index(compact_playlist_item(item))
+            if self.persist:
+                cache.metadata_cache.put("playlist_directory", self.account, self.items)
+
+    def set_snapshot_id(self, id, snapshot_id, total=None):
+        with self.lock:
+            if self.items == None or not id in self.by_id:
+                return
+            self.by_id[id]["snapshot_id"] = snapshot_id
+            if total != None:
+                self.by_id[id]["total"] = total
+            if self.persist:
+                cache.metadata_cache.put("playlist_directory", self.account, self.items)
+
+    def reload(self):
+        with self.lock:
+            self.load(use_cache=False)
+
+    def refresh(self):
+        # Reloads the directory, unless the first page of playlists is unchanged. Then the directory
+        # is handled like one taken from the cache.
+        with self.lock:
+            self.load(known=self.items)
+
+    def load(self, use_cache=True, known=None):
+        logging.debug("Requesting first page of user playlists...")
+        first_page = self.spotifyAccess.current_user_playlists(offset=0, limit=MAX_ITEMS)
+        logging.debug("Received first page of user playlists.")
+
+        cached = known
+        if cached == None and self.persist and use_cache:
+            cached = cache.metadata_cache.get("playlist_directory", self.account)
+        first_items = [compact_playlist_item(item) for item in first_page["items"]]
+        if cached != None and len(cached) == first_page["total"] \
+                and get_playlist_names(cached[:len(first_items)]) == get_playlist_names(first_items):
+            logging.debug("Using cached list of user playlists.")
+            # The first page is current, e.g. its snapshot IDs:
+            items = first_items + cached[len(first_items):]
+            self.from_cache = True
+            if self.persist and items != cached:
+                cache.metadata_cache.put("playlist_directory", self.account, items)
+        else:
+            self.from_cache = False
+            items = first_items + [compact_playlist_item(item) for item in iter_complete_list(
+                    lambda offset: self.spotifyAccess.current_user_playlists(offset=offset, limit=MAX_ITEMS),
+                    jobs=self.spotifyAccess.jobs, first_page=first_page)]
+            if self.persist:
+                cache.metadata_cache.put("playlist_directory", self.account, items)
+
+        self.items = []
+        self.by_name = {}
+        self.by_id = {}
+        for item in items:
+            self.index(item)
+
+    def index(self, item):
+        self.items.append(item)
+        self.by_name.setdefault(item["name"], []).append(item)
+        self.by_id[item["id"]] = item
+
+
+class Registry:
+    # Identity map, that maps every Spotify ID of an artist or album to one shared object. Objects are
+    # only kept as long as they are referenced elsewhere. Tracks are not interned, as they are only
+    # referenced by their album or playlist anyway.
+    def __init__(self):
+        self.artists = weakref.WeakValueDictionary()
+        self.albums = weakref.WeakValueDictionary()
+        self.lock = threading.RLock()
+
+    def get_artist(self, id, name, popularity=None):
+        with self.lock:
+            artist = self.artists.get(id)
+            if artist == None:
+                artist = Artist(id, name, popularity)
+                self.artists[id] = artist
+            elif popularity != None:
+                artist.popularity = popularity
+            return artist
+
+    def get_album(self, item, artists=None):
+        # Creates the album from its compact item. The given artists are only used, if the item
+        # doesn't name them.
+        with self.lock:
+            album = self.albums.get(item["id"])
+            if album == None:
+                if "artists" in item:
+                    artists = [self.get_artist(art["id"], art["name"]) for art in item["artists"]]
+                album = Album(item["id"], item["name"], artists, item["release_date"], item["release_date_precision"])
+                album.type = item.get("album_type")
+                self.albums[item["id"]] = album
+            if "tracks" in item and album.tracks == None:
+                # Complete items name all artists of the album:
+                album.artists = [self.get_artist(art["id"], art["name"]) for art in item["artists"]]
+                album.type = item.get("album_type")
+                album.tracks = [track_from_item(tr, album) for tr in item["tracks"]]
+            return album
+
+
+registry = Registry()
+
+
+async def get_complete_list_async(get_page):
+    # Like api.get_complete_list for an async get_page. All pages after the first one are requested at once.
+    firstPage = await get_page(0)
+    pages = [firstPage] + await asyncio.gather(*[get_page(offset)
+            for offset in range(len(firstPage["items"]), firstPage["total"], MAX_ITEMS)])
+    return [item for page in pages for item in page["items"]]
+
+
+def parse_release_date(release_date, release_date_precision):
+    if release_date_precision == "day":
+        return datetime.datetime.strptime(release_date, "%Y-%m-%d")
+    elif release_date_precision == "month":
+        return datetime.datetime.strptime(release_date, "%Y-%m")
+    elif release_date_precision == "year":
+        return datetime.datetime.strptime(release_date, "%Y")
+    else:
+        logging.error("Could not parse release date because of unknown precision.\nDate: "
+                + release_date + "\nPrec: " + release_date_precision)
+        exit(1)
+
+
+def compact_playlist_item(item):
+    return {
+        "id": item["id"],
+        "name": item["name"],
+        "snapshot_id": item.get("snapshot_id"),
+        "total": item.get("tracks", {}).get("total"),
+    }
+
+
+def get_playlist_names(items):
+    return [(item["id"], item["name"]) for item in items]
+
+
+def compact_artist_item(item):
+    return {"id": item["id"], "name": item["name"]}
+
+
+def compact_track_item(item):
+    return {
+        "id": item["id"],
+        "name": item["name"],
+        "artists": [compact_artist_item(art) for art in item["artists"]],
+    }
+
+
+def compact_album_item(item):
+    res = {
+        "id": item["id"],
+        "name": item["name"],
+        "album_type": item.get("album_type"),
+        "album_group": item.get("album_group", item.get("album_type")),
+        "release_date": item["release_date"],
+        "release_date_precision": item["release_date_precision"],
+    }
+    if "artists" in item:
+        res["artists"] = [compact_artist_item(art) for art in item["artists"]]
+    if "tracks" in item:
+        res["tracks"] = [compact_track_item(tr) for tr in item["tracks"]["items"]]
+    return res
+
+
+def album_from_item(item, artists=None):
+    return registry.get_album(item, artists)
+
+
+def track_from_item(item, album):
+    artists = [registry.get_artist(art["id"], art["name"]) for art in item["artists"]]
+    return Track(item["id"], item["name"], album, artists)
+
+
+def get_playlist_update(current_ids, new_ids, ordered):
+    # Returns the changes to write and the number of write requests. Changes are None, if all tracks
+    # are replaced instead, because that takes fewer requests or the changes can't be written.
+    if new_ids == current_ids or (not ordered and set(new_ids) == set(current_ids)
+            and len(set(current_ids)) == len(current_ids)):
+        return (([], [], []), 0)
+
+    changes = get_playlist_changes(current_ids, new_ids, ordered)
+    if changes == None or count_playlist_writes(changes) >= count_replace_writes(new_ids):
+        return (None, count_replace_writes(new_ids))
+    return (changes, count_playlist_writes(changes))
+
+
+def get_playlist_changes(current_ids, new_ids, ordered):
+    # Returns the track IDs to remove, the reorders as (range_start, insert_before) and the batches of
+    # IDs to add as (position, ids), applied in this order. Returns None, if the playlist can't be
+    # updated incrementally, because it contains local tracks or duplicates.
+    if None in current_ids or len(set(current_ids)) != len(current_ids) or len(set(new_ids)) != len(new_ids):
+        return None
+
+    new_positions = {}
+    for (position, track_id) in enumerate(new_ids):
+        new_positions[track_id] = position
+
+    removals = [track_id for track_id in current_ids if not track_id in new_positions]
+    kept_ids = [track_id for track_id in current_ids if track_id in new_positions]
+    kept_set = set(kept_ids)
+
+    moves = []
+    if ordered:
+        # Tracks in a longest increasing subsequence stay, every other track is moved directly behind
+        # its predecessor in the new order:
+        staying = get_longest_increasing_subsequence(kept_ids, new_positions)
+        predecessor = None
+        for track_id in new_ids:
+            if not track_id in kept_set:
+                continue
+            if not track_id in staying:
+                range_start = kept_ids.index(track_id)
+                insert_before = 0 if predecessor == None else kept_ids.index(predecessor) + 1
+                if insert_before != range_start:
+                    moves.append((range_start, insert_before))
+                    kept_ids.pop(range_start)
+                    kept_ids.insert(insert_before if insert_before < range_start else insert_before - 1, track_id)
+            predecessor = track_id
+
+    # Consecutive new tracks are added in one request at their final position:
+    additions = []
+    for (position, track_id) in enumerate(new_ids):
+        if track_id in kept_set:
+            continue
+        if len(additions) > 0 and (not ordered or additions[-1][0] + len(additions[-1][1]) == position) \
+                and len(additions[-1][1]) < MAX_PLAYLIST_ITEMS:
+            additions[-1][1].append(track_id)
+        else:
+            additions.append((position, [track_id]))
+
+    return (removals, moves, additions)
+
+
+def get_playlist_result(current_ids, changes, ordered):
+    # Returns the track IDs of the playlist after the changes are written. Without ordered, the kept
+    # tracks stay in their current order and the added tracks are appended in batches.
+    (removals, moves, additions) = changes
+    removed = set(removals)
+    result_ids = [track_id for track_id in current_ids if not track_id in removed]
+    for (range_start, insert_before) in moves:
+        track_id = result_ids.pop(range_start)
+        result_ids.insert(insert_before if insert_before < range_start else insert_before - 1, track_id)
+    for (position, ids) in additions:
+        if ordered:
+            result_ids[position:position] = ids
+        else:
+            result_ids.extend(ids)
+    return result_ids
+
+
+def get_longest_increasing_subsequence(ids, positions):
+    # Patience sorting of the ids by their positions, returns the set of ids in the subsequence.
+    tail_indices = []
+    tail_positions = []
+    previous = [None] * len(ids)
+    for (i, track_id) in enumerate(ids):
+        j = bisect.bisect_left(tail_positions, positions[track_id])
+        if j > 0:
+            previous[i] = tail_indices[j - 1]
+        if j == len(tail_positions):
+            tail_indices.append(i)
+            tail_positions.append(positions[track_id])
+        else:
+            tail_indices[j] = i
+            tail_positions[j] = positions[track_id]
+
+    res = set()
+    i = tail_indices[-1] if len(tail_indices) > 0 else None
+    while i != None:
+        res.add(ids[i])
+        i = previous[i]
+    return res
+
+
+def count_playlist_writes(changes):
+    (removals, moves, additions) = changes
+    return math.ceil(len(removals) / MAX_PLAYLIST_ITEMS) + len(moves) + len(additions)
+
+
+def count_replace_writes(track_ids):
+    return max(1, math.ceil(len(track_ids) / MAX_PLAYLIST_ITEMS))
+
+
+class AlbumQueue:
+    # Completes the albums of many artists with their tracks. Incomplete albums are collected across
+    # artists, deduplicated by ID and requested in full batches of MAX_SET_ITEMS, so the number of
+    # requests depends on the number of distinct albums instead of the number of artists. With an
+    # executor the batches are requested concurrently.
+    def __init__(self, spotify, executor=None, max_pending=1):
+        self.spotify = spotify
+        self.executor = executor
+        self.max_pending = max_pending
+        # Compact items of known albums, None for albums, that could not be downloaded:
+        self.items = {}
+        self.queued = []
+        self.seen = set()
+        self.pending = []
+
+    def add(self, albums):
+        newIds = []
+        for alb in albums:
+            if alb.tracks == None and not alb.id in self.seen:
+                self.seen.add(alb.id)
+                newIds.append(alb.id)
+
+        # Albums never change after their release, so most of them can be taken from the cache:
+        cachedItems = cache.metadata_cache.get_many("album", newIds)
+        self.items.update(cachedItems)
+        for albumId in newIds:
+            if not albumId in cachedItems:
+                self.queued.append(albumId)
+
+        while len(self.queued) >= MAX_SET_ITEMS:
+            self.send_batch()
+
+    def send_batch(self):
+        albumIds = self.queued[:MAX_SET_ITEMS]
+        del self.queued[:MAX_SET_ITEMS]
+        if self.executor == None:
+            self.store(albumIds, self.fetch(albumIds))
+            return
+
+        # Only a bounded number of batches is requested at once:
+        if len(self.pending) >= self.max_pending:
+            (pendingIds, future) = self.pending.pop(0)
+            self.store(pendingIds, future.result())
+        self.pending.append((albumIds, self.executor.submit(self.fetch, albumIds)))
+
+    def fetch(self, albumIds):
+        logging.debug(f"Requesting page of {len(albumIds)} complete albums...")
+        results = self.spotify.albums(albumIds)
+        logging.debug("Received page of complete albums.")
+        return results["albums"]
+
+    def store(self, albumIds, items):
+        for (albumId, item) in zip(albumIds, items):
+            if item == None:
+                self.items[albumId] = None
+                continue
+            self.items[albumId] = compact_album_item(item)
+            cache.metadata_cache.put("album", albumId, self.items[albumId])
+
+    def collect(self, wait=False):
+        stillPending = []
+        for (albumIds, future) in self.pending:
+            if wait or future.done():
+                self.store(albumIds, future.result())
+            else:
+                stillPending.append((albumIds, future))
+        self.pending = stillPending
+
+    def is_complete(self, albums):
+        self.collect()
+        return all(alb.tracks != None or alb.id in self.items for alb in albums)
+
+    def flush(self):
+        # Requests the remaining albums, even if they don't fill a batch, and waits for all batches:
+        while len(self.queued) > 0:
+            self.send_batch()
+        self.collect(wait=True)
+
+    def complete(self, albums):
+        # Returns the given albums with tracks. Albums, that could not be downloaded, are dropped.
+        # Items are forgotten once their album has tracks, other artists share the same album object.
+        res = []
+        for alb in albums:
+            if alb.tracks != None:
+                res.append(alb)
+            elif self.items.get(alb.id) != None:
+                res.append(album_from_item(self.items.pop(alb.id)))
+                self.seen.discard(alb.id)
+        return res
+
+
+class AsyncAlbumQueue(AlbumQueue):
+    # AlbumQueue for an AsyncSpotifyClient, all batches are requested as tasks of the running event
+    # loop. Artists, whose albums are still being listed, may fill the last batch, so it is only
+    # requested incomplete once no artist is listed anymore.
+    def __init__(self, spotify):
+        super().__init__(spotify)
+        self.listing = 0
+        self.batches = {}
+        self.batch_sent = asyncio.Event()
+
+    def start_listing(self):
+        self.listing += 1
+
+    def finish_listing(self, albums):
+        self.listing -= 1
+        self.add(albums)
+        if self.listing == 0:
+            while len(self.queued) > 0:
+                self.send_batch()
+
+    def send_batch(self):
+        albumIds = self.queued[:MAX_SET_ITEMS]
+        del self.queued[:MAX_SET_ITEMS]
+        task = asyncio.ensure_future(self.fetch_batch(albumIds))
+        for albumId in albumIds:
+            self.batches[albumId] = task
+        self.batch_sent.set()
+        self.batch_sent = asyncio.Event()
+
+    async def fetch_batch(self, albumIds):
+        logging.debug(f"Requesting page of {len(albumIds)} complete albums...")
+        results = await self.spotify.albums(albumIds)
+        logging.debug("Received page of complete albums.")
+        self.store(albumIds, results["albums"])
+        for albumId in albumIds:
+            del self.batches[albumId]
+
+    async def complete_async(self, albums):
+        # Waits until the batches of all given albums were requested and received:
+        while True:
+            tasks = set()
+            queued = False
+            for alb in albums:
+                if alb.tracks == None and alb.id in self.seen and not alb.id in self.items:
+                    if alb.id in self.batches:
+                        tasks.add(self.batches[alb.id])
+                    else:
+                        queued = True
+            if queued:
+                await self.batch_sent.wait()
+            elif len(tasks) > 0:
+                await asyncio.gather(*tasks)
+            else:
+                return self.complete(albums)
@@ -0,0 +1,298 @@
+# Plans of commands: the requests a command would send to Spotify, estimated from the metadata cache
+# before it runs, and the writes it would make. Planning changes nothing, it only lists the playlists
+# and followed artists of the user.
+
+import collections
+import datetime
+import logging
+import math
+
+from scriptify import api, cache
+from scriptify.library import get_followed_artists, get_release_radar_tracks, iter_new_tracks
+from scriptify.model import (MAX_ITEMS, MAX_PLAYLIST_ITEMS, MAX_SET_ITEMS, RELEASE_RADAR_GROUPS,
+        PlaylistDirectory, get_playlist_update, parse_release_date)
+from scriptify.expressions import evaluate_set_expression, get_expression_playlists
+from scriptify.sets import track_id_set, tracks_from_id_set
+
+
+# Albums per artist assumed for artists without cached discography, if no discography is cached at all:
+DEFAULT_ALBUM_COUNT = 20
+
+
+##
+# Plans of requests:
+##
+
+
+class RequestPlan:
+    # Requests per endpoint, that a command is expected to send, and a description of its result.
+    # Requests answered by the metadata cache are not counted. Counts of requests, whose number
+    # depends on data that is not cached, are estimated.
+    def __init__(self):
+        self.requests = collections.Counter()
+        self.estimated = set()
+        self.lines = []
+
+    def add(self, method, endpoint, count=1, estimated=False):
+        # An estimate of no requests still marks the count of the endpoint as estimated:
+        if estimated:
+            self.estimated.add((method, endpoint))
+        if count <= 0:
+            return
+        self.requests[(method, endpoint)] += count
+
+    def report(self, line):
+        self.lines.append(line)
+
+    def format_table(self, rate=api.MAX_REQUESTS_PER_SECOND):
+        lines = [f"{'Endpoint':<36} {'Reqs':>7}"]
+        for ((method, endpoint), count) in sorted(self.requests.items(), key=lambda item: -item[1]):
+            prefix = "~" if (method, endpoint) in self.estimated else ""
+            lines.append(f"{(method + ' ' + endpoint)[:36]:<36} {prefix + str(count):>7}")
+        total = sum(self.requests.values())
+        writes = sum(count for ((method, endpoint), count) in self.requests.items() if method != "GET")
+        lines.append(f"{'Total':<36} {('~' if len(self.estimated) > 0 else '') + str(total):>7}")
+        lines.extend(self.lines)
+        lines.append(f"{total} requests, {writes} of them writes, take at least {format_duration(total / rate)}"
+                + f" at the rate limit of {rate} requests per second.")
+        return "\n".join(lines)
+
+
+def format_duration(seconds):
+    if seconds < 60:
+        return f"{seconds:.0f}s"
+    return f"{seconds // 60:.0f}m {seconds % 60:02.0f}s"
+
+
+##
+# Plans of the commands:
+##
+
+
+def plan_release_radar(plan, spotifyAccessPublic, spotifyAccessPrivate, period, jobs=1, incremental=False):
+    periodStart = datetime.datetime.utcnow() - period
+    artists = get_followed_artists(spotifyAccessPrivate)
+    plan.add("GET", "me/following", max(1, math.ceil(len(artists) / MAX_ITEMS)))
+    if incremental:
+        complete = plan_recent_albums(plan, [artist.id for artist in artists], periodStart)
+    else:
+        complete = plan_discographies(plan, [artist.id for artist in artists])
+
+    (directory, cached) = plan_directory(plan, spotifyAccessPrivate)
+    newIds = None
+    if complete:
+        # Everything is cached, so the new tracks are found without a request:
+        newTracks = iter_new_tracks(spotifyAccessPublic, artists, period, jobs=jobs, incremental=incremental)
+        newIds = [track.id for track in get_release_radar_tracks(track for (artist, track) in newTracks)]
+        plan.report(f"The Release Radar gets {len(newIds)} tracks.")
+    else:
+        plan.report("The tracks of the Release Radar are only known after the download.")
+    plan_playlist_update(plan, directory, cached, "Release Radar", newIds, ordered=True)
+
+
+def plan_discographies(plan, artistIds):
+    # Discographies and albums in the cache cost nothing, the other ones a request per page of albums
+    # and per batch of MAX_SET_ITEMS albums. Returns whether everything is cached.
+    discographies = cache.metadata_cache.get_many("artist_albums", artistIds)
+    missingIds = [id for id in artistIds if not id in discographies]
+    albumIds = set(item["id"] for items in discographies.values() for item in items)
+    knownCounts = [len(items) for items in discographies.values()]
+    meanCount = sum(knownCounts) / len(knownCounts) if len(knownCounts) > 0 else DEFAULT_ALBUM_COUNT
+
+    # Missing discographies are estimated by the mean size of the cached ones:
+    unknownAlbums = math.ceil(meanCount) * len(missingIds)
+    pageCount = max(1, math.ceil(meanCount / MAX_ITEMS)) * len(missingIds)
+    plan.add("GET", "artists/{id}/albums", pageCount, estimated=len(missingIds) > 0)
+
+    albumIds = list(albumIds)
+    missingAlbums = len(albumIds) - len(cache.metadata_cache.get_many("album", albumIds)) + unknownAlbums
+    plan.add("GET", "albums", math.ceil(missingAlbums / MAX_SET_ITEMS), estimated=len(missingIds) > 0)
+    plan.report(f"{len(artistIds) - len(missingIds)} of {len(artistIds)} discographies and"
+            + f" {len(albumIds) + unknownAlbums - missingAlbums} of about {len(albumIds) + unknownAlbums} albums are cached.")
+    return len(missingIds) == 0 and missingAlbums == 0
+
+
+def plan_recent_albums(plan, artistIds, periodStart):
+    # Like plan_discographies for the albums released within the period. Artists without cached
+    # recent albums need one request, unless a cached discography tells how many pages of albums it
+    # takes. Returns whether everything is cached.
+    sinceTimestamp = periodStart.replace(tzinfo=datetime.timezone.utc).timestamp()
+    keys = [id + ":" + ",".join(RELEASE_RADAR_GROUPS) for id in artistIds]
+    recentAlbums = {key: value for (key, value) in cache.metadata_cache.get_many("artist_recent_albums", keys).items()
+            if value["since"] <= sinceTimestamp}
+    discographies = cache.metadata_cache.get_many("artist_albums", artistIds)
+
+    def is_recent(item):
+        return item.get("album_group") in RELEASE_RADAR_GROUPS \
+                and parse_release_date(item["release_date"], item["release_date_precision"]) > periodStart
+
+    albumIds = set()
+    knownCounts = []
+    requestCount = 0
+    for (id, key) in zip(artistIds, keys):
+        if key in recentAlbums:
+            items = [item for item in recentAlbums[key]["items"]
+                    if parse_release_date(item["release_date"], item["release_date_precision"]) > periodStart]
+        elif id in discographies:
+            # Recent albums can be told from an older cached discography:
+            items = [item for item in discographies[id] if is_recent(item)]
+            requestCount += count_recent_album_pages(discographies[id], periodStart)
+        else:
+            requestCount += 1
+            continue
+        albumIds.update(item["id"] for item in items)
+        knownCounts.append(len(items))
+    unknownCount = len(artistIds) - len(knownCounts)
+    plan.add("GET", "artists/{id}/albums", requestCount, estimated=unknownCount > 0)
+
+    albumIds = list(albumIds)
+    meanCount = sum(knownCounts) / len(knownCounts) if len(knownCounts) > 0 else 1
+    unknownAlbums = math.ceil(unknownCount * meanCount)
+    missingAlbums = len(albumIds) - len(cache.metadata_cache.get_many("album", albumIds)) + unknownAlbums
+    plan.add("GET", "albums", math.ceil(missingAlbums / MAX_SET_ITEMS), estimated=unknownCount > 0)
+    plan.report(f"Recent albums of {len(recentAlbums)} of {len(artistIds)} artists are cached,"
+            + f" about {len(albumIds) + unknownAlbums} albums were released within the period.")
+    return requestCount == 0 and missingAlbums == 0
+
+
+def count_recent_album_pages(items, periodStart):
+    # Pages requested by Artist.get_albums_since for a discography, whose albums are ordered by group
+    # and release date like Spotify returns them. Groups continued beyond the first page are paged
+    # until they reach the start of the period.
+    def reaches_cutoff(page):
+        return len(page) == 0 or parse_release_date(page[-1]["release_date"], page[-1]["release_date_precision"]) <= periodStart
+
+    items = [item for item in items if item.get("album_group") in RELEASE_RADAR_GROUPS]
+    if len(items) <= MAX_ITEMS:
+        return 1
+    pageCount = 1
+    lastGroup = items[MAX_ITEMS - 1]["album_group"]
+    for group in RELEASE_RADAR_GROUPS[RELEASE_RADAR_GROUPS.index(lastGroup):]:
+        groupItems = [item for item in items if item["album_group"] == group]
+        offset = sum(1 for item in items[:MAX_ITEMS] if item["album_group"] == group)
+        if group == lastGroup and reaches_cutoff(groupItems[:offset]):
+            continue
+        while True:
+            page = groupItems[offset:(offset + MAX_ITEMS)]
+            pageCount += 1
+            offset += len(page)
+            if offset >= len(groupItems) or reaches_cutoff(page):
+                break
+    return pageCount
+
+
+def plan_expression(plan, spotifyAccess, expression, result_name):
+    # Set operations are planned as expressions, e.g. a union as ("union", [("playlist", name), ...]).
+    (directory, cached) = plan_directory(plan, spotifyAccess)
+    input_sets = {}
+    totals = {}
+    for playlist_name in get_expression_playlists(expression):
+        items = directory.get_by_name(playlist_name)
+        if len(items) == 0:
+            logging.error("There is no playlist with name " + playlist_name)
+            return
+        track_ids = plan_track_ids(plan, directory, cached, items[0])
+        totals[playlist_name] = items[0].get("total") or 0
+        if track_ids != None:
+            input_sets[playlist_name] = track_id_set(track_ids)
+
+    new_ids = None
+    if len(input_sets) == len(totals):
+        new_ids = [track.id for track in tracks_from_id_set(evaluate_set_expression(spotifyAccess, expression, input_sets))]
+        plan.report(f"The result has {len(new_ids)} tracks.")
+        plan_playlist_update(plan, directory, cached, result_name, new_ids, ordered=False)
+    else:
+        bound = get_expression_size_bound(expression, totals)
+        plan.report(f"The result has at most {bound} tracks.")
+        plan_playlist_update(plan, directory, cached, result_name, None, ordered=False, new_count=bound)
+
+
+def get_expression_size_bound(expression, totals):
+    (operator, operands) = expression
+    if operator == "playlist":
+        return totals[operands]
+    bounds = [get_expression_size_bound(operand, totals) for operand in operands]
+    if operator == "union":
+        return sum(bounds)
+    if operator == "intersection":
+        return min(bounds)
+    return bounds[0]
+
+
+def plan_directory(plan, spotifyAccess):
+    # The directory is listed for the plan and stored in the metadata cache. So the command only
+    # requests its first page, unless the cache is disabled. The whole directory is listed, because
+    # snapshot IDs beyond the first page of a cached one may be outdated. Returns the directory and
+    # whether the command takes it from the cache.
+    directory = PlaylistDirectory.of(spotifyAccess)
+    directory.reload()
+    cached = cache.metadata_cache.get("playlist_directory", directory.account) != None
+    plan.add("GET", "me/playlists", 1 if cached else get_directory_page_count(directory))
+    return (directory, cached)
+
+
+def get_directory_page_count(directory):
+    return max(1, math.ceil(len(directory.get_items()) / MAX_ITEMS))
+
+
+def plan_track_ids(plan, directory, cached, item):
+    # Returns the cached track IDs of a playlist of the directory or None, if they have to be downloaded.
+    if cached:
+        # Names and snapshot IDs of a cached directory are requested again:
+        plan.add("GET", "playlists/{id}")
+    track_ids = None
+    if item.get("snapshot_id") != None:
+        track_ids = cache.metadata_cache.get("playlist_snapshot", item["id"] + ":" + item["snapshot_id"])
+    if track_ids == None:
+        plan.add("GET", "playlists/{id}/items", max(1, math.ceil((item.get("total") or 0) / MAX_ITEMS)))
+    return track_ids
+
+
+def plan_playlist_update(plan, directory, cached, name, new_ids, ordered=True, new_count=None):
+    # Plans the writes of Playlist.update_tracks. If the new tracks are unknown, new_count estimates
+    # their number, by default the current number of tracks.
+    items = directory.get_by_name(name)
+    if len(items) == 0:
+        if cached:
+            # A cached directory is downloaded again, before a missing playlist is created:
+            plan.add("GET", "me/playlists", get_directory_page_count(directory))
+        plan.add("GET", "me")
+        plan.add("POST", "users/{id}/playlists")
+        # A new playlist is filled like an empty one:
+        current_ids = []
+        total = 0
+    else:
+        # The snapshot ID of the target is always requested again before the update:
+        plan.add("GET", "playlists/{id}")
+        current_ids = plan_track_ids(plan, directory, cached, items[0])
+        total = items[0].get("total") or 0
+
+    if current_ids == None or new_ids == None:
+        count = len(new_ids) if new_ids != None else (new_count if new_count != None else total)
+        writeCount = max(1, math.ceil(count / MAX_PLAYLIST_ITEMS))
+        plan.add("PUT", "playlists/{id}/items", estimated=True)
+        plan.add("POST", "playlists/{id}/items", writeCount - 1, estimated=True)
+        if len(items) == 0:
+            plan.report(f"Playlist \"{name}\" would be created.")
+        else:
+            plan.report(f"Playlist \"{name}\" with {total} tracks would be updated with at most about {writeCount} writes.")
+        return
+
+    (changes, writeCount) = get_playlist_update(current_ids, new_ids, ordered)
+    if len(items) == 0:
+        plan.report(f"Playlist \"{name}\" would be created with {len(new_ids)} tracks.")
+    if writeCount == 0:
+        if len(items) > 0:
+            plan.report(f"Playlist \"{name}\" is already up to date.")
+    elif changes == None:
+        plan.add("PUT", "playlists/{id}/items")
+        plan.add("POST", "playlists/{id}/items", writeCount - 1)
+        if len(items) > 0:
+            plan.report(f"All {len(current_ids)} tracks of playlist \"{name}\" would be replaced by {len(new_ids)} tracks.")
+    else:
+        (removals, moves, additions) = changes
+        plan.add("DELETE", "playlists/{id}/items", math.ceil(len(removals) / MAX_PLAYLIST_ITEMS))
+        plan.add("PUT", "playlists/{id}/items", len(moves))
+        plan.add("POST", "playlists/{id}/items", len(additions))
+        plan.report(f"Playlist \"{name}\" would get {len(removals)} removals, {len(moves)} moves and"
+                + f" {sum(len(ids) for (position, ids) in additions)} additions.")
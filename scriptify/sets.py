@@ -0,0 +1,71 @@
+# Set operations on the tracks of playlists.
+
+from scriptify.model import Track
+
+
+BASE62_ALPHABET = "0123456789abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ"
+BASE62_DIGITS = {char: digit for (digit, char) in enumerate(BASE62_ALPHABET)}
+TRACK_ID_LENGTH = 22
+
+
+##
+# Set operations on sets of tracks. Tracks are represented by their IDs decoded to integers, which
+# need much less memory than Track objects, and the sets are combined in place.
+##
+
+
+def decode_track_id(track_id):
+    res = 0
+    for char in track_id:
+        res = res * 62 + BASE62_DIGITS[char]
+    return res
+
+
+def encode_track_id(number):
+    chars = []
+    while number > 0:
+        (number, digit) = divmod(number, 62)
+        chars.append(BASE62_ALPHABET[digit])
+    return "".join(reversed(chars)).rjust(TRACK_ID_LENGTH, BASE62_ALPHABET[0])
+
+
+def track_id_set(track_ids):
+    # Local tracks have no ID and can't be part of set operations:
+    return set(decode_track_id(track_id) for track_id in track_ids if track_id != None)
+
+
+def tracks_from_id_set(id_set):
+    return [Track(encode_track_id(number)) for number in sorted(id_set)]
+
+
+def union(spotifyAccess, input_sets):
+    input_sets = sorted(input_sets, key=len, reverse=True)
+    if len(input_sets) == 0:
+        return set()
+
+    # Start with a copy of the largest set, so it doesn't need to grow much:
+    union_set = set(input_sets[0])
+    for l in input_sets[1:]:
+        union_set |= l
+
+    return union_set
+
+def intersection(spotifyAccess, input_sets):
+    # Start with the smallest set, so the result never grows and can't shrink faster:
+    input_sets = sorted(input_sets, key=len)
+    result_set = set(input_sets[0])
+    for l in input_sets[1:]:
+        if len(result_set) == 0:
+            break
+        result_set &= l
+
+    return result_set
+
+def set_exclusion(spotifyAccess, input_sets):
+    result_set = set(input_sets[0])
+    for s in input_sets[1:]:
+        if len(result_set) == 0:
+            break
+        result_set -= s
+
+    return result_set
@@ -0,0 +1,313 @@
+# Local snapshot of the libary of the current user in SQLite. Commands can run against it offline,
+# and its indexed tables can be queried directly for analysis, e.g. with the sqlite3 shell.
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import spotipy
+
+from concurrent.futures import ThreadPoolExecutor
+
+from scriptify.api import get_complete_list, iter_complete_list
+from scriptify.library import SavedTracksSync, get_followed_artists, map_artists
+from scriptify.model import MAX_ITEMS, Playlist, compact_album_item, compact_artist_item, compact_playlist_item
+
+
+SNAPSHOT_SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS info (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL)""",
+    # Saved tracks are ordered by descending seq, like Spotify orders them by descending added_at:
+    """CREATE TABLE IF NOT EXISTS saved_tracks (
+            seq INTEGER PRIMARY KEY,
+            id TEXT NOT NULL UNIQUE,
+            added_at TEXT NOT NULL,
+            name TEXT NOT NULL,
+            artists TEXT NOT NULL)""",
+    "CREATE INDEX IF NOT EXISTS saved_tracks_added_at ON saved_tracks (added_at)",
+    """CREATE TABLE IF NOT EXISTS playlists (
+            position INTEGER PRIMARY KEY,
+            id TEXT NOT NULL UNIQUE,
+            name TEXT NOT NULL,
+            snapshot_id TEXT NOT NULL)""",
+    "CREATE INDEX IF NOT EXISTS playlists_name ON playlists (name)",
+    """CREATE TABLE IF NOT EXISTS playlist_items (
+            playlist_id TEXT NOT NULL,
+            position INTEGER NOT NULL,
+            track_id TEXT,
+            PRIMARY KEY (playlist_id, position))""",
+    "CREATE INDEX IF NOT EXISTS playlist_items_track_id ON playlist_items (track_id)",
+    """CREATE TABLE IF NOT EXISTS artists (
+            position INTEGER PRIMARY KEY,
+            id TEXT NOT NULL UNIQUE,
+            name TEXT NOT NULL,
+            popularity INTEGER)""",
+    """CREATE TABLE IF NOT EXISTS artist_albums (
+            artist_id TEXT NOT NULL,
+            position INTEGER NOT NULL,
+            album_id TEXT NOT NULL,
+            album_group TEXT,
+            PRIMARY KEY (artist_id, position))""",
+    "CREATE INDEX IF NOT EXISTS artist_albums_album_id ON artist_albums (album_id)",
+    """CREATE TABLE IF NOT EXISTS albums (
+            id TEXT PRIMARY KEY,
+            name TEXT NOT NULL,
+            album_type TEXT,
+            release_date TEXT NOT NULL,
+            release_date_precision TEXT NOT NULL,
+            artists TEXT NOT NULL)""",
+    "CREATE INDEX IF NOT EXISTS albums_release_date ON albums (release_date)",
+]
+
+
+##
+# Snapshot of the libary:
+##
+
+
+class LibrarySnapshot:
+    # Saved tracks, playlists with their items and followed artists with their albums. Updates are
+    # incremental: saved tracks are synced by SavedTracksSync, playlists are only downloaded if
+    # their snapshot ID changed and discographies only if the number of albums of an artist changed.
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        for statement in SNAPSHOT_SCHEMA:
+            self.connection.execute(statement)
+
+    def get_info(self, key):
+        with self.lock:
+            row = self.connection.execute("SELECT value FROM info WHERE key = ?", (key,)).fetchone()
+        return None if row == None else json.loads(row[0])
+
+    def set_info(self, key, value):
+        with self.lock:
+            self.connection.execute("INSERT OR REPLACE INTO info VALUES (?, ?)", (key, json.dumps(value)))
+
+    def query(self, sql, parameters=()):
+        with self.lock:
+            return self.connection.execute(sql, parameters).fetchall()
+
+    def update(self, spotifyAccessPrivate, spotifyAccessPublic, jobs=1):
+        logging.debug("Requesting current user...")
+        self.set_info("user_id", spotifyAccessPrivate.current_user()["id"])
+        logging.debug("Received current user.")
+        self.update_saved_tracks(spotifyAccessPrivate, jobs=jobs)
+        self.update_playlists(spotifyAccessPrivate, jobs=jobs)
+        self.update_artists(spotifyAccessPrivate, spotifyAccessPublic, jobs=jobs)
+        self.set_info("taken", time.time())
+        with self.lock:
+            self.connection.commit()
+
+    def update_saved_tracks(self, spotifyAccess, jobs=1):
+        sync = SavedTracksSync(spotifyAccess, jobs=jobs)
+        known = dict(self.query("SELECT id, added_at FROM saved_tracks"))
+        newItems = sync.get_new(known) if len(known) > 0 else None
+        with self.lock:
+            if newItems != None:
+                # Tracks saved again moved to the front:
+                self.connection.executemany("DELETE FROM saved_tracks WHERE id = ?",
+                        [(item["track"]["id"],) for item in newItems if item["track"]["id"] in known])
+                maxSeq = self.connection.execute("SELECT COALESCE(MAX(seq), 0) FROM saved_tracks").fetchone()[0]
+                self.insert_saved_tracks(newItems, maxSeq)
+                return
+        items = sync.get_all()
+        with self.lock:
+            self.connection.execute("DELETE FROM saved_tracks")
+            self.insert_saved_tracks(items, 0)
+
+    def insert_saved_tracks(self, items, maxSeq):
+        # Items are ordered newest first, the newest one gets the highest seq:
+        rows = []
+        for (i, item) in enumerate(item for item in items if item["track"]["id"] != None):
+            track = item["track"]
+            rows.append((maxSeq + len(items) - i, track["id"], item["added_at"], track["name"],
+                    json.dumps([compact_artist_item(art) for art in track["artists"]])))
+        self.connection.executemany("INSERT OR REPLACE INTO saved_tracks VALUES (?, ?, ?, ?, ?)", rows)
+
+    def update_playlists(self, spotifyAccess, jobs=1):
+        logging.debug("Downloading list of user playlists...")
+        items = [compact_playlist_item(item) for item in get_complete_list(
+                lambda offset: spotifyAccess.current_user_playlists(offset=offset, limit=MAX_ITEMS),
+                jobs=jobs)]
+        known = dict(self.query("SELECT id, snapshot_id FROM playlists"))
+
+        # Items are only downloaded for playlists, that changed since the last snapshot:
+        changed = [item for item in items if known.get(item["id"]) != item["snapshot_id"]]
+        logging.info(f"Downloading {len(changed)} of {len(items)} playlists, that changed since the last snapshot...")
+        def get_track_ids(item):
+            return Playlist(item["id"], name=item["name"], snapshot_id=item["snapshot_id"]).get_track_ids(spotifyAccess)
+        with ThreadPoolExecutor(max_workers=max(1, jobs)) as executor:
+            changedTrackIds = list(executor.map(get_track_ids, changed))
+
+        removedIds = set(known).difference(item["id"] for item in items)
+        with self.lock:
+            for id in removedIds.union(item["id"] for item in changed):
+                self.connection.execute("DELETE FROM playlist_items WHERE playlist_id = ?", (id,))
+            for (item, trackIds) in zip(changed, changedTrackIds):
+                self.connection.executemany("INSERT INTO playlist_items VALUES (?, ?, ?)",
+                        [(item["id"], position, trackId) for (position, trackId) in enumerate(trackIds)])
+            self.connection.execute("DELETE FROM playlists")
+            self.connection.executemany("INSERT INTO playlists VALUES (?, ?, ?, ?)",
+                    [(position, item["id"], item["name"], item["snapshot_id"]) for (position, item) in enumerate(items)])
+
+    def update_artists(self, spotifyAccessPrivate, spotifyAccessPublic, jobs=1):
+        artists = get_followed_artists(spotifyAccessPrivate)
+        albumCounts = dict(self.query("SELECT artist_id, COUNT(*) FROM artist_albums GROUP BY artist_id"))
+
+        def get_album_items(artist):
+            # Like in watch mode, a discography is only downloaded again if its number of albums changed:
+            logging.debug("Requesting page of albums of artist \"" + artist.name + "\"...")
+            firstPage = spotifyAccessPublic.artist_albums(artist_id=artist.id, limit=MAX_ITEMS, offset=0)
+            logging.debug("Received page of albums.")
+            if firstPage["total"] == albumCounts.get(artist.id):
+                return None
+            return [compact_album_item(item) for item in firstPage["items"]] + [compact_album_item(item)
+                    for item in iter_complete_list(
+                        lambda offset: spotifyAccessPublic.artist_albums(artist_id=artist.id, limit=MAX_ITEMS, offset=offset),
+                        first_page=firstPage)]
+
+        logging.info(f"Downloading albums of {len(artists)} followed artists...")
+        changedCount = 0
+        for (artist, albumItems) in map_artists(get_album_items, artists, jobs=jobs):
+            if albumItems == None:
+                continue
+            changedCount += 1
+            with self.lock:
+                self.connection.execute("DELETE FROM artist_albums WHERE artist_id = ?", (artist.id,))
+                self.connection.executemany("INSERT INTO artist_albums VALUES (?, ?, ?, ?)",
+                        [(artist.id, position, item["id"], item["album_group"]) for (position, item) in enumerate(albumItems)])
+                self.connection.executemany("INSERT OR REPLACE INTO albums VALUES (?, ?, ?, ?, ?, ?)",
+                        [(item["id"], item["name"], item["album_type"], item["release_date"],
+                            item["release_date_precision"], json.dumps(item.get("artists", [])))
+                            for item in albumItems])
+        logging.info(f"Downloaded the albums of {changedCount} artists, whose number of albums changed.")
+
+        with self.lock:
+            self.connection.execute("DELETE FROM artists")
+            self.connection.executemany("INSERT INTO artists VALUES (?, ?, ?, ?)",
+                    [(position, artist.id, artist.name, artist.popularity) for (position, artist) in enumerate(artists)])
+            # Albums of unfollowed artists are dropped:
+            self.connection.execute("DELETE FROM artist_albums WHERE artist_id NOT IN (SELECT id FROM artists)")
+            self.connection.execute("DELETE FROM albums WHERE id NOT IN (SELECT album_id FROM artist_albums)")
+
+    def connect(self, jobs=1):
+        return OfflineSpotify(self, jobs=jobs)
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+
+class OfflineSpotify:
+    # Answers the requests of the commands from a LibrarySnapshot instead of the Spotify API. Pages
+    # of saved tracks, playlists and playlist items hold all remaining items, so every list is read
+    # with one query. Nothing is written: changes of playlists are only logged, so set operations are
+    # dry runs.
+    def __init__(self, snapshot, jobs=1):
+        self.snapshot = snapshot
+        self.jobs = jobs
+
+    def current_user(self):
+        return {"id": self.snapshot.get_info("user_id")}
+
+    def current_user_saved_tracks(self, limit=20, offset=0, market=None):
+        rows = self.snapshot.query("SELECT id, added_at, name, artists FROM saved_tracks ORDER BY seq DESC LIMIT -1 OFFSET ?", (offset,))
+        # Decoding the artists of all tracks at once is much faster than one by one:
+        artists = json.loads("[" + ",".join(row[3] for row in rows) + "]")
+        items = [{"added_at": addedAt, "track": {"id": id, "name": name, "artists": trackArtists}}
+                for ((id, addedAt, name, _), trackArtists) in zip(rows, artists)]
+        return get_page(items, offset, offset + len(items))
+
+    def current_user_playlists(self, limit=50, offset=0):
+        rows = self.snapshot.query("""SELECT id, name, snapshot_id, (SELECT COUNT(*) FROM playlist_items WHERE playlist_id = playlists.id)
+                FROM playlists ORDER BY position LIMIT -1 OFFSET ?""", (offset,))
+        items = [{"id": id, "name": name, "snapshot_id": snapshotId, "tracks": {"total": total}}
+                for (id, name, snapshotId, total) in rows]
+        return get_page(items, offset, offset + len(items))
+
+    def playlist(self, playlist_id, fields=None, market=None, additional_types=("track",)):
+        rows = self.snapshot.query("SELECT id, name, snapshot_id FROM playlists WHERE id = ?", (playlist_id,))
+        if len(rows) == 0:
+            raise spotipy.exceptions.SpotifyException(404, -1, "Playlist " + playlist_id + " is not part of the library snapshot.")
+        (id, name, snapshotId) = rows[0]
+        return {"id": id, "name": name, "snapshot_id": snapshotId}
+
+    def playlist_items(self, playlist_id, fields=None, limit=100, offset=0, market=None, additional_types=("track", "episode")):
+        self.playlist(playlist_id)
+        rows = self.snapshot.query("SELECT track_id FROM playlist_items WHERE playlist_id = ? ORDER BY position LIMIT -1 OFFSET ?",
+                (playlist_id, offset))
+        items = [{"track": {"id": trackId}} for (trackId,) in rows]
+        return get_page(items, offset, offset + len(items))
+
+    def current_user_followed_artists(self, limit=20, after=None):
+        position = -1
+        if after != None:
+            position = self.snapshot.query("SELECT position FROM artists WHERE id = ?", (after,))[0][0]
+        rows = self.snapshot.query("SELECT id, name, popularity FROM artists WHERE position > ? ORDER BY position LIMIT ?",
+                (position, limit))
+        total = self.snapshot.query("SELECT COUNT(*) FROM artists")[0][0]
+        items = [{"id": id, "name": name, "popularity": popularity} for (id, name, popularity) in rows]
+        cursor = items[-1]["id"] if len(items) == limit else None
+        return {"artists": {"items": items, "cursors": {"after": cursor}, "limit": limit, "total": total}}
+
+    def artist_albums(self, artist_id, album_type=None, include_groups=None, country=None, limit=20, offset=0):
+        groupFilter = ""
+        parameters = [artist_id]
+        if include_groups != None:
+            groups = include_groups.split(",")
+            groupFilter = " AND artist_albums.album_group IN (" + ",".join("?" * len(groups)) + ")"
+            parameters.extend(groups)
+        rows = self.snapshot.query("""SELECT albums.id, name, album_type, album_group, release_date, release_date_precision, artists
+                FROM artist_albums JOIN albums ON albums.id = album_id
+                WHERE artist_id = ?""" + groupFilter + " ORDER BY position", parameters)
+        items = [{"id": id, "name": name, "album_type": albumType, "album_group": albumGroup, "release_date": releaseDate,
+                    "release_date_precision": precision, "artists": json.loads(artists)}
+                for (id, name, albumType, albumGroup, releaseDate, precision, artists) in rows[offset:(offset + limit)]]
+        page = get_page(items, offset, len(rows))
+        page["limit"] = limit
+        return page
+
+    def albums(self, albums, market=None):
+        raise spotipy.exceptions.SpotifyException(404, -1, "Tracks of albums are not part of the library snapshot.")
+
+    def album_tracks(self, album_id, limit=50, offset=0, market=None):
+        raise spotipy.exceptions.SpotifyException(404, -1, "Tracks of albums are not part of the library snapshot.")
+
+    ## Changes of playlists are only logged:
+
+    def user_playlist_create(self, user, name, public=True, collaborative=False, description=""):
+        logging.info(f"Offline: not creating playlist \"{name}\".")
+        return {"id": "offline:" + name, "name": name, "snapshot_id": "offline", "tracks": {"total": 0}}
+
+    def playlist_add_items(self, playlist_id, items, position=None):
+        logging.info(f"Offline: not adding {len(items)} tracks to playlist {playlist_id}.")
+        return {"snapshot_id": "offline"}
+
+    def playlist_replace_items(self, playlist_id, items):
+        logging.info(f"Offline: not replacing the tracks of playlist {playlist_id} with {len(items)} tracks.")
+        return {"snapshot_id": "offline"}
+
+    def playlist_remove_all_occurrences_of_items(self, playlist_id, items, snapshot_id=None):
+        logging.info(f"Offline: not removing {len(items)} tracks from playlist {playlist_id}.")
+        return {"snapshot_id": "offline"}
+
+    def playlist_reorder_items(self, playlist_id, range_start, insert_before, range_length=1, snapshot_id=None):
+        logging.info(f"Offline: not moving tracks of playlist {playlist_id}.")
+        return {"snapshot_id": "offline"}
+
+
+def get_page(items, offset, total):
+    return {"items": items, "limit": max(len(items), 1), "offset": offset, "total": total,
+            "next": "offline" if offset + len(items) < total else None}
+
+
+def get_snapshot_path():
+    dataHome = os.environ.get("XDG_DATA_HOME", os.path.join(os.path.expanduser("~"), ".local", "share"))
+    return os.path.join(dataHome, "scriptify", "library.sqlite3")
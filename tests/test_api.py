@@ -0,0 +1,236 @@
+import asyncio
+import threading
+import time
+
+import pytest
+import requests
+import spotipy
+
+from scriptify import api
+from scriptify.aio import AsyncSpotifyClient
+from scriptify.api import RateLimiter, SpotifyClient
+
+
+class Clock:
+    # Replaces the time module of api, sleeping only advances the clock.
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = []
+
+    def monotonic(self):
+        return self.now
+
+    def perf_counter(self):
+        return self.now
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(api, "time", clock)
+    return clock
+
+
+class ScriptedClient(SpotifyClient):
+    # Answers every request with the next of the given responses, exceptions are raised.
+    def __init__(self, responses, limiter):
+        super().__init__(auth="test", limiter=limiter)
+        self.responses = list(responses)
+        self.calls = 0
+
+    def send_request(self, method, url, payload, params, latencies):
+        self.calls += 1
+        response = self.responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+
+def error(status, retry_after=None):
+    headers = {"Retry-After": str(retry_after)} if retry_after != None else {}
+    return spotipy.exceptions.SpotifyException(status, -1, "error", headers=headers)
+
+
+def test_retry_after_throttling(clock):
+    limiter = RateLimiter(1000, burst=1000)
+    spotify = ScriptedClient([error(429, retry_after=3), {"id": "me"}], limiter)
+    assert spotify.me() == {"id": "me"}
+    assert spotify.calls == 2
+    # Retry-After is honored with up to one second of jitter and stops all users of the limiter:
+    assert len(clock.sleeps) == 1 and 3 <= clock.sleeps[0] <= 4
+    assert limiter.blocked_until == pytest.approx(1000 + clock.sleeps[0])
+
+
+@pytest.mark.parametrize("status", [429, 500, 502, 503, 504])
+def test_retry_with_exponential_backoff(clock, status):
+    spotify = ScriptedClient([error(status), error(status), error(status), {"id": "me"}], RateLimiter(1000, burst=1000))
+    assert spotify.me() == {"id": "me"}
+    assert spotify.calls == 4
+    for (attempt, delay) in enumerate(clock.sleeps):
+        assert 0 <= delay <= min(api.MAX_BACKOFF, api.BACKOFF_BASE * 2 ** attempt)
+
+
+def test_retry_after_connection_errors(clock):
+    spotify = ScriptedClient([requests.exceptions.ConnectionError(), requests.exceptions.Timeout(), {"id": "me"}],
+            RateLimiter(1000, burst=1000))
+    assert spotify.me() == {"id": "me"}
+    assert spotify.calls == 3
+
+
+def test_give_up_after_max_retries(clock):
+    spotify = ScriptedClient([error(503)] * (api.MAX_RETRIES + 2), RateLimiter(1000, burst=1000))
+    with pytest.raises(spotipy.exceptions.SpotifyException):
+        spotify.me()
+    assert spotify.calls == api.MAX_RETRIES + 1
+    assert len(clock.sleeps) == api.MAX_RETRIES
+
+
+@pytest.mark.parametrize("status", [400, 401, 403, 404])
+def test_client_errors_are_not_retried(clock, status):
+    spotify = ScriptedClient([error(status), {"id": "me"}], RateLimiter(1000, burst=1000))
+    with pytest.raises(spotipy.exceptions.SpotifyException):
+        spotify.me()
+    assert spotify.calls == 1 and clock.sleeps == []
+
+
+class ScriptedAsyncClient(AsyncSpotifyClient):
+    # Like ScriptedClient for the async client, no connections are opened.
+    def __init__(self, responses, limiter):
+        super().__init__(auth_manager=None, limiter=limiter)
+        self.responses = list(responses)
+        self.calls = 0
+
+    async def send_request(self, method, url, params, payload, latencies):
+        self.calls += 1
+        response = self.responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+    def run(self, request):
+        async def run_request():
+            self.slots = asyncio.Semaphore(self.concurrency)
+            return await request
+
+        return asyncio.run(run_request())
+
+
+def test_async_client_retries_like_the_synchronous_one(clock, monkeypatch):
+    profiler = api.RequestProfiler()
+    monkeypatch.setattr(api, "request_profiler", profiler)
+    monkeypatch.setattr(api, "get_backoff_delay", lambda attempt: 0)
+
+    async def sleep(seconds):
+        clock.sleep(seconds)
+
+    monkeypatch.setattr(asyncio, "sleep", sleep)
+    limiter = RateLimiter(1000, burst=1000)
+    spotify = ScriptedAsyncClient([error(503), asyncio.TimeoutError(), error(429, retry_after=0), {"items": []}],
+            limiter)
+    assert spotify.run(spotify.albums(["a"])) == {"items": []}
+    assert spotify.calls == 4
+    # Two backoffs and Retry-After with up to one second of jitter, that also blocks the limiter:
+    assert clock.sleeps[:2] == [0, 0] and len(clock.sleeps) == 3 and 0 <= clock.sleeps[2] <= 1
+    assert limiter.blocked_until == pytest.approx(1000 + clock.sleeps[2])
+    [((operation, method, endpoint), stats)] = profiler.get_items()
+    assert (method, endpoint) == ("GET", "albums")
+    assert stats["calls"] == 1 and stats["retries"] == 3 and stats["throttled"] == 1 and stats["errors"] == 0
+
+    spotify = ScriptedAsyncClient([error(404)], limiter)
+    with pytest.raises(spotipy.exceptions.SpotifyException):
+        spotify.run(spotify.albums(["a"]))
+    assert profiler.get_items()[0][1]["errors"] == 1
+
+
+def test_requests_are_profiled(clock, monkeypatch):
+    profiler = api.RequestProfiler()
+    monkeypatch.setattr(api, "request_profiler", profiler)
+    spotify = ScriptedClient([error(429, retry_after=1), {"id": "me"}], RateLimiter(1000, burst=1000))
+    spotify.me()
+    [((operation, method, endpoint), stats)] = profiler.get_items()
+    assert (method, endpoint) == ("GET", "me")
+    assert stats["calls"] == 1 and stats["retries"] == 1 and stats["throttled"] == 1 and stats["errors"] == 0
+
+
+def test_rate_limiter(clock):
+    limiter = RateLimiter(10, burst=2)
+    # The burst is available at once, then one token per 1 / rate seconds:
+    assert [limiter.reserve() for _ in range(4)] == [0, 0, pytest.approx(0.1), pytest.approx(0.2)]
+    clock.now += 0.2
+    assert limiter.reserve() == pytest.approx(0.1)
+    # Tokens don't pile up beyond the burst:
+    clock.now += 10
+    assert [limiter.reserve() for _ in range(3)] == [0, 0, pytest.approx(0.1)]
+
+
+def test_rate_limiter_acquire_keeps_the_rate(clock):
+    limiter = RateLimiter(10, burst=1)
+    for _ in range(21):
+        limiter.acquire()
+    assert clock.now == pytest.approx(1002)
+
+
+def test_blocked_rate_limiter(clock):
+    limiter = RateLimiter(10, burst=5)
+    limiter.block(3)
+    assert limiter.reserve() == pytest.approx(3)
+    assert limiter.try_reserve() == pytest.approx(3)
+    clock.now += 3
+    assert limiter.try_reserve() == 0
+    assert limiter.reserve() == 0
+
+
+class Pages:
+    # Serves a list of items page by page. Later pages are answered faster, so they finish out of order.
+    def __init__(self, total, limit=50, fail_at=None):
+        self.items = list(range(total))
+        self.limit = limit
+        self.fail_at = fail_at
+        self.offsets = []
+        self.finished = []
+        self.lock = threading.Lock()
+
+    def get_page(self, offset):
+        with self.lock:
+            self.offsets.append(offset)
+        time.sleep(max(0, 0.05 - offset / self.limit * 0.008))
+        with self.lock:
+            self.finished.append(offset)
+        if offset == self.fail_at:
+            raise spotipy.exceptions.SpotifyException(500, -1, "error")
+        return {"items": self.items[offset:(offset + self.limit)], "total": len(self.items), "limit": self.limit}
+
+
+@pytest.mark.parametrize("jobs", [1, 4])
+@pytest.mark.parametrize("total", [0, 1, 50, 200, 333])
+def test_complete_list_keeps_the_order(jobs, total):
+    pages = Pages(total)
+    assert api.get_complete_list(pages.get_page, jobs=jobs) == list(range(total))
+    assert sorted(pages.offsets) == list(range(0, max(total, 1), 50))
+    if jobs > 1 and total > 200:
+        assert pages.finished != sorted(pages.finished)
+
+
+def test_complete_list_with_first_page():
+    pages = Pages(120)
+    firstPage = pages.get_page(0)
+    assert list(api.iter_complete_list(pages.get_page, jobs=4, first_page=firstPage)) == list(range(50, 120))
+    assert sorted(pages.offsets) == [0, 50, 100]
+
+
+@pytest.mark.parametrize("jobs", [1, 4])
+def test_complete_list_with_failing_page(jobs):
+    pages = Pages(500, fail_at=250)
+    items = []
+    with pytest.raises(spotipy.exceptions.SpotifyException):
+        for item in api.iter_complete_list(pages.get_page, jobs=jobs):
+            items.append(item)
+    # The items before the failing page are yielded in order:
+    assert items == list(range(250))
@@ -0,0 +1,78 @@
+import pytest
+
+from scriptify import cache
+from scriptify.cache import CACHE_TTLS, MetadataCache
+
+
+class Clock:
+    # Replaces the time module of the cache, so entries can expire without waiting.
+    def __init__(self):
+        self.now = 1000000.0
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(cache, "time", clock)
+    return clock
+
+
+def test_get_and_put(clock):
+    metadata = MetadataCache(":memory:")
+    assert metadata.get("album", "a") == None
+    metadata.put("album", "a", {"name": "Album", "tracks": [1, 2]})
+    metadata.put("album", "b", [])
+    assert metadata.get("album", "a") == {"name": "Album", "tracks": [1, 2]}
+    assert metadata.get_many("album", ["a", "b", "c"]) == {"a": {"name": "Album", "tracks": [1, 2]}, "b": []}
+    # Kinds are kept apart:
+    assert metadata.get("album_tracks", "a") == None
+
+
+def test_entries_expire_after_their_ttl(clock):
+    metadata = MetadataCache(":memory:")
+    metadata.put("playlist_directory", "me", ["a"])
+    metadata.put("album", "a", ["b"])
+    clock.now += CACHE_TTLS["playlist_directory"] - 1
+    assert metadata.get("playlist_directory", "me") == ["a"]
+    clock.now += 2
+    assert metadata.get("playlist_directory", "me") == None
+    assert metadata.get("album", "a") == ["b"]
+    # Expired entries are deleted on flush:
+    metadata.flush()
+    assert metadata.connection.execute("SELECT COUNT(*) FROM entries").fetchone()[0] == 1
+
+
+def test_least_recently_used_entries_are_evicted(clock):
+    entrySize = len(cache.zlib.compress(b"[\"" + b"x" * 100 + b"\"]"))
+    metadata = MetadataCache(":memory:", max_size=10 * entrySize)
+    for i in range(10):
+        clock.now += 1
+        metadata.put("album", str(i), ["x" * 100])
+    clock.now += 1
+    # Reading an entry makes it recently used:
+    assert metadata.get("album", "0") != None
+    metadata.flush()
+    assert metadata.connection.execute("SELECT COUNT(*) FROM entries").fetchone()[0] == 10
+
+    clock.now += 1
+    metadata.put("album", "10", ["x" * 100])
+    metadata.flush()
+    # The cache is shrunk to 90% of its size, dropping the oldest accessed entries:
+    assert sorted(metadata.get_many("album", [str(i) for i in range(11)]), key=int) == ["0", "3", "4", "5", "6", "7", "8", "9", "10"]
+
+
+def test_disabled_and_refreshing_cache(clock):
+    metadata = MetadataCache(None)
+    metadata.put("album", "a", [])
+    assert metadata.get("album", "a") == None
+    metadata.flush()
+
+    metadata = MetadataCache(":memory:", refresh=True)
+    metadata.put("album", "a", [])
+    assert metadata.get("album", "a") == None
+    metadata.refresh = False
+    assert metadata.get("album", "a") == []
+
@@ -0,0 +1,111 @@
+import argparse
+import datetime
+import json
+
+import pytest
+
+from scriptify.commands import ConfigError, get_category_rules, get_set_operations, load_batch_config, load_config
+
+
+def write_config(tmp_path, text):
+    path = tmp_path / "config.json"
+    path.write_text(text)
+    return str(path)
+
+
+def test_load_config(tmp_path):
+    assert load_config(write_config(tmp_path, "{\"set_operations\": []}")) == {"set_operations": []}
+
+
+@pytest.mark.parametrize("text", ["{\"set_operations\": [", "[]", ""])
+def test_malformed_config(tmp_path, text):
+    with pytest.raises(ConfigError):
+        load_config(write_config(tmp_path, text))
+
+
+def test_missing_config(tmp_path):
+    with pytest.raises(ConfigError, match="Could not read"):
+        load_config(str(tmp_path / "missing.json"))
+
+
+def test_set_operations():
+    config = {"set_operations": [{"expression": "\"A\" | (\"B\" | \"A\")", "result": "A or B"}]}
+    assert get_set_operations(config) == [(("union", [("playlist", "A"), ("playlist", "B")]), "A or B")]
+    assert get_set_operations({}) == []
+
+
+@pytest.mark.parametrize("jobs", [
+    {"expression": "A |", "result": "R"},
+    {"expression": "A"},
+    {"result": "R"},
+    "A | B",
+])
+def test_invalid_set_operations(jobs):
+    with pytest.raises(ConfigError):
+        get_set_operations({"set_operations": [jobs]})
+    with pytest.raises(ConfigError):
+        get_set_operations({"set_operations": jobs})
+
+
+def category_args(config=None, prefix=None, pattern=None, playlist=None):
+    return argparse.Namespace(config=config, prefix=prefix, pattern=pattern, playlist=playlist)
+
+
+def test_category_rules(tmp_path):
+    config = write_config(tmp_path, "{\"categories\": {\"prefixes\": [\"A - \"], \"playlists\": [\"Favourites\"]}}")
+    rules = get_category_rules(category_args(config, prefix=["B - "], pattern=["^Genre: "]))
+    assert rules.prefixes == ("A - ", "B - ")
+    assert [pattern.pattern for pattern in rules.patterns] == ["^Genre: "]
+    assert rules.playlists == {"Favourites"}
+    assert get_category_rules(category_args()).prefixes == ("A - ", "B - ", "C - ", "D - ", "E - ")
+
+
+@pytest.mark.parametrize("text", ["{\"categories\": [", "{\"categories\": {\"prefixes\": \"A - \"}}",
+        "{\"categories\": []}", "{\"categories\": {\"playlists\": [\"A\", 1]}}",
+        "{\"categories\": {\"patterns\": [null]}}", "{\"categories\": {\"prefixes\": [[\"A - \"]]}}"])
+def test_invalid_category_rules(tmp_path, text):
+    assert get_category_rules(category_args(write_config(tmp_path, text))) == None
+    assert get_category_rules(category_args(str(tmp_path / "missing.json"))) == None
+    assert get_category_rules(category_args(pattern=["("])) == None
+
+
+def test_invalid_category_rules_name_the_file_and_key(tmp_path, caplog):
+    config = write_config(tmp_path, "{\"categories\": {\"prefixes\": [\"A - \"], \"playlists\": [\"A\", 1]}}")
+    assert get_category_rules(category_args(config)) == None
+    assert "\"playlists\" of \"categories\" in config file " + config in caplog.text
+
+
+def test_batch_config(tmp_path):
+    config = {"redirect_uri": "http://127.0.0.1:8080", "accounts": [
+        {"name": "alice", "release_radar": {"days": 14, "incremental": True},
+            "set_operations": [{"expression": "A & B", "result": "Both"}]},
+        {"name": "me", "release_radar": True, "token_path": "/tmp/me.json"},
+        {"name": "carol"},
+    ]}
+    (loaded, accounts) = load_batch_config(write_config(tmp_path, json.dumps(config)))
+    assert loaded == config
+    assert [account.name for account in accounts] == ["alice", "me", "carol"]
+    assert accounts[0].release_radar == (datetime.timedelta(days=14), True)
+    assert accounts[0].set_operations == [(("intersection", [("playlist", "A"), ("playlist", "B")]), "Both")]
+    assert accounts[1].release_radar == (datetime.timedelta(days=8), False)
+    assert accounts[1].token_path == "/tmp/me.json"
+    assert accounts[2].release_radar == None and accounts[2].set_operations == []
+
+
+@pytest.mark.parametrize("config", [
+    {},
+    {"accounts": {"name": "alice"}},
+    {"accounts": [{"release_radar": True}]},
+    {"accounts": [{"name": ""}]},
+    {"accounts": [{"name": "../alice"}]},
+    {"accounts": [{"name": "alice"}, {"name": "alice"}]},
+    {"accounts": [{"name": "alice", "release_radar": {"days": "8"}}]},
+    {"accounts": [{"name": "alice", "release_radar": "weekly"}]},
+    {"accounts": [{"name": "alice", "set_operations": [{"expression": "A |", "result": "R"}]}]},
+    {"accounts": [{"name": "alice", "token_path": 1}]},
+    {"accounts": ["alice"]},
+    {"redirect_uri": 9090, "accounts": [{"name": "alice"}]},
+])
+def test_invalid_batch_config(tmp_path, config):
+    with pytest.raises(ConfigError):
+        load_batch_config(write_config(tmp_path, json.dumps(config)))
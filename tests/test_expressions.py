@@ -0,0 +1,54 @@
+import pytest
+
+from scriptify.expressions import (ExpressionError, evaluate_set_expression, format_expression,
+        get_expression_playlists, parse_expression, simplify_expression)
+
+
+def playlist(name):
+    return ("playlist", name)
+
+
+def test_intersection_binds_stronger():
+    assert parse_expression("A | B & C") == ("union", [playlist("A"), ("intersection", [playlist("B"), playlist("C")])])
+    assert parse_expression("A & B - C") == ("exclusion", [("intersection", [playlist("A"), playlist("B")]), playlist("C")])
+
+
+def test_union_and_exclusion_are_left_associative():
+    assert parse_expression("A - B | C") == ("union", [("exclusion", [playlist("A"), playlist("B")]), playlist("C")])
+    assert parse_expression("A | B - C") == ("exclusion", [("union", [playlist("A"), playlist("B")]), playlist("C")])
+    assert parse_expression("A - B - C") == ("exclusion", [("exclusion", [playlist("A"), playlist("B")]), playlist("C")])
+
+
+def test_parentheses():
+    assert parse_expression("A - (B | C)") == ("exclusion", [playlist("A"), ("union", [playlist("B"), playlist("C")])])
+    assert parse_expression("((A))") == playlist("A")
+    assert parse_expression("(A | B) & C") == ("intersection", [("union", [playlist("A"), playlist("B")]), playlist("C")])
+
+
+def test_quoted_names_and_alternative_operators():
+    assert parse_expression("\"A - B\" ∪ 'C & D' \\ E ∩ F") == ("exclusion", [
+            ("union", [playlist("A - B"), playlist("C & D")]),
+            ("intersection", [playlist("E"), playlist("F")])])
+    assert parse_expression("A+B") == ("union", [playlist("A"), playlist("B")])
+
+
+@pytest.mark.parametrize("text", ["", "A |", "| A", "A B", "(A | B", "A | B)", "()", "\"A", "A & & B"])
+def test_syntax_errors(text):
+    with pytest.raises(ExpressionError):
+        parse_expression(text)
+
+
+def test_simplify_expression():
+    assert simplify_expression(parse_expression("A | (B | A) | C")) == ("union", [playlist("A"), playlist("B"), playlist("C")])
+    assert simplify_expression(parse_expression("A - B - C")) == ("exclusion", [playlist("A"), playlist("B"), playlist("C")])
+    # Only the first operand of an exclusion can be merged:
+    assert simplify_expression(parse_expression("A - (B - C)")) == ("exclusion", [playlist("A"), ("exclusion", [playlist("B"), playlist("C")])])
+    assert simplify_expression(parse_expression("A & A")) == playlist("A")
+
+
+def test_evaluate_expression():
+    expression = simplify_expression(parse_expression("(A | B) - (C & D)"))
+    assert get_expression_playlists(expression) == ["A", "B", "C", "D"]
+    sets = {"A": {1, 2}, "B": {3, 4}, "C": {2, 3, 5}, "D": {3, 5}}
+    assert evaluate_set_expression(None, expression, sets) == {1, 2, 4}
+    assert format_expression(expression) == "((\"A\" | \"B\") - (\"C\" & \"D\"))"
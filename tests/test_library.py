@@ -0,0 +1,170 @@
+import pytest
+
+from scriptify import cache, model
+from scriptify.library import (CategoryRules, SavedTracksSync, TrackDeduplicator, compact_saved_track_item,
+        complete_artist_albums, get_saved_tracks, normalize_track_title)
+from scriptify.model import Track
+
+
+@pytest.mark.parametrize("title", [
+    "Song - Remastered",
+    "Song - Remastered 2011",
+    "Song - 2011 Remaster",
+    "Song - 2011 Remastered Version",
+    "Song - Mono",
+    "Song - Stereo Version",
+    "Song - Radio Edit",
+    "Song - feat. Someone",
+    "Song (feat. Someone)",
+    "Song [with Someone]",
+    "Song (2011 Remaster)",
+    "Song (Mono Version)",
+    "Song (Radio Edit)",
+    "  song  ",
+])
+def test_versions_of_a_song_have_the_same_title(title):
+    assert normalize_track_title(title) == "song"
+
+
+@pytest.mark.parametrize("title", [
+    "Song - With Love",
+    "Song - from the film 'Stereo Love'",
+    "Song - Radio Edit Remix",
+    "Song - Mono Lake",
+    "Song - The Remaster Sessions",
+    "Song - Live",
+    "Song (Stereo Love Cover)",
+    "Song (Mono Lake)",
+])
+def test_other_songs_keep_their_title(title):
+    assert normalize_track_title(title) != "song"
+
+
+def test_deduplicate_by_title():
+    found = TrackDeduplicator(by_title=True)
+    assert found.add(Track("1", "Song"))
+    assert not found.add(Track("1", "Other"))
+    assert not found.add(Track("2", "Song - 2011 Remaster"))
+    assert found.add(Track("3", "Song - With Love"))
+
+    found = TrackDeduplicator()
+    assert found.add(Track("1", "Song"))
+    assert found.add(Track("2", "Song"))
+    assert not found.add(Track("2", "Other"))
+
+
+def test_category_rules():
+    rules = CategoryRules.from_config({"prefixes": ["A - "], "patterns": ["^Genre: "]}, playlists=["Favourites"])
+    assert rules.matches("A - Rock")
+    assert rules.matches("Genre: Jazz")
+    assert rules.matches("Favourites")
+    assert not rules.matches("B - Pop")
+    # Without any rules the default prefixes are used:
+    assert CategoryRules.from_config({}).matches("B - Pop")
+    assert not CategoryRules.from_config({}, prefixes=["X - "]).matches("B - Pop")
+
+
+class SavedTracks:
+    # Answers requests of saved tracks like Spotify, newest first.
+    def __init__(self, count):
+        self.jobs = 1
+        self.requests = 0
+        self.clock = 0
+        self.items = []
+        for i in range(count):
+            self.save("t%d" % i)
+
+    def save(self, track_id):
+        self.clock += 1
+        self.remove(track_id)
+        track = {"id": track_id, "name": "Track " + track_id, "artists": [{"id": "a", "name": "Artist"}]}
+        self.items.insert(0, {"added_at": "2024-01-01T00:00:%05dZ" % self.clock, "track": track})
+
+    def remove(self, track_id):
+        self.items = [item for item in self.items if item["track"]["id"] != track_id]
+
+    def current_user_saved_tracks(self, limit=20, offset=0):
+        self.requests += 1
+        items = self.items[offset:(offset + limit)]
+        return {"items": items, "total": len(self.items), "limit": limit, "offset": offset,
+                "next": "next" if offset + limit < len(self.items) else None}
+
+    def sync(self, items):
+        self.requests = 0
+        return SavedTracksSync(self, jobs=self.jobs).update(items)
+
+    def get_compact(self):
+        return [compact_saved_track_item(item) for item in self.items]
+
+
+@pytest.mark.parametrize("jobs", [1, 4])
+def test_sync_saved_tracks(jobs):
+    spotify = SavedTracks(120)
+    spotify.jobs = jobs
+    # Cold:
+    items = spotify.sync([])
+    assert items == spotify.get_compact() and spotify.requests == 3
+    # Unchanged:
+    assert spotify.sync(items) == items and spotify.requests == 1
+    # Added:
+    spotify.save("n1")
+    spotify.save("n2")
+    items = spotify.sync(items)
+    assert items == spotify.get_compact() and spotify.requests == 1
+    # Saved again:
+    spotify.save("t5")
+    items = spotify.sync(items)
+    assert items[0]["track"]["id"] == "t5" and len(items) == 122
+    assert items == spotify.get_compact() and spotify.requests == 1
+    # More new tracks than fit on one page:
+    for i in range(60):
+        spotify.save("m%d" % i)
+    items = spotify.sync(items)
+    assert items == spotify.get_compact() and spotify.requests == 2
+    # Removed, the total shows it and all tracks are downloaded again, reusing the first page:
+    spotify.remove("t7")
+    items = spotify.sync(items)
+    assert items == spotify.get_compact() and spotify.requests == 4
+    # Removed and added, so the number of saved tracks stays the same:
+    spotify.remove("t8")
+    spotify.save("n3")
+    items = spotify.sync(items)
+    assert items == spotify.get_compact() and spotify.requests == 4
+
+
+def test_get_saved_tracks_keeps_them_in_the_cache(monkeypatch):
+    monkeypatch.setattr(cache, "metadata_cache", cache.MetadataCache(":memory:"))
+    spotify = SavedTracks(80)
+    assert get_saved_tracks(spotify) == spotify.get_compact() and spotify.requests == 2
+    spotify.save("n1")
+    spotify.requests = 0
+    assert get_saved_tracks(spotify) == spotify.get_compact() and spotify.requests == 1
+
+
+class AlbumBatches:
+    # Answers requests of complete albums like Spotify.
+    def __init__(self):
+        self.batches = []
+
+    def albums(self, albums):
+        self.batches.append(list(albums))
+        artists = [{"id": "a", "name": "Artist"}]
+        return {"albums": [{"id": album_id, "name": "Album", "album_type": "album", "release_date": "2024-01-01",
+                "release_date_precision": "day", "artists": artists,
+                "tracks": {"items": [{"id": album_id + "-t", "name": "Track", "artists": artists}]}}
+                for album_id in albums]}
+
+
+@pytest.mark.parametrize("jobs", [1, 4])
+def test_complete_artist_albums_flushes_the_last_batch(monkeypatch, jobs):
+    monkeypatch.setattr(cache, "metadata_cache", cache.MetadataCache(":memory:"))
+    monkeypatch.setattr(model, "registry", model.Registry())
+    artistAlbums = [(artist, [model.album_from_item({"id": "%s%d" % (artist, i), "name": "Album",
+            "release_date": "2024-01-01", "release_date_precision": "day"}, []) for i in range(count)])
+            for (artist, count) in [("a", 12), ("b", 12), ("c", 3)]]
+    spotify = AlbumBatches()
+    completed = list(complete_artist_albums(spotify, iter(artistAlbums), jobs=jobs))
+    assert [artist for (artist, albums) in completed] == ["a", "b", "c"]
+    assert all(len(albums) == count and all(alb.tracks != None for alb in albums)
+            for ((artist, albums), count) in zip(completed, [12, 12, 3]))
+    assert [len(batch) for batch in spotify.batches] == [20, 7]
@@ -0,0 +1,362 @@
+import asyncio
+import datetime
+import random
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from scriptify import cache, model
+from scriptify.model import (MAX_PLAYLIST_ITEMS, Playlist, PlaylistDirectory, Track, count_playlist_writes,
+        get_longest_increasing_subsequence, get_playlist_changes, get_playlist_result, get_playlist_update)
+
+
+def apply_changes(current_ids, changes, ordered=True):
+    # Applies the changes like Spotify does: removals first, then the reorders one after another,
+    # then the additions at their position or, without ordered, at the end.
+    (removals, moves, additions) = changes
+    ids = [track_id for track_id in current_ids if not track_id in removals]
+    for (range_start, insert_before) in moves:
+        track_id = ids.pop(range_start)
+        ids.insert(insert_before if insert_before < range_start else insert_before - 1, track_id)
+    for (position, batch) in additions:
+        assert len(batch) <= MAX_PLAYLIST_ITEMS
+        if ordered:
+            ids[position:position] = batch
+        else:
+            ids.extend(batch)
+    return ids
+
+
+def test_unchanged_playlist_needs_no_writes():
+    assert get_playlist_update(["a", "b", "c"], ["a", "b", "c"], True) == (([], [], []), 0)
+    assert get_playlist_update(["a", "b", "c"], ["c", "a", "b"], False) == (([], [], []), 0)
+
+
+def test_removals_and_additions():
+    changes = get_playlist_changes(["a", "b", "c", "d"], ["a", "x", "y", "c", "z"], True)
+    assert changes == (["b", "d"], [], [(1, ["x", "y"]), (4, ["z"])])
+    assert apply_changes(["a", "b", "c", "d"], changes) == ["a", "x", "y", "c", "z"]
+
+
+def test_unordered_additions_are_batched():
+    current = ["t%d" % i for i in range(10)]
+    new = current[:5] + ["n%d" % i for i in range(250)]
+    (removals, moves, additions) = get_playlist_changes(current, new, False)
+    assert removals == current[5:]
+    assert moves == []
+    assert [len(batch) for (position, batch) in additions] == [100, 100, 50]
+    assert sorted(apply_changes(current, (removals, moves, additions), ordered=False)) == sorted(new)
+
+
+def test_moving_one_track_takes_one_reorder():
+    current = ["a", "b", "c", "d", "e"]
+    new = ["a", "c", "d", "e", "b"]
+    changes = get_playlist_changes(current, new, True)
+    assert changes == ([], [(1, 5)], [])
+    assert apply_changes(current, changes) == new
+
+
+def test_reversed_playlist():
+    current = ["a", "b", "c", "d"]
+    changes = get_playlist_changes(current, current[::-1], True)
+    assert len(changes[1]) == 3
+    assert apply_changes(current, changes) == current[::-1]
+
+
+def test_reorders_are_minimal_and_correct():
+    rand = random.Random(0)
+    for _ in range(200):
+        current = ["t%d" % i for i in rand.sample(range(60), rand.randint(0, 40))]
+        new = [track_id for track_id in current if rand.random() < 0.8] + ["n%d" % i for i in range(rand.randint(0, 5))]
+        rand.shuffle(new)
+        changes = get_playlist_changes(current, new, True)
+        assert apply_changes(current, changes) == new
+        # Every kept track outside a longest increasing subsequence is moved exactly once:
+        kept_ids = [track_id for track_id in current if track_id in new]
+        positions = {track_id: position for (position, track_id) in enumerate(new)}
+        staying = get_longest_increasing_subsequence(kept_ids, positions)
+        assert len(changes[1]) == len(kept_ids) - len(staying)
+
+
+def test_longest_increasing_subsequence():
+    positions = {track_id: position for (position, track_id) in enumerate("abcdefg")}
+    assert get_longest_increasing_subsequence(list("aebcgdf"), positions) == set("abcdf")
+    assert get_longest_increasing_subsequence([], positions) == set()
+
+
+@pytest.mark.parametrize("current", [["a", None, "b"], ["a", "b", "a"]])
+def test_local_tracks_and_duplicates_are_replaced(current):
+    assert get_playlist_changes(current, ["a", "b"], True) == None
+    (changes, writeCount) = get_playlist_update(current, ["a", "b"], True)
+    assert changes == None and writeCount == 1
+
+
+def test_replace_if_cheaper():
+    current = ["t%d" % i for i in range(50)]
+    new = current[::-1]
+    (changes, writeCount) = get_playlist_update(current, new, True)
+    assert changes == None and writeCount == 1
+    assert count_playlist_writes(get_playlist_changes(current, new, True)) > writeCount
+    assert model.count_replace_writes([]) == 1
+
+
+def test_playlist_result():
+    rand = random.Random(1)
+    for ordered in [True, False]:
+        for _ in range(50):
+            current = ["t%d" % i for i in rand.sample(range(30), 20)]
+            new = rand.sample(current, 15) + ["n%d" % i for i in range(rand.randint(0, 5))]
+            changes = get_playlist_changes(current, new, ordered)
+            assert get_playlist_result(current, changes, ordered) == apply_changes(current, changes, ordered)
+
+
+class PlaylistWrites:
+    # Answers the write requests of update_tracks like Spotify.
+    def __init__(self, track_ids):
+        self.jobs = 1
+        self.track_ids = list(track_ids)
+
+    def playlist_remove_all_occurrences_of_items(self, playlist_id, items):
+        self.track_ids = [track_id for track_id in self.track_ids if not track_id in items]
+        return {"snapshot_id": "removed"}
+
+    def playlist_reorder_items(self, playlist_id, range_start, insert_before):
+        self.track_ids = apply_changes(self.track_ids, ([], [(range_start, insert_before)], []))
+        return {"snapshot_id": "reordered"}
+
+    def playlist_add_items(self, playlist_id, items, position=None):
+        if position == None:
+            self.track_ids.extend(items)
+        else:
+            self.track_ids[position:position] = items
+        return {"snapshot_id": "added"}
+
+
+@pytest.mark.parametrize("ordered", [True, False])
+def test_update_tracks_caches_the_order_of_the_playlist(monkeypatch, ordered):
+    monkeypatch.setattr(cache, "metadata_cache", cache.MetadataCache(":memory:"))
+    current = ["t%d" % i for i in range(400)]
+    new = ["n1"] + current[1:5] + current[6:] + [current[5], "n2"]
+    spotify = PlaylistWrites(current)
+    playlist = Playlist("pl", "Playlist", [Track(track_id) for track_id in current], "start")
+    assert playlist.update_tracks(spotify, [Track(track_id) for track_id in new], ordered=ordered)
+    if ordered:
+        assert spotify.track_ids == new
+    else:
+        assert spotify.track_ids == current[1:] + ["n1", "n2"]
+    assert cache.metadata_cache.get("playlist_snapshot", "pl:added") == spotify.track_ids
+    assert [tr.id for tr in playlist.tracks] == spotify.track_ids
+
+
+class UserPlaylists:
+    # Answers requests of the playlists of the current user like Spotify.
+    def __init__(self, count):
+        self.jobs = 1
+        self.requests = []
+        self.items = [{"id": "p%d" % i, "name": "Playlist %d" % i, "snapshot_id": "s%d" % i,
+                "tracks": {"total": 10}} for i in range(count)]
+
+    def current_user_playlists(self, limit=50, offset=0):
+        self.requests.append("me/playlists")
+        return {"items": self.items[offset:(offset + limit)], "total": len(self.items), "limit": limit,
+                "offset": offset}
+
+    def playlist(self, playlist_id, fields=None):
+        self.requests.append("playlists/" + playlist_id)
+        item = next(item for item in self.items if item["id"] == playlist_id)
+        return {"name": item["name"], "snapshot_id": item["snapshot_id"]}
+
+    def session(self):
+        # A new client, that only shares the metadata cache with the previous ones.
+        self.playlist_directory = None
+        self.requests = []
+        return self
+
+
+def test_renamed_playlist_of_a_cached_directory(monkeypatch):
+    monkeypatch.setattr(cache, "metadata_cache", cache.MetadataCache(":memory:"))
+    spotify = UserPlaylists(120)
+    PlaylistDirectory.of(spotify).get_items()
+    assert spotify.requests == ["me/playlists"] * 3
+    # Renamed beyond the first page, so the cached directory is still used:
+    spotify.items[80]["name"] = "Renamed"
+    assert Playlist.by_name(spotify.session(), "Playlist 80") == None
+    assert spotify.requests == ["me/playlists", "playlists/p80"] + ["me/playlists"] * 3
+    playlist = Playlist.by_name(spotify.session(), "Renamed")
+    assert (playlist.id, playlist.snapshot_id) == ("p80", "s80")
+    assert spotify.requests == ["me/playlists", "playlists/p80"]
+
+
+def test_cached_directory_survives_changed_snapshots(monkeypatch):
+    monkeypatch.setattr(cache, "metadata_cache", cache.MetadataCache(":memory:"))
+    spotify = UserPlaylists(120)
+    PlaylistDirectory.of(spotify).get_items()
+    # Our own writes and changes of the snapshots of the first page keep the cached directory:
+    spotify.items[0]["snapshot_id"] = "changed"
+    PlaylistDirectory.of(spotify).set_snapshot_id("p70", "written", total=12)
+    directory = PlaylistDirectory.of(spotify.session())
+    assert directory.get_by_id("p0")["snapshot_id"] == "changed"
+    assert directory.get_by_id("p70")["snapshot_id"] == "written" and directory.get_by_id("p70")["total"] == 12
+    assert directory.from_cache and spotify.requests == ["me/playlists"]
+    # Renamed on the first page:
+    spotify.items[2]["name"] = "Renamed"
+    directory = PlaylistDirectory.of(spotify.session())
+    assert directory.get_by_name("Renamed")[0]["id"] == "p2"
+    assert not directory.from_cache and spotify.requests == ["me/playlists"] * 3
+
+
+class ArtistAlbums:
+    # Answers requests of the albums of one artist like Spotify: by group, newest first.
+    def __init__(self, albums):
+        self.albums = []
+        for group in model.ALBUM_GROUPS:
+            groupAlbums = [(date, precision) for (albumGroup, date, precision) in albums if albumGroup == group]
+            for (i, (date, precision)) in enumerate(groupAlbums):
+                self.albums.append({"id": f"{group}-{i}-{date}", "name": "Album", "album_group": group,
+                        "album_type": group, "release_date": date, "release_date_precision": precision})
+        self.requests = []
+
+    def artist_albums(self, artist_id, include_groups=None, limit=20, offset=0):
+        groups = include_groups.split(",")
+        self.requests.append((include_groups, offset))
+        albums = [album for album in self.albums if album["album_group"] in groups]
+        return {"items": albums[offset:(offset + limit)], "total": len(albums),
+                "next": "next" if offset + limit < len(albums) else None}
+
+
+def get_days(count, start=datetime.datetime(2024, 6, 1)):
+    return [(start - datetime.timedelta(days=i)).strftime("%Y-%m-%d") for i in range(count)]
+
+
+def get_albums_since(albums, since, groups=model.RELEASE_RADAR_GROUPS):
+    spotify = ArtistAlbums(albums)
+    artist = model.Artist("artist", "Artist")
+    res = artist.get_albums_since(spotify, since, include_groups=groups, use_cache=False)
+    return ([album.id for album in res], spotify.requests)
+
+
+def test_albums_since_stop_at_the_cutoff():
+    since = datetime.datetime(2024, 5, 1)
+    # 100 singles, the first 31 of them are released after the cutoff:
+    albums = [("single", date, "day") for date in get_days(100)]
+    (ids, requests) = get_albums_since(albums, since)
+    assert len(ids) == 31
+    assert requests == [("album,single,appears_on", 0), ("appears_on", 0)]
+
+
+def test_albums_since_cutoff_on_a_page_boundary():
+    # The last album of the first page is released on the cutoff, so no further page is needed:
+    days = get_days(120)
+    since = datetime.datetime.strptime(days[model.MAX_ITEMS - 1], "%Y-%m-%d")
+    (ids, requests) = get_albums_since([("album", date, "day") for date in days], since)
+    assert len(ids) == model.MAX_ITEMS - 1
+    assert requests == [("album,single,appears_on", 0), ("single", 0), ("appears_on", 0)]
+
+    # The last album of the first page is released a day after the cutoff, so the next page is needed:
+    since -= datetime.timedelta(days=1)
+    (ids, requests) = get_albums_since([("album", date, "day") for date in days], since)
+    assert len(ids) == model.MAX_ITEMS
+    assert requests == [("album,single,appears_on", 0), ("album", model.MAX_ITEMS), ("single", 0), ("appears_on", 0)]
+
+
+def test_albums_since_with_year_and_month_precision():
+    since = datetime.datetime(2023, 12, 15)
+    albums = [("album", "2024-01", "month"), ("album", "2023-12", "month"), ("album", "2023", "year"),
+            ("single", "2024", "year"), ("single", "2023-12-16", "day"), ("appears_on", "2022", "year")]
+    (ids, requests) = get_albums_since(albums, since)
+    # Months and years count from their first day:
+    assert ids == ["album-0-2024-01", "single-0-2024", "single-1-2023-12-16"]
+    assert len(requests) == 1
+
+
+def test_albums_since_of_an_empty_artist():
+    (ids, requests) = get_albums_since([], datetime.datetime(2024, 1, 1))
+    assert ids == [] and requests == [("album,single,appears_on", 0)]
+
+
+def get_album_item(album_id, tracks=False):
+    item = {"id": album_id, "name": "Album " + album_id, "album_type": "album", "release_date": "2024-01-01",
+            "release_date_precision": "day", "artists": [{"id": "a", "name": "Artist"}]}
+    if tracks:
+        item["tracks"] = {"items": [{"id": album_id + "-t", "name": "Track", "artists": item["artists"]}]}
+    return item
+
+
+class AlbumBatches:
+    # Answers requests of complete albums like Spotify, missing albums are None.
+    def __init__(self, missing=()):
+        self.batches = []
+        self.missing = set(missing)
+
+    def albums(self, albums):
+        self.batches.append(list(albums))
+        return {"albums": [None if album_id in self.missing else get_album_item(album_id, tracks=True)
+                for album_id in albums]}
+
+
+class AsyncAlbumBatches(AlbumBatches):
+    async def albums(self, albums):
+        await asyncio.sleep(0)
+        return AlbumBatches.albums(self, albums)
+
+
+@pytest.fixture
+def albums(monkeypatch):
+    # Returns a function, that creates albums without tracks from their IDs.
+    monkeypatch.setattr(cache, "metadata_cache", cache.MetadataCache(":memory:"))
+    monkeypatch.setattr(model, "registry", model.Registry())
+    return lambda ids: [model.album_from_item(get_album_item(album_id)) for album_id in ids]
+
+
+@pytest.mark.parametrize("jobs", [1, 4])
+def test_album_queue(albums, jobs):
+    spotify = AlbumBatches(missing=["b3"])
+    first = albums(["a%d" % i for i in range(15)])
+    # Shares albums with the first artist:
+    second = albums(["a%d" % i for i in range(10, 15)] + ["b%d" % i for i in range(12)])
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        albumQueue = model.AlbumQueue(spotify, executor if jobs > 1 else None, max_pending=jobs)
+        albumQueue.add(first)
+        assert spotify.batches == []
+        albumQueue.add(first + second)
+        albumQueue.collect(wait=True)
+        assert spotify.batches == [["a%d" % i for i in range(15)] + ["b%d" % i for i in range(5)]]
+        assert albumQueue.is_complete(first) and not albumQueue.is_complete(second)
+        # The partial last batch is only requested on flush:
+        albumQueue.flush()
+    assert spotify.batches[1:] == [["b%d" % i for i in range(5, 12)]]
+    assert [alb.id for alb in albumQueue.complete(first)] == [alb.id for alb in first]
+    # Missing albums are dropped, all others got their tracks:
+    completed = albumQueue.complete(second)
+    assert [alb.id for alb in completed] == [alb.id for alb in second if alb.id != "b3"]
+    assert all(alb.tracks[0].id == alb.id + "-t" for alb in completed)
+    # Complete albums are taken from the cache:
+    model.registry = model.Registry()
+    albumQueue = model.AlbumQueue(AlbumBatches())
+    albumQueue.add(albums(["a1", "b1", "b3"]))
+    albumQueue.flush()
+    assert albumQueue.spotify.batches == [["b3"]]
+
+
+def test_async_album_queue(albums):
+    spotify = AsyncAlbumBatches()
+    artists = [albums(["a%d" % i for i in range(15)]), albums(["a%d" % i for i in range(10, 25)]),
+            albums(["a%d" % i for i in range(20, 27)])]
+
+    async def crawl(albumQueue, artistAlbums):
+        await asyncio.sleep(0)
+        albumQueue.finish_listing(artistAlbums)
+        return await albumQueue.complete_async(artistAlbums)
+
+    async def crawl_all():
+        albumQueue = model.AsyncAlbumQueue(spotify)
+        for _ in artists:
+            albumQueue.start_listing()
+        return await asyncio.gather(*[crawl(albumQueue, artistAlbums) for artistAlbums in artists])
+
+    completed = asyncio.run(crawl_all())
+    # Full batches while artists are listed, the partial last one once all of them are listed:
+    assert spotify.batches == [["a%d" % i for i in range(20)], ["a%d" % i for i in range(20, 27)]]
+    assert [[alb.id for alb in artistAlbums] for artistAlbums in completed] \
+            == [[alb.id for alb in artistAlbums] for artistAlbums in artists]
+    assert all(alb.tracks != None for artistAlbums in completed for alb in artistAlbums)
@@ -0,0 +1,86 @@
+import collections
+import datetime
+
+import pytest
+
+from fake_spotify import FakeSpotify, SyntheticLibrary
+from scriptify import api, cache, commands, model, plan
+from scriptify.plan import RequestPlan
+
+
+PERIOD = datetime.timedelta(days=3650)
+
+
+@pytest.fixture
+def library(monkeypatch):
+    monkeypatch.setattr(cache, "metadata_cache", cache.MetadataCache(":memory:"))
+    monkeypatch.setattr(model, "registry", model.Registry())
+    return SyntheticLibrary(artists=20, albums_per_artist=3, saved_tracks=400, playlists=70, playlist_size=120,
+            category_playlists=0, seed=2)
+
+
+def connect(library):
+    # Every run gets new clients, like a new process. Only the metadata cache is kept.
+    model.registry = model.Registry()
+    return FakeSpotify(library=library, limiter=api.RateLimiter(100000, burst=100000))
+
+
+def get_plan(library, planner):
+    playlists = [dict(playlist, track_ids=list(playlist["track_ids"])) for playlist in library.playlists]
+    requestPlan = RequestPlan()
+    planner(requestPlan, connect(library))
+    # Planning doesn't change the library:
+    assert library.playlists == playlists
+    return requestPlan
+
+
+def get_requests(library, command):
+    spotify = connect(library)
+    command(spotify)
+    return collections.Counter({tuple(key.split(" ", 1)): count for (key, count) in spotify.stats.requests.items()})
+
+
+def check_plan(library, planner, command, estimated):
+    requestPlan = get_plan(library, planner)
+    requests = get_requests(library, command)
+    assert (len(requestPlan.estimated) > 0) == estimated
+    # Counts, that aren't marked as estimates, are exact:
+    for endpoint in set(requestPlan.requests).union(requests):
+        if not endpoint in requestPlan.estimated:
+            assert requestPlan.requests[endpoint] == requests[endpoint], endpoint
+
+
+def get_expression(library):
+    names = [playlist["name"] for playlist in library.playlists]
+    return ("union", [("playlist", names[1]), ("playlist", names[60]), ("playlist", names[2])])
+
+
+@pytest.mark.parametrize("target", ["Result", "Playlist 3"])
+def test_plan_of_an_expression(library, target):
+    expression = get_expression(library)
+    planner = lambda requestPlan, spotify: plan.plan_expression(requestPlan, spotify, expression, target)
+    command = lambda spotify: commands.apply_expression(spotify, expression, target)
+    # The tracks of the inputs are unknown, so the writes are estimated:
+    check_plan(library, planner, command, estimated=True)
+    # Cached:
+    check_plan(library, planner, command, estimated=False)
+    assert get_plan(library, planner).requests == get_requests(library, command)
+    # A changed input playlist beyond the first page is downloaded again:
+    changed = next(playlist for playlist in library.playlists if playlist["name"] == expression[1][1][1])
+    changed["track_ids"].append(library.saved_tracks[0]["track"]["id"])
+    changed["snapshot_id"] = "changed"
+    check_plan(library, planner, command, estimated=True)
+    assert get_plan(library, planner).requests == get_requests(library, command)
+
+
+@pytest.mark.parametrize("incremental", [False, True])
+def test_plan_of_the_release_radar(library, incremental):
+    planner = lambda requestPlan, spotify: plan.plan_release_radar(requestPlan, spotify, spotify, PERIOD,
+            incremental=incremental)
+    command = lambda spotify: commands.refresh_release_radar(spotify, spotify, PERIOD, incremental=incremental)
+    check_plan(library, planner, command, estimated=True)
+    # Cached, the release radar is up to date:
+    check_plan(library, planner, command, estimated=False)
+    requestPlan = get_plan(library, planner)
+    assert requestPlan.requests == get_requests(library, command)
+    assert sum(count for ((method, endpoint), count) in requestPlan.requests.items() if method != "GET") == 0
@@ -0,0 +1,39 @@
+import random
+
+from scriptify.sets import (BASE62_ALPHABET, TRACK_ID_LENGTH, decode_track_id, encode_track_id, intersection,
+        set_exclusion, track_id_set, tracks_from_id_set, union)
+
+
+def test_track_id_round_trip():
+    rand = random.Random(0)
+    track_ids = ["".join(rand.choice(BASE62_ALPHABET) for _ in range(TRACK_ID_LENGTH)) for _ in range(1000)]
+    # Leading zeros and the extremes of the alphabet:
+    track_ids += ["0" * TRACK_ID_LENGTH, "0" * (TRACK_ID_LENGTH - 1) + "1", "Z" * TRACK_ID_LENGTH,
+            "00000abcXYZ09zA0000000", "6rqhFgbbKwnb9MLmUQDhG6"]
+    for track_id in track_ids:
+        assert encode_track_id(decode_track_id(track_id)) == track_id
+
+
+def test_decoding_keeps_the_order_of_the_alphabet():
+    assert decode_track_id("0" * TRACK_ID_LENGTH) == 0
+    assert decode_track_id("0" * (TRACK_ID_LENGTH - 1) + "z") == 35
+    assert decode_track_id("0" * (TRACK_ID_LENGTH - 1) + "A") == 36
+    assert decode_track_id("0" * (TRACK_ID_LENGTH - 1) + "Z") == 61
+    assert decode_track_id("0" * (TRACK_ID_LENGTH - 2) + "10") == 62
+
+
+def test_track_id_sets():
+    track_ids = ["6rqhFgbbKwnb9MLmUQDhG6", None, "0" * TRACK_ID_LENGTH, "6rqhFgbbKwnb9MLmUQDhG6"]
+    id_set = track_id_set(track_ids)
+    assert len(id_set) == 2
+    assert sorted(tr.id for tr in tracks_from_id_set(id_set)) == sorted(["6rqhFgbbKwnb9MLmUQDhG6", "0" * TRACK_ID_LENGTH])
+
+
+def test_set_operations():
+    sets = [{1, 2, 3}, {2, 3, 4}, {3, 5}]
+    assert union(None, sets) == {1, 2, 3, 4, 5}
+    assert union(None, []) == set()
+    assert intersection(None, sets) == {3}
+    assert set_exclusion(None, sets) == {1}
+    # The inputs are not changed in place:
+    assert sets == [{1, 2, 3}, {2, 3, 4}, {3, 5}]
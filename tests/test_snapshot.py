@@ -0,0 +1,75 @@
+import pytest
+import requests
+
+from fake_spotify import FakeSpotify, SyntheticLibrary
+from scriptify import api, cache, commands, model, sets
+from scriptify.library import get_followed_artists, get_saved_tracks
+from scriptify.model import Playlist, PlaylistDirectory
+from scriptify.snapshot import LibrarySnapshot
+
+
+@pytest.fixture
+def spotify(monkeypatch):
+    # A small library behind the fake API. The metadata cache is disabled, so every read is a request.
+    monkeypatch.setattr(cache, "metadata_cache", cache.MetadataCache(None))
+    monkeypatch.setattr(model, "registry", model.Registry())
+    library = SyntheticLibrary(artists=8, albums_per_artist=3, saved_tracks=120, playlists=6, playlist_size=40,
+            category_playlists=0, seed=1)
+    return FakeSpotify(library=library, limiter=api.RateLimiter(100000, burst=100000))
+
+
+def read_library(spotifyAccess):
+    # Reads everything a snapshot keeps with the functions of the commands.
+    model.registry = model.Registry()
+    playlists = PlaylistDirectory(spotifyAccess, persist=False).get_items()
+    return {
+        "saved_tracks": get_saved_tracks(spotifyAccess),
+        "playlists": [(item["id"], item["name"], item["total"],
+                Playlist(item["id"]).get_track_ids(spotifyAccess)) for item in playlists],
+        "artists": [(artist.id, artist.name, [(alb.id, alb.name, alb.release_date)
+                for alb in artist.get_albums(spotifyAccess)]) for artist in get_followed_artists(spotifyAccess)],
+    }
+
+
+def count_requests(spotify):
+    return sum(spotify.stats.requests.values())
+
+
+def test_offline_library_matches_the_online_one(spotify, monkeypatch):
+    online = read_library(spotify)
+    snapshot = LibrarySnapshot(":memory:")
+    snapshot.update(spotify, spotify)
+    requestCount = count_requests(spotify)
+
+    # Offline, nothing is sent to Spotify:
+    def send(*args, **kwargs):
+        raise AssertionError("request sent offline")
+
+    monkeypatch.setattr(requests.Session, "request", send)
+    monkeypatch.setattr(api, "offline_library", snapshot)
+    offline = api.connect_user("client", "secret", "scope")
+    assert read_library(offline) == online
+
+    names = [playlist["name"] for playlist in spotify.library.playlists]
+    commands.apply_set_operation(offline, names[:2], "Result", sets.union)
+    commands.apply_set_operation(offline, names[:2], names[2], sets.union)
+    assert count_requests(spotify) == requestCount
+    assert [playlist["name"] for playlist in spotify.library.playlists] == names
+
+
+def test_snapshot_update_is_incremental(spotify):
+    snapshot = LibrarySnapshot(":memory:")
+    snapshot.update(spotify, spotify)
+    # Unchanged, the items of playlists and the albums of artists are not downloaded again:
+    spotify.stats.requests.clear()
+    snapshot.update(spotify, spotify)
+    assert not "GET playlists/{id}/items" in spotify.stats.requests
+    assert spotify.stats.requests["GET artists/{id}/albums"] == len(spotify.library.artists)
+
+    library = spotify.library
+    library.playlists[1]["track_ids"].append(library.saved_tracks[0]["track"]["id"])
+    library.playlists[1]["snapshot_id"] = "changed"
+    spotify.stats.requests.clear()
+    snapshot.update(spotify, spotify)
+    assert spotify.stats.requests["GET playlists/{id}/items"] == 1
+    assert read_library(snapshot.connect())["playlists"][1][3] == library.playlists[1]["track_ids"]